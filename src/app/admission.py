@@ -0,0 +1,177 @@
+"""
+Admission control based on time requests spent in queue before reaching
+worker (between nginx and gunicorn). Requests that waited too long are shed
+before any work is done for them, since their clients are likely to have
+given up already.
+"""
+import logging
+import math
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.signals import setting_changed
+
+
+logger = logging.getLogger(__name__)
+
+REQUEST_START_HEADER = 'HTTP_X_REQUEST_START'
+# set in WSGI environ of request that was already admitted (e.g. by fast lane
+# before it passed request to Django), so it's not checked and counted twice
+ADMITTED_ENVIRON_KEY = 'app.admitted'
+
+
+def parse_request_start(value: Optional[str]) -> Optional[float]:
+    """
+    Parse timestamp of request start set by proxy (e.g. `t=1591000000.123`
+    with nginx `$msec`). Timestamps in milliseconds or microseconds are
+    recognized as well.
+    :return: unix timestamp in seconds or None if value is missing/invalid
+    """
+    if not value:
+        return None
+
+    try:
+        timestamp = float(value[2:] if value.startswith('t=') else value)
+    except ValueError:
+        return None
+
+    if timestamp > 1e14:
+        return timestamp / 1e6
+    if timestamp > 1e11:
+        return timestamp / 1e3
+    return timestamp
+
+
+class CoDel:
+    """
+    Detects standing queue the way CoDel does: if even the smallest queueing
+    delay seen during `interval` seconds exceeds `target`, the queue doesn't
+    drain by itself and state becomes overloaded (until an interval with
+    small enough delay).
+    """
+
+    def __init__(self, target: float, interval: float):
+        self.target = target
+        self.interval = interval
+        self.overloaded = False
+        self._min_delay = math.inf
+        self._interval_end = None
+
+    def observe(self, delay: float, now: float) -> bool:
+        """
+        Account queueing delay of request.
+        :return: whether queue is overloaded
+        """
+        if self._interval_end is None:
+            self._interval_end = now + self.interval
+        elif now >= self._interval_end:
+            self.overloaded = self._min_delay > self.target
+            self._min_delay = math.inf
+            self._interval_end = now + self.interval
+
+        self._min_delay = min(self._min_delay, delay)
+        return self.overloaded
+
+
+class AdmissionControl:
+    """
+    Sheds requests that waited in queue longer than deadline of their
+    endpoint. While endpoint is overloaded (see `CoDel`) allowed delay is
+    tightened to CoDel target to drain the queue quickly.
+    Counts admitted/shed requests per endpoint and logs shed counts not more
+    often than once in `report_interval` seconds (on the first request after
+    it passes, so counts of the last interval of a burst are logged too).
+    """
+
+    def __init__(self, deadlines: Dict[str, float], default_deadline: float,
+                 target: float, interval: float, retry_after: int = 1,
+                 report_interval: float = 10):
+        self.deadlines = deadlines
+        self.default_deadline = default_deadline
+        self.target = target
+        self.interval = interval
+        self.retry_after = retry_after
+        self.report_interval = report_interval
+        self.stats = Counter()  # (endpoint, 'admitted'/'shed') -> count
+        self._codels = {}
+        self._reported_at = time.monotonic()
+        self._unreported = Counter()
+
+    def should_shed(self, endpoint: str, request_start: Optional[str]) -> bool:
+        """
+        :param endpoint: request path
+        :param request_start: value of header with request start timestamp
+        """
+        self._report()
+        started_at = parse_request_start(request_start)
+        if started_at is None:
+            return False
+
+        now = time.time()
+        delay = max(now - started_at, 0.0)
+        codel = self._codels.get(endpoint)
+        if codel is None:
+            codel = self._codels[endpoint] = CoDel(self.target, self.interval)
+
+        deadline = self.deadlines.get(endpoint, self.default_deadline)
+        if codel.observe(delay, now):
+            deadline = min(deadline, self.target)
+
+        if delay <= deadline:
+            self.stats[(endpoint, 'admitted')] += 1
+            return False
+
+        self.stats[(endpoint, 'shed')] += 1
+        self._unreported[endpoint] += 1
+        self._report()
+        return True
+
+    def _report(self) -> None:
+        if not self._unreported:
+            return
+
+        now = time.monotonic()
+        if now - self._reported_at < self.report_interval:
+            return
+
+        shed, self._unreported = self._unreported, Counter()
+        self._reported_at = now
+        logger.warning(
+            'Shed requests queued for too long: %s',
+            ', '.join(f'{endpoint}={count}' for endpoint, count in shed.items()),
+        )
+
+
+_admission_control = None
+
+
+def get_admission_control() -> Optional[AdmissionControl]:
+    """
+    :return: admission control configured in settings or None if load
+    shedding is disabled
+    """
+    global _admission_control
+    if not settings.LOAD_SHEDDING_ENABLED:
+        return None
+
+    if _admission_control is None:
+        _admission_control = AdmissionControl(
+            deadlines=settings.LOAD_SHEDDING_DEADLINES,
+            default_deadline=settings.LOAD_SHEDDING_DEFAULT_DEADLINE,
+            target=settings.LOAD_SHEDDING_TARGET,
+            interval=settings.LOAD_SHEDDING_INTERVAL,
+            retry_after=settings.LOAD_SHEDDING_RETRY_AFTER,
+        )
+
+    return _admission_control
+
+
+def _reset_admission_control(setting: str, **kwargs) -> None:
+    global _admission_control
+    if setting.startswith('LOAD_SHEDDING_'):
+        _admission_control = None
+
+
+setting_changed.connect(_reset_admission_control)
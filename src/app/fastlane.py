@@ -0,0 +1,198 @@
+"""
+Lean request path for `ExecutePOSTView` endpoints which skips URL
+resolution, middlewares, content negotiation and view dispatch.
+"""
+import io
+import json
+from http import HTTPStatus
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.handlers.exception import response_for_exception
+from django.core.handlers.wsgi import WSGIRequest
+from django.urls import get_resolver
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.utils.json import strict_constant
+
+from app.admission import (
+    ADMITTED_ENVIRON_KEY, REQUEST_START_HEADER, get_admission_control,
+)
+from app.views import (
+    ExecutePOSTView, MerchantNotAuthenticated, ServiceOverloaded,
+    authenticate_merchant, get_client_ip,
+)
+
+
+JSON_MEDIA_TYPES = ('*/*', 'application/*', 'application/json')
+
+
+class FastLaneApplication:
+    """
+    WSGI application wrapping Django one. It handles JSON POST requests to
+    `ExecutePOSTView` endpoints by itself, reusing serializers of those
+    views (so validation rules and `create` logic are the same).
+    Request bodies larger than `max_body_size` are rejected right away.
+
+    Fast lane only handles requests that pass validation. Anything else
+    (invalid data, other content types or methods, unknown paths) is passed
+    to the wrapped Django application, so all error payloads stay exactly
+    the same as before.
+    """
+
+    def __init__(self, django_application, max_body_size: int):
+        self.django_application = django_application
+        self.max_body_size = max_body_size
+        self.routes = self._collect_routes()
+
+    def __call__(self, environ, start_response):
+        prototype = self.routes.get(environ.get('PATH_INFO'))
+        if prototype is None or not self._is_json_post(environ):
+            return self.django_application(environ, start_response)
+
+        admission_control = get_admission_control()
+        if admission_control is not None:
+            if admission_control.should_shed(
+                environ['PATH_INFO'], environ.get(REQUEST_START_HEADER),
+            ):
+                return self._respond_api_exception(
+                    start_response, ServiceOverloaded(admission_control.retry_after),
+                )
+            environ[ADMITTED_ENVIRON_KEY] = True
+
+        try:
+            merchant_id = authenticate_merchant(environ)
+        except MerchantNotAuthenticated as exception:
+            return self._respond_api_exception(start_response, exception)
+
+        body = self._read_body(environ)
+        if body is None:
+            return self._respond(
+                start_response, '413 Request Entity Too Large',
+                {'detail': 'Request body is too large.'},
+            )
+
+        try:
+            # NaN and infinities are rejected as by `JSONParser`
+            data = json.loads(body, parse_constant=strict_constant)
+            validated_data = prototype.run_validation(data)
+        except (ValueError, ValidationError, DjangoValidationError):
+            environ['wsgi.input'] = io.BytesIO(body)
+            environ['CONTENT_LENGTH'] = str(len(body))
+            return self.django_application(environ, start_response)
+
+        try:
+            context = {
+                'merchant_id': merchant_id,
+                'client_ip': get_client_ip(environ),
+            }
+            result = type(prototype)(context=context).create(validated_data)
+        except ValidationError as exception:
+            return self._respond(start_response, '400 Bad Request', exception.detail)
+        except APIException as exception:  # e.g. throttled by velocity limits
+            return self._respond_api_exception(start_response, exception)
+        except Exception as exception:
+            return self._respond_unhandled_exception(environ, start_response, body, exception)
+
+        return self._respond(start_response, '200 OK', result)
+
+    def _collect_routes(self) -> dict:
+        """
+        Find all root URL patterns served by `ExecutePOSTView` subclasses.
+        Serializer instances prepared here are used only for validation
+        (which doesn't change their state), so fields of every serializer
+        are built just once.
+        :return: mapping of request path to serializer instance
+        """
+        routes = {}
+        for pattern in get_resolver().url_patterns:
+            view_class = getattr(getattr(pattern, 'callback', None), 'view_class', None)
+            if view_class and issubclass(view_class, ExecutePOSTView):
+                prototype = view_class.serializer_class()
+                prototype.fields  # noqa: B018 build lazy fields before serving requests
+                routes[f'/{pattern.pattern}'] = prototype
+
+        return routes
+
+    def _read_body(self, environ):
+        """
+        Read request body if it's not larger than `max_body_size`.
+        :return: body or None if it's too large
+        """
+        try:
+            content_length = int(environ.get('CONTENT_LENGTH') or -1)
+        except ValueError:
+            content_length = -1
+
+        if content_length > self.max_body_size:
+            return None
+
+        if content_length >= 0:
+            return environ['wsgi.input'].read(content_length)
+
+        # unknown length (chunked encoding), read no more than allowed
+        body = environ['wsgi.input'].read(self.max_body_size + 1)
+        return body if len(body) <= self.max_body_size else None
+
+    @staticmethod
+    def _is_json_post(environ) -> bool:
+        """
+        Check if request is POST with JSON body and JSON response is acceptable.
+        """
+        if environ.get('REQUEST_METHOD') != 'POST':
+            return False
+        if not environ.get('CONTENT_TYPE', '').startswith('application/json'):
+            return False
+
+        accept = environ.get('HTTP_ACCEPT')
+        if not accept:
+            return True
+
+        media_types = (media.split(';')[0].strip() for media in accept.split(','))
+        return any(media in JSON_MEDIA_TYPES for media in media_types)
+
+    @staticmethod
+    def _respond_unhandled_exception(environ, start_response, body: bytes,
+                                     exception: Exception):
+        """
+        Log exception and render response with Django `handler500` (or debug
+        page), the same way as Django handles exceptions raised in views.
+        Must be called while exception is handled.
+        """
+        environ['wsgi.input'] = io.BytesIO(body)
+        environ['CONTENT_LENGTH'] = str(len(body))
+        response = response_for_exception(WSGIRequest(environ), exception)
+        start_response(f'{response.status_code} {response.reason_phrase}', [
+            *response.items(),
+            *(('Set-Cookie', cookie.output(header='')) for cookie in response.cookies.values()),
+        ])
+        return response
+
+    @classmethod
+    def _respond_api_exception(cls, start_response, exception: APIException) -> list:
+        """
+        Render exception the same way as DRF exception handler does.
+        """
+        headers = []
+        if getattr(exception, 'auth_header', None):
+            headers.append(('WWW-Authenticate', exception.auth_header))
+        if getattr(exception, 'wait', None):
+            headers.append(('Retry-After', '%d' % exception.wait))
+
+        return cls._respond(
+            start_response,
+            f'{exception.status_code} {HTTPStatus(exception.status_code).phrase}',
+            {'detail': exception.detail}, headers,
+        )
+
+    @staticmethod
+    def _respond(start_response, status: str, data, headers=()) -> list:
+        """
+        Render data the same way as `JSONRenderer` does with default settings.
+        """
+        content = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
+        start_response(status, [
+            ('Content-Type', 'application/json'),
+            ('Content-Length', str(len(content))),
+            ('X-Content-Type-Options', 'nosniff'),
+            *headers,
+        ])
+        return [content]
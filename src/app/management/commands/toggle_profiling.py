@@ -0,0 +1,29 @@
+import os
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (  # noqa: A003
+        'Toggle on-demand profiling of running worker processes by sending '
+        'them PROFILING_SIGNAL. Profiles are written to PROFILING_OUTPUT_DIR '
+        'when profiling gets disabled.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('pids', nargs='+', type=int, help='worker process ids')
+
+    def handle(self, *args, **options):
+        if not settings.PROFILING_SIGNAL:
+            raise CommandError('PROFILING_SIGNAL setting is not configured')
+
+        signum = getattr(signal, settings.PROFILING_SIGNAL)
+        for pid in options['pids']:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                raise CommandError(f'There is no process with pid {pid}')
+
+            self.stdout.write(f'Sent {settings.PROFILING_SIGNAL} to {pid}')
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from app.profiling import RequestProfiler, install_toggle_signal
+from app.views import ExecutePOSTView
+
+
+class ProfilingMiddleware:
+    """
+    Profiles sampled fraction of requests handled by `ExecutePOSTView`
+    subclasses (see `PROFILING_*` settings).
+    Removes itself from middleware chain if profiling can't ever be enabled
+    in this process, so it costs nothing when disabled.
+    """
+
+    def __init__(self, get_response):
+        if not (settings.PROFILING_SAMPLE_RATE or settings.PROFILING_SIGNAL):
+            raise MiddlewareNotUsed
+
+        self.get_response = get_response
+        self.profiler = RequestProfiler(
+            output_dir=settings.PROFILING_OUTPUT_DIR,
+            sample_rate=settings.PROFILING_SAMPLE_RATE,
+            trace_allocations=settings.PROFILING_TRACE_ALLOCATIONS,
+            dump_every=settings.PROFILING_DUMP_EVERY,
+        )
+        if settings.PROFILING_SIGNAL:
+            install_toggle_signal(self.profiler, settings.PROFILING_SIGNAL)
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None)
+        if not (view_class and issubclass(view_class, ExecutePOSTView)):
+            return None
+
+        if not self.profiler.should_sample():
+            return None
+
+        return self.profiler.profile(
+            request.path_info, view_func, request, *view_args, **view_kwargs,
+        )
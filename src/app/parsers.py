@@ -0,0 +1,61 @@
+"""
+Binary parsers for internal callers that exchange lots of small requests,
+where text encoding of JSON is a noticeable part of the cost.
+Decimal values should be sent as strings (like in JSON) or, with CBOR, as
+decimal fractions (tag 4), so they're validated by serializers exactly.
+Bodies larger than `BINARY_MAX_BODY_SIZE` bytes are rejected with 413.
+"""
+import cbor2
+import msgpack
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
+from rest_framework.parsers import BaseParser
+
+
+class RequestBodyTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Request body is too large.'
+    default_code = 'request_body_too_large'
+
+
+class BinaryParser(BaseParser):
+    """
+    Reads no more than `BINARY_MAX_BODY_SIZE` bytes of body, since binary
+    decoders build the whole object from it at once.
+    """
+    def read(self, stream) -> bytes:
+        max_body_size = settings.BINARY_MAX_BODY_SIZE
+        body = stream.read(max_body_size + 1)
+        if len(body) > max_body_size:
+            raise RequestBodyTooLarge()
+
+        return body
+
+
+class MessagePackParser(BinaryParser):
+    """
+    Parses MessagePack-serialized data.
+    """
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        body = self.read(stream)
+        try:
+            return msgpack.unpackb(body, raw=False)
+        except (ValueError, msgpack.UnpackException) as exception:
+            raise ParseError(f'MessagePack parse error - {exception}')
+
+
+class CBORParser(BinaryParser):
+    """
+    Parses CBOR-serialized data.
+    """
+    media_type = 'application/cbor'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        body = self.read(stream)
+        try:
+            return cbor2.loads(body)
+        except (ValueError, cbor2.CBORDecodeError) as exception:
+            raise ParseError(f'CBOR parse error - {exception}')
@@ -0,0 +1,228 @@
+"""
+On-demand profiling of requests. Collects wall/CPU time and allocations
+per endpoint and aggregates them into collapsed stacks
+(the format consumed by flamegraph.pl, speedscope, etc.)
+"""
+import logging
+import os
+import random
+import re
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from typing import Callable, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class StackProfiler:
+    """
+    Deterministic profiler based on `sys.setprofile` hooks, which attributes
+    self wall/CPU time (in microseconds) to the full call stack.
+    Hooks are per-thread, so only the thread which runs the request is
+    affected.
+    """
+
+    def __init__(self):
+        self.wall = Counter()
+        self.cpu = Counter()
+        # entries are [stack path, wall start, cpu start, children wall, children cpu]
+        self._stack = []
+
+    def run(self, func: Callable, *args, **kwargs):
+        sys.setprofile(self._hook)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            sys.setprofile(None)
+
+    def _hook(self, frame, event: str, arg) -> None:
+        if event == 'call':
+            self._push(self._frame_name(frame))
+        elif event == 'c_call':
+            self._push(self._c_function_name(arg))
+        elif event in ('return', 'c_return', 'c_exception') and self._stack:
+            self._pop()
+
+    def _push(self, name: str) -> None:
+        path = f'{self._stack[-1][0]};{name}' if self._stack else name
+        self._stack.append([path, time.perf_counter(), time.thread_time(), 0.0, 0.0])
+
+    def _pop(self) -> None:
+        path, wall_start, cpu_start, children_wall, children_cpu = self._stack.pop()
+        wall = time.perf_counter() - wall_start
+        cpu = time.thread_time() - cpu_start
+        self.wall[path] += int((wall - children_wall) * 1e6)
+        self.cpu[path] += int((cpu - children_cpu) * 1e6)
+        if self._stack:
+            self._stack[-1][3] += wall
+            self._stack[-1][4] += cpu
+
+    @staticmethod
+    def _frame_name(frame) -> str:
+        module = frame.f_globals.get('__name__', '?')
+        return f'{module}:{frame.f_code.co_name}'
+
+    @staticmethod
+    def _c_function_name(function) -> str:
+        module = getattr(function, '__module__', None) or 'builtins'
+        name = getattr(function, '__qualname__', repr(function))
+        return f'{module}:{name}'
+
+
+class RequestProfiler:
+    """
+    Holds profiling state of the worker process: whether profiling is active,
+    which fraction of requests is sampled and aggregated stacks per endpoint.
+    Aggregated stacks are written to `output_dir` every `dump_every`
+    profiled requests and when profiling gets disabled.
+
+    Allocations are traced by `tracemalloc`, which is process-wide: tracing
+    is started when profiling gets enabled and stopped when it gets disabled,
+    and allocations of request are the ones made (and still alive) between
+    snapshots taken before and after it. So they are attributed to requests
+    correctly only if worker serves one request at a time (gunicorn `sync`
+    worker); with threaded workers allocations of concurrent requests are
+    mixed in.
+    """
+
+    def __init__(self, output_dir: str, sample_rate: float = 0.0,
+                 trace_allocations: bool = True, dump_every: int = 100,
+                 allocation_frames: int = 32):
+        self.output_dir = output_dir
+        self.sample_rate = sample_rate
+        self.trace_allocations = trace_allocations
+        self.dump_every = dump_every
+        self.allocation_frames = allocation_frames
+        self.active = False
+        self._lock = threading.RLock()  # signal handler may dump while lock is held
+        self._stacks = defaultdict(Counter)  # (endpoint, kind) -> stacks
+        self._profiled_count = 0
+        self._tracing_allocations = False
+        if sample_rate > 0:
+            self._activate()
+
+    def should_sample(self) -> bool:
+        return self.active and random.random() < self.sample_rate
+
+    def toggle(self, sample_rate: Optional[float] = None) -> None:
+        """
+        Switch profiling on (with `sample_rate` or the one from settings,
+        but at least every request) or off, writing collected data to disk.
+        """
+        if self.active:
+            self.active = False
+            self._stop_tracing_allocations()
+            self.dump()
+        else:
+            self.sample_rate = sample_rate or self.sample_rate or 1.0
+            self._activate()
+
+        logger.info(
+            'Profiling %s in process %s',
+            'enabled' if self.active else 'disabled', os.getpid(),
+        )
+
+    def profile(self, endpoint: str, func: Callable, *args, **kwargs):
+        """
+        Execute `func` collecting its wall/CPU profile and allocations.
+        """
+        stack_profiler = StackProfiler()
+        trace_allocations = self._tracing_allocations and tracemalloc.is_tracing()
+        snapshot = tracemalloc.take_snapshot() if trace_allocations else None
+
+        try:
+            return stack_profiler.run(func, *args, **kwargs)
+        finally:
+            allocations = Counter()
+            if trace_allocations and tracemalloc.is_tracing():
+                allocations = self._collect_allocations(
+                    tracemalloc.take_snapshot(), snapshot,
+                )
+
+            self._add(endpoint, stack_profiler.wall, stack_profiler.cpu, allocations)
+
+    def dump(self) -> None:
+        """
+        Write aggregated stacks to `<output_dir>/<pid>.<endpoint>.<kind>.collapsed`
+        files, overwriting previous ones.
+        """
+        with self._lock:
+            stacks = {key: Counter(counter) for key, counter in self._stacks.items()}
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        pid = os.getpid()
+        for (endpoint, kind), counter in stacks.items():
+            file_name = f'{pid}.{self._slugify(endpoint)}.{kind}.collapsed'
+            with open(os.path.join(self.output_dir, file_name), 'w') as out:
+                for stack, value in counter.most_common():
+                    if value > 0:
+                        out.write(f'{stack} {value}\n')
+
+    def _add(self, endpoint: str, wall: Counter, cpu: Counter,
+             allocations: Counter) -> None:
+        with self._lock:
+            self._stacks[(endpoint, 'wall')].update(wall)
+            self._stacks[(endpoint, 'cpu')].update(cpu)
+            if allocations:
+                self._stacks[(endpoint, 'alloc')].update(allocations)
+            self._profiled_count += 1
+            need_dump = self.dump_every and self._profiled_count % self.dump_every == 0
+
+        if need_dump:
+            self.dump()
+
+    def _activate(self) -> None:
+        self.active = True
+        if self.trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start(self.allocation_frames)
+            self._tracing_allocations = True
+
+    def _stop_tracing_allocations(self) -> None:
+        """
+        Stop tracing allocations, unless it was started by someone else.
+        """
+        if self._tracing_allocations:
+            self._tracing_allocations = False
+            tracemalloc.stop()
+
+    @staticmethod
+    def _collect_allocations(snapshot: tracemalloc.Snapshot,
+                             previous_snapshot: tracemalloc.Snapshot) -> Counter:
+        """
+        Convert allocations made after `previous_snapshot` that are still alive
+        at the end of request into collapsed stacks with sizes in bytes.
+        """
+        filters = (
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        )
+        snapshot = snapshot.filter_traces(filters)
+        previous_snapshot = previous_snapshot.filter_traces(filters)
+        allocations = Counter()
+        for stat in snapshot.compare_to(previous_snapshot, 'traceback'):
+            if stat.size_diff > 0:
+                stack = ';'.join(f'{frame.filename}:{frame.lineno}' for frame in stat.traceback)
+                allocations[stack] += stat.size_diff
+
+        return allocations
+
+    @staticmethod
+    def _slugify(endpoint: str) -> str:
+        return re.sub(r'[^\w-]+', '_', endpoint).strip('_') or 'root'
+
+
+def install_toggle_signal(profiler: RequestProfiler, signal_name: str) -> None:
+    """
+    Make `signal_name` (e.g. `SIGUSR2`) toggle profiling of this process.
+    """
+    signum = getattr(signal, signal_name)
+    try:
+        signal.signal(signum, lambda *args: profiler.toggle())
+    except ValueError:
+        # signal handlers can be installed only from the main thread
+        logger.warning('Could not install %s handler for profiling', signal_name)
@@ -0,0 +1,55 @@
+"""
+Binary counterparts of `JSONRenderer` (see `app.parsers`).
+"""
+from decimal import Decimal
+
+import cbor2
+import msgpack
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def _encode_default(obj):
+    """
+    Convert objects that are not natively supported the same way as they're
+    converted to JSON, except decimals which are kept exact as strings
+    (CBOR encodes them natively, as decimal fractions).
+    """
+    if isinstance(obj, Decimal):
+        return str(obj)
+
+    return JSONEncoder().default(obj)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Renderer which serializes to MessagePack.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'  # noqa: A003
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        return msgpack.packb(data, default=_encode_default, use_bin_type=True)
+
+
+class CBORRenderer(BaseRenderer):
+    """
+    Renderer which serializes to CBOR.
+    """
+    media_type = 'application/cbor'
+    format = 'cbor'  # noqa: A003
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        return cbor2.dumps(
+            data, default=lambda encoder, obj: encoder.encode(_encode_default(obj)),
+        )
@@ -24,12 +24,14 @@ ALLOWED_HOSTS = ['*']  # host validation is not necessary
 INSTALLED_APPS = [
     'rest_framework',
 
+    'app',
     'payments',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'app.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'app.urls'
@@ -72,16 +74,172 @@ LOGGING = {
 
 # 3d party packages
 
+# JSON is used unless request `Content-Type`/`Accept` asks for MessagePack
+# (`application/msgpack`) or CBOR (`application/cbor`), see `app.parsers`.
+# Binary bodies larger than BINARY_MAX_BODY_SIZE bytes are rejected with 413.
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
         'rest_framework.renderers.JSONRenderer',
+        'app.renderers.MessagePackRenderer',
+        'app.renderers.CBORRenderer',
     ],
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
+        'app.parsers.MessagePackParser',
+        'app.parsers.CBORParser',
     ],
 }
+BINARY_MAX_BODY_SIZE = env.int('BINARY_MAX_BODY_SIZE', default=4096)
 
 # Application config
 
+# Fast lane handles valid JSON requests to `ExecutePOSTView` endpoints
+# bypassing middlewares and DRF machinery (see `app.fastlane`). Bodies larger
+# than FAST_LANE_MAX_BODY_SIZE bytes are rejected before being read.
+FAST_LANE_ENABLED = env.bool('FAST_LANE_ENABLED', default=False)
+FAST_LANE_MAX_BODY_SIZE = env.int('FAST_LANE_MAX_BODY_SIZE', default=4096)
+
+# Load shedding by time request spent in queue before reaching worker,
+# measured from `X-Request-Start` header set by nginx (see `app.admission`).
+# Requests queued longer than deadline of their endpoint (seconds, given as
+# `/tokenise=2;/sale=5`, LOAD_SHEDDING_DEFAULT_DEADLINE for other endpoints)
+# get 503 with `Retry-After`.
+# When even the shortest delay during LOAD_SHEDDING_INTERVAL seconds exceeds
+# LOAD_SHEDDING_TARGET, deadline is tightened to the target until queue drains.
+LOAD_SHEDDING_ENABLED = env.bool('LOAD_SHEDDING_ENABLED', default=False)
+LOAD_SHEDDING_DEADLINES = env.dict(
+    'LOAD_SHEDDING_DEADLINES', cast={'value': float},
+    default={'/tokenise': 2.0, '/sale': 5.0, '/authorize': 5.0},
+)
+LOAD_SHEDDING_DEFAULT_DEADLINE = env.float('LOAD_SHEDDING_DEFAULT_DEADLINE', default=5.0)
+LOAD_SHEDDING_TARGET = env.float('LOAD_SHEDDING_TARGET', default=0.1)
+LOAD_SHEDDING_INTERVAL = env.float('LOAD_SHEDDING_INTERVAL', default=1.0)
+LOAD_SHEDDING_RETRY_AFTER = env.int('LOAD_SHEDDING_RETRY_AFTER', default=1)
+
 BRAINTREE_API_KEY = env('BRAINTREE_API_KEY')
 BRAINTREE_API_URL = env('BRAINTREE_API_URL')
+
+# PSP credentials of merchants, selected by `X-Merchant-Id` request header
+# (requests without it use BRAINTREE_API_KEY): JSON file or SQLite database
+# (`.db`, `.sqlite`, `.sqlite3`), see `payments.credentials`. Requests with
+# the header must carry client key of merchant (`Authorization: Bearer
+# <key>`), which is checked against its SHA-256 digest in credentials. Changes
+# of the file are picked up within BRAINTREE_CREDENTIALS_RELOAD_INTERVAL seconds.
+BRAINTREE_CREDENTIALS_FILE = env('BRAINTREE_CREDENTIALS_FILE', default=None)
+BRAINTREE_CREDENTIALS_RELOAD_INTERVAL = env.float(
+    'BRAINTREE_CREDENTIALS_RELOAD_INTERVAL', default=5.0,
+)
+# Connections are kept for up to BRAINTREE_MAX_MERCHANT_TRANSPORTS recently
+# active merchants (others reconnect), so every worker keeps at most
+# (BRAINTREE_MAX_MERCHANT_TRANSPORTS + 1) * BRAINTREE_POOL_SIZE (or
+# * BRAINTREE_HTTP2_MAX_CONNECTIONS with HTTP/2) sockets open to Braintree,
+# plus connections of pools evicted within the last 25 seconds (they are
+# closed by a single thread once their requests time out). With more active
+# merchants, requests of the least recent ones pay for a reconnect (TLS
+# session resumed, about 2ms over a warm connection on localhost, see
+# `benchmarks.bench_warm_up`), so it should cover merchants active within
+# a few seconds.
+BRAINTREE_MAX_MERCHANT_TRANSPORTS = env.int('BRAINTREE_MAX_MERCHANT_TRANSPORTS', default=32)
+
+# Multiplex concurrent requests to Braintree over a few HTTP/2 connections
+# (per worker process) instead of a connection per request.
+BRAINTREE_HTTP2 = env.bool('BRAINTREE_HTTP2', default=False)
+BRAINTREE_HTTP2_MAX_CONNECTIONS = env.int('BRAINTREE_HTTP2_MAX_CONNECTIONS', default=2)
+
+# Keep up to BRAINTREE_POOL_SIZE HTTP/1.1 connections to Braintree open
+# (used when HTTP/2 is off). Both transports resolve Braintree host not more
+# often than once in BRAINTREE_DNS_TTL seconds.
+BRAINTREE_KEEP_ALIVE = env.bool('BRAINTREE_KEEP_ALIVE', default=False)
+BRAINTREE_POOL_SIZE = env.int('BRAINTREE_POOL_SIZE', default=10)
+BRAINTREE_DNS_TTL = env.int('BRAINTREE_DNS_TTL', default=60)
+# Number of connections opened by every worker on boot (see gunicorn config).
+BRAINTREE_WARM_UP_CONNECTIONS = env.int('BRAINTREE_WARM_UP_CONNECTIONS', default=0)
+
+# Transactions authorized via `/authorize` are captured in background in
+# batches of up to CAPTURE_BATCH_SIZE every CAPTURE_INTERVAL seconds,
+# captures declined by PSP are retried with exponential backoff until
+# CAPTURE_MAX_ATTEMPTS are made, batches that failed as a whole (e.g. PSP is
+# down) are retried with backoff without using up attempts (see
+# `payments.capture`). Pending captures are stored in CAPTURE_PATH SQLite
+# database shared by all workers, so they survive worker crashes and
+# restarts (and OS crashes with CAPTURE_FSYNC).
+CAPTURE_PATH = env('CAPTURE_PATH', default=root('captures.sqlite3'))
+CAPTURE_BATCH_SIZE = env.int('CAPTURE_BATCH_SIZE', default=50)
+CAPTURE_INTERVAL = env.float('CAPTURE_INTERVAL', default=5.0)
+CAPTURE_MAX_ATTEMPTS = env.int('CAPTURE_MAX_ATTEMPTS', default=3)
+CAPTURE_FSYNC = env.bool('CAPTURE_FSYNC', default=False)
+
+# Velocity limits against card testing (see `payments.velocity`). Attempts
+# are counted per card (keyed hash of number), token and client IP, and once
+# more than limit of them are made within VELOCITY_WINDOW seconds, requests
+# get 429 without reaching Braintree. Limits are given as `card=5;token=10;
+# ip=30`, dimensions without limit are not counted (no limits by default).
+# Counters are kept per worker for up to VELOCITY_MAX_KEYS keys or, with
+# VELOCITY_SHARED_PATH (e.g. `/dev/shm/payments-velocity`), shared by all
+# workers in fixed size memory mapped file (counts there may be overestimated).
+VELOCITY_LIMITS = env.dict('VELOCITY_LIMITS', cast={'value': int}, default={})
+VELOCITY_WINDOW = env.int('VELOCITY_WINDOW', default=60)
+VELOCITY_BUCKETS = env.int('VELOCITY_BUCKETS', default=12)
+VELOCITY_MAX_KEYS = env.int('VELOCITY_MAX_KEYS', default=100000)
+VELOCITY_SHARED_PATH = env('VELOCITY_SHARED_PATH', default=None)
+
+# Outbox of payment events: sales, authorizations and captures (see
+# `payments.events.outbox`). Events are stored in OUTBOX_PATH SQLite database
+# on the request path (synced to disk on every event only with OUTBOX_FSYNC)
+# and published to all OUTBOX_SINKS (`file:///path`, `http(s)://...` or
+# `queue://` URLs, at least one is required) in batches of up to
+# OUTBOX_BATCH_SIZE every OUTBOX_INTERVAL seconds by background thread of
+# every worker. Once more than OUTBOX_MAX_PENDING events are waiting (e.g.
+# sinks are down), new events are logged and dropped until it's drained, so
+# the outbox doesn't fill the disk. Events rejected by sinks (4xx responses)
+# or failed OUTBOX_MAX_ATTEMPTS times are moved to dead letters
+# (`outbox_requeue` command publishes them again). Events are not recorded if
+# OUTBOX_PATH is empty.
+OUTBOX_PATH = env('OUTBOX_PATH', default=None)
+OUTBOX_SINKS = env.list('OUTBOX_SINKS', default=[])
+OUTBOX_BATCH_SIZE = env.int('OUTBOX_BATCH_SIZE', default=100)
+OUTBOX_INTERVAL = env.float('OUTBOX_INTERVAL', default=1.0)
+OUTBOX_MAX_PENDING = env.int('OUTBOX_MAX_PENDING', default=1000000)
+OUTBOX_MAX_ATTEMPTS = env.int('OUTBOX_MAX_ATTEMPTS', default=20)
+OUTBOX_FSYNC = env.bool('OUTBOX_FSYNC', default=False)
+
+# Shadow mode (see `payments.shadow`): SHADOW_SAMPLE_RATE fraction of
+# tokenize requests (but not more than SHADOW_MAX_RATE per second per worker)
+# is mirrored in background to candidate gateway to compare latencies and
+# responses before rollout. Candidate is Braintree at SHADOW_API_URL (e.g.
+# sandbox, must differ from BRAINTREE_API_URL) with SHADOW_API_KEY,
+# SHADOW_API_VERSION (production one if empty) and SHADOW_TRANSPORT (`http2`,
+# `keep-alive` or `none`, the production one if empty) or, with
+# SHADOW_REPLAY_FILE, a local stub replaying recorded traffic.
+# Requests that don't fit into SHADOW_QUEUE_SIZE are dropped. Summary is
+# logged every SHADOW_REPORT_INTERVAL seconds.
+SHADOW_SAMPLE_RATE = env.float('SHADOW_SAMPLE_RATE', default=0.0)
+SHADOW_MAX_RATE = env.float('SHADOW_MAX_RATE', default=10.0)
+SHADOW_QUEUE_SIZE = env.int('SHADOW_QUEUE_SIZE', default=100)
+SHADOW_REPORT_INTERVAL = env.float('SHADOW_REPORT_INTERVAL', default=60.0)
+SHADOW_API_URL = env('SHADOW_API_URL', default=None)
+SHADOW_API_KEY = env('SHADOW_API_KEY', default=None)
+SHADOW_API_VERSION = env('SHADOW_API_VERSION', default=None)
+SHADOW_TRANSPORT = env('SHADOW_TRANSPORT', default=None)
+SHADOW_REPLAY_FILE = env('SHADOW_REPLAY_FILE', default=None)
+
+# Record/replay of Braintree traffic for offline performance tests.
+# Record mode appends every request/response pair (card numbers redacted)
+# to BRAINTREE_RECORD_FILE. With BRAINTREE_REPLAY_FILE set, the app does not
+# go to Braintree at all and serves responses from that file instead.
+BRAINTREE_RECORD_FILE = env('BRAINTREE_RECORD_FILE', default=None)
+BRAINTREE_REPLAY_FILE = env('BRAINTREE_REPLAY_FILE', default=None)
+BRAINTREE_REPLAY_LATENCY_SCALE = env.float('BRAINTREE_REPLAY_LATENCY_SCALE', default=1.0)
+
+# On-demand profiling of requests (see `app.profiling`). Either sample
+# PROFILING_SAMPLE_RATE fraction of requests from the start or toggle
+# profiling of a running worker with PROFILING_SIGNAL (e.g. SIGUSR2,
+# `./manage.py toggle_profiling <pid>`). Collapsed stacks are written
+# to PROFILING_OUTPUT_DIR. Allocations (PROFILING_TRACE_ALLOCATIONS) are
+# traced process-wide while profiling is on, so they are attributed to
+# requests correctly only with `sync` gunicorn workers (one request at a time).
+PROFILING_SAMPLE_RATE = env.float('PROFILING_SAMPLE_RATE', default=0.0)
+PROFILING_SIGNAL = env('PROFILING_SIGNAL', default=None)
+PROFILING_OUTPUT_DIR = env('PROFILING_OUTPUT_DIR', default=root('profiles'))
+PROFILING_TRACE_ALLOCATIONS = env.bool('PROFILING_TRACE_ALLOCATIONS', default=True)
+PROFILING_DUMP_EVERY = env.int('PROFILING_DUMP_EVERY', default=100)
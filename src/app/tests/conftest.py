@@ -0,0 +1,49 @@
+import io
+import json
+
+import pytest
+from django.core.wsgi import get_wsgi_application
+
+from app.fastlane import FastLaneApplication
+
+
+@pytest.fixture
+def django_app_spy(mocker):
+    return mocker.Mock(wraps=get_wsgi_application())
+
+
+@pytest.fixture
+def fast_lane(django_app_spy):
+    return FastLaneApplication(django_app_spy, max_body_size=1024)
+
+
+@pytest.fixture
+def wsgi_post():
+    """
+    :return: function that calls WSGI application with POST request
+    and returns its status, headers and content
+    """
+    def wsgi_post(application, path, data, content_type='application/json', **extra):
+        body = data if isinstance(data, bytes) else json.dumps(data).encode()
+        environ = {
+            'REQUEST_METHOD': 'POST',
+            'PATH_INFO': path,
+            'SERVER_NAME': 'testserver',
+            'SERVER_PORT': '80',
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': io.StringIO(),
+            'CONTENT_TYPE': content_type,
+            'CONTENT_LENGTH': str(len(body)),
+            **extra,
+        }
+        response = {}
+
+        def start_response(status, headers):
+            response['status'] = int(status.split()[0])
+            response['headers'] = dict(headers)
+
+        response['content'] = b''.join(application(environ, start_response))
+        return response
+
+    return wsgi_post
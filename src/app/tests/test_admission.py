@@ -0,0 +1,158 @@
+import json
+import time
+
+import pytest
+
+from app.admission import AdmissionControl, CoDel, get_admission_control, parse_request_start
+
+
+@pytest.fixture
+def load_shedding(settings):
+    settings.LOAD_SHEDDING_ENABLED = True
+    settings.LOAD_SHEDDING_DEADLINES = {'/tokenise': 1.0}
+    settings.LOAD_SHEDDING_DEFAULT_DEADLINE = 5.0
+    settings.LOAD_SHEDDING_TARGET = 0.1
+    settings.LOAD_SHEDDING_INTERVAL = 1.0
+    settings.LOAD_SHEDDING_RETRY_AFTER = 3
+
+
+def _request_start(delay):
+    return f't={time.time() - delay:.3f}'
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('t=1591000000.123', 1591000000.123),
+    ('1591000000.123', 1591000000.123),
+    ('t=1591000000123', 1591000000.123),
+    ('t=1591000000123000', 1591000000.123),
+    ('t=abc', None),
+    ('', None),
+    (None, None),
+])
+def test_parse_request_start(value, expected):
+    assert parse_request_start(value) == pytest.approx(expected)
+
+
+def test_codel_overloaded_by_standing_queue():
+    codel = CoDel(target=0.1, interval=1.0)
+
+    assert not codel.observe(0.5, now=0)
+    assert not codel.observe(0.2, now=0.5)
+    # the shortest delay of the first interval was above the target
+    assert codel.observe(0.05, now=1.0)
+    assert codel.observe(0.3, now=1.5)
+    # queue drained during the second interval
+    assert not codel.observe(0.3, now=2.0)
+
+
+def test_admission_control_sheds_by_deadline():
+    admission_control = AdmissionControl(
+        deadlines={'/tokenise': 1.0}, default_deadline=5.0, target=10, interval=1.0,
+    )
+
+    assert not admission_control.should_shed('/tokenise', _request_start(0.5))
+    assert admission_control.should_shed('/tokenise', _request_start(1.5))
+    assert not admission_control.should_shed('/sale', _request_start(1.5))
+    assert not admission_control.should_shed('/sale', None)
+    assert admission_control.stats == {
+        ('/tokenise', 'admitted'): 1,
+        ('/tokenise', 'shed'): 1,
+        ('/sale', 'admitted'): 1,
+    }
+
+
+def test_admission_control_tightens_deadline_when_overloaded(mocker):
+    time_mock = mocker.patch('app.admission.time.time', return_value=1000.0)
+    admission_control = AdmissionControl(
+        deadlines={}, default_deadline=5.0, target=0.1, interval=1.0,
+    )
+
+    assert not admission_control.should_shed('/sale', 't=999.5')
+    time_mock.return_value = 1001.0
+    assert admission_control.should_shed('/sale', 't=1000.5')
+    assert not admission_control.should_shed('/sale', 't=1000.95')
+
+
+def test_admission_control_reports_shed_counts(mocker):
+    logger_mock = mocker.patch('app.admission.logger')
+    admission_control = AdmissionControl(
+        deadlines={}, default_deadline=1.0, target=10, interval=1.0, report_interval=0,
+    )
+
+    admission_control.should_shed('/sale', _request_start(2))
+
+    logger_mock.warning.assert_called_once_with(
+        'Shed requests queued for too long: %s', '/sale=1',
+    )
+
+
+def test_admission_control_reports_last_shed_counts_on_next_request(mocker):
+    logger_mock = mocker.patch('app.admission.logger')
+    monotonic_mock = mocker.patch('app.admission.time.monotonic', return_value=0)
+    admission_control = AdmissionControl(
+        deadlines={}, default_deadline=1.0, target=10, interval=1.0, report_interval=10,
+    )
+    admission_control.should_shed('/sale', _request_start(2))
+    assert not logger_mock.warning.called
+
+    monotonic_mock.return_value = 10
+    admission_control.should_shed('/sale', _request_start(0))
+
+    logger_mock.warning.assert_called_once_with(
+        'Shed requests queued for too long: %s', '/sale=1',
+    )
+
+
+def test_get_admission_control_disabled(settings):
+    settings.LOAD_SHEDDING_ENABLED = False
+
+    assert get_admission_control() is None
+
+
+def test_get_admission_control_rebuilt_on_settings_change(load_shedding, settings):
+    admission_control = get_admission_control()
+    assert get_admission_control() is admission_control
+    assert admission_control.retry_after == 3
+
+    settings.LOAD_SHEDDING_RETRY_AFTER = 5
+
+    assert get_admission_control().retry_after == 5
+
+
+def test_view_sheds_queued_request(load_shedding, api, mocker):
+    payment_service_mock = mocker.patch('payments.serializers.PaymentService')
+
+    response = api.post(
+        '/tokenise', data={'card_number': '4111111111111111', 'expiry_date': '12/2020'},
+        format='json', HTTP_X_REQUEST_START=_request_start(2),
+    )
+
+    assert response.status_code == 503
+    assert response['Retry-After'] == '3'
+    assert response.data == {'detail': 'Service is overloaded, try again later.'}
+    assert not payment_service_mock.tokenize.called
+
+
+def test_fast_lane_sheds_queued_request(load_shedding, fast_lane, django_app_spy, mocker, wsgi_post):
+    payment_service_mock = mocker.patch('payments.serializers.PaymentService')
+
+    response = wsgi_post(
+        fast_lane, '/tokenise', {'card_number': '4111111111111111', 'expiry_date': '12/2020'},
+        HTTP_X_REQUEST_START=_request_start(2),
+    )
+
+    assert response['status'] == 503
+    assert response['headers']['Retry-After'] == '3'
+    assert json.loads(response['content']) == {'detail': 'Service is overloaded, try again later.'}
+    assert not payment_service_mock.tokenize.called
+    assert not django_app_spy.called
+
+
+def test_fast_lane_fallback_admitted_once(load_shedding, fast_lane, django_app_spy, wsgi_post):
+    response = wsgi_post(
+        fast_lane, '/tokenise', {'card_number': '4111'}, HTTP_X_REQUEST_START=_request_start(0.5),
+    )
+
+    assert response['status'] == 400
+    assert django_app_spy.called
+    assert get_admission_control().stats == {('/tokenise', 'admitted'): 1}
@@ -0,0 +1,126 @@
+import json
+from decimal import Decimal
+
+import cbor2
+import msgpack
+import pytest
+
+from payments.gateways.base import SaleResult
+
+
+FORMATS = {
+    'application/msgpack': (msgpack.packb, msgpack.unpackb),
+    'application/cbor': (cbor2.dumps, cbor2.loads),
+    'application/json': (lambda data: json.dumps(data).encode(), json.loads),
+}
+
+
+@pytest.fixture
+def payment_service_mock(mocker):
+    return mocker.patch('payments.serializers.PaymentService')
+
+
+def _post(api, path, data, media_type):
+    dumps, loads = FORMATS[media_type]
+    response = api.post(
+        path, data=dumps(data), content_type=media_type, HTTP_ACCEPT=media_type,
+    )
+    assert response['Content-Type'] == media_type
+    return response.status_code, loads(response.content)
+
+
+@pytest.mark.parametrize('media_type', ['application/msgpack', 'application/cbor'])
+def test_sale_ok(media_type, api, payment_service_mock):
+    payment_service_mock.sale.return_value = SaleResult('id', 'SUBMITTED_FOR_SETTLEMENT')
+
+    status_code, data = _post(
+        api, '/sale', {'token': 'token', 'transaction_amount': '100.10'}, media_type,
+    )
+
+    assert status_code == 200
+    assert data == {'id': 'id', 'status': 'SUBMITTED_FOR_SETTLEMENT'}
+    payment_service_mock.sale.assert_called_once_with(
+        token='token', transaction_amount=Decimal('100.10'), merchant_id=None,
+    )
+
+
+def test_sale_cbor_decimal_amount(api, payment_service_mock):
+    payment_service_mock.sale.return_value = SaleResult('id', 'SUBMITTED_FOR_SETTLEMENT')
+
+    status_code, _ = _post(
+        api, '/sale', {'token': 'token', 'transaction_amount': Decimal('0.10')},
+        'application/cbor',
+    )
+
+    assert status_code == 200
+    assert payment_service_mock.sale.call_args[1]['transaction_amount'] == Decimal('0.10')
+
+
+@pytest.mark.parametrize('media_type', ['application/msgpack', 'application/cbor'])
+@pytest.mark.parametrize('path,data', [
+    ('/tokenise', {'card_number': '4111AAAA11111111', 'expiry_date': '13/2020'}),
+    ('/sale', {'token': 'token', 'transaction_amount': '100.123'}),
+    ('/sale', {'token': 'token', 'transaction_amount': '1e20'}),
+    ('/sale', {'transaction_amount': 100.5}),
+    ('/sale', ['token']),
+])
+def test_error_payloads_same_as_json(media_type, path, data, api, payment_service_mock):
+    assert _post(api, path, data, media_type) == _post(api, path, data, 'application/json')
+    assert not payment_service_mock.method_calls
+
+
+@pytest.mark.parametrize('media_type', ['application/msgpack', 'application/cbor'])
+def test_binary_values_rejected(media_type, api, payment_service_mock):
+    status_code, data = _post(
+        api, '/sale', {'token': b'token', 'transaction_amount': '100'}, media_type,
+    )
+
+    assert status_code == 400
+    assert data == {'token': ['Not a valid string.']}
+
+
+@pytest.mark.parametrize('media_type, body, error', [
+    ('application/msgpack', b'\x81\xa1', 'MessagePack parse error'),
+    ('application/cbor', b'\xa1\x61', 'CBOR parse error'),
+])
+def test_parse_error(media_type, body, error, api):
+    response = api.post('/sale', data=body, content_type=media_type, HTTP_ACCEPT=media_type)
+
+    assert response.status_code == 400
+    assert FORMATS[media_type][1](response.content)['detail'].startswith(error)
+
+
+@pytest.mark.parametrize('media_type', ['application/msgpack', 'application/cbor'])
+def test_body_too_large(media_type, api, settings, payment_service_mock):
+    dumps, loads = FORMATS[media_type]
+    data = {'token': 'token', 'transaction_amount': '100'}
+    settings.BINARY_MAX_BODY_SIZE = len(dumps(data)) - 1
+
+    response = api.post('/sale', data=dumps(data), content_type=media_type, HTTP_ACCEPT=media_type)
+
+    assert response.status_code == 413
+    assert loads(response.content) == {'detail': 'Request body is too large.'}
+    assert not payment_service_mock.method_calls
+
+
+@pytest.mark.parametrize('media_type', ['application/msgpack', 'application/cbor'])
+def test_body_of_max_size_accepted(media_type, api, settings, payment_service_mock):
+    payment_service_mock.sale.return_value = SaleResult('id', 'SUBMITTED_FOR_SETTLEMENT')
+    data = {'token': 'token', 'transaction_amount': '100'}
+    settings.BINARY_MAX_BODY_SIZE = len(FORMATS[media_type][0](data))
+
+    status_code, _ = _post(api, '/sale', data, media_type)
+
+    assert status_code == 200
+
+
+def test_json_is_default(api, payment_service_mock):
+    payment_service_mock.tokenize.return_value = 'token'
+
+    response = api.post(
+        '/tokenise', data=msgpack.packb({'card_number': '4111111111111111', 'expiry_date': '12/2020'}),
+        content_type='application/msgpack',
+    )
+
+    assert response.status_code == 200
+    assert response.json() == {'token': 'token'}
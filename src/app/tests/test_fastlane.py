@@ -0,0 +1,149 @@
+import json
+
+import pytest
+from django.core.wsgi import get_wsgi_application
+
+from payments.gateways.base import SaleResult
+from payments.service import PaymentServiceError
+
+
+@pytest.fixture
+def payment_service_mock(mocker):
+    return mocker.patch('payments.serializers.PaymentService')
+
+
+def test_fast_lane_routes(fast_lane):
+    assert set(fast_lane.routes) == {'/tokenise', '/sale', '/authorize'}
+
+
+def test_fast_lane_tokenize_ok(fast_lane, django_app_spy, payment_service_mock, make_random_str, wsgi_post):
+    token = make_random_str()
+    card_number = make_random_str(16, digits=True)
+    payment_service_mock.tokenize.return_value = token
+
+    response = wsgi_post(fast_lane, '/tokenise', {'card_number': card_number, 'expiry_date': '12/2020'})
+
+    assert response['status'] == 200
+    assert json.loads(response['content']) == {'token': token}
+    payment_service_mock.tokenize.assert_called_once_with(
+        card_number=card_number, expiry_date='12/2020', merchant_id=None,
+    )
+    assert not django_app_spy.called
+
+
+def test_fast_lane_sale_payment_service_error(fast_lane, django_app_spy, payment_service_mock,
+                                              make_random_str, wsgi_post):
+    payment_service_mock.sale.side_effect = PaymentServiceError('Something wrong')
+
+    response = wsgi_post(fast_lane, '/sale', {'token': make_random_str(), 'transaction_amount': '100'})
+
+    assert response['status'] == 400
+    assert json.loads(response['content']) == {'error': 'Something wrong'}
+    assert not django_app_spy.called
+
+
+def test_fast_lane_sale_ok(fast_lane, payment_service_mock, make_random_str, wsgi_post):
+    payment_service_mock.sale.return_value = SaleResult('id', 'status')
+
+    response = wsgi_post(fast_lane, '/sale', {'token': make_random_str(), 'transaction_amount': '100'})
+
+    assert response['status'] == 200
+    assert json.loads(response['content']) == {'id': 'id', 'status': 'status'}
+    assert str(payment_service_mock.sale.call_args[1]['transaction_amount']) == '100.00'
+
+
+@pytest.mark.parametrize('data', [
+    {'card_number': '111122223333AAAA', 'expiry_date': '12/2020'},
+    {'card_number': '1111222233334444'},
+    b'not a json',
+    b'[]',
+    b'{"card_number": NaN, "expiry_date": "12/2020"}',
+])
+def test_fast_lane_invalid_data_falls_back(data, fast_lane, django_app_spy, payment_service_mock, wsgi_post):
+    expected = wsgi_post(get_wsgi_application(), '/tokenise', data)
+
+    response = wsgi_post(fast_lane, '/tokenise', data)
+
+    assert django_app_spy.called
+    assert response['status'] == expected['status'] == 400
+    assert response['content'] == expected['content']
+    assert not payment_service_mock.tokenize.called
+
+
+def test_fast_lane_other_content_type_falls_back(fast_lane, django_app_spy, wsgi_post):
+    response = wsgi_post(fast_lane, '/tokenise', b'card_number=1', content_type='text/plain')
+
+    assert django_app_spy.called
+    assert response['status'] == 415
+
+
+def test_fast_lane_body_too_large(fast_lane, django_app_spy, payment_service_mock, wsgi_post):
+    data = {'card_number': '1' * 2048, 'expiry_date': '12/2020'}
+
+    response = wsgi_post(fast_lane, '/tokenise', data)
+
+    assert response['status'] == 413
+    assert not django_app_spy.called
+    assert not payment_service_mock.tokenize.called
+
+
+def test_fast_lane_velocity_limit(fast_lane, django_app_spy, payment_service_mock, settings,
+                                  make_random_str, wsgi_post):
+    settings.VELOCITY_LIMITS = {'token': 1}
+    payment_service_mock.sale.return_value = SaleResult('id', 'SUBMITTED_FOR_SETTLEMENT')
+    data = {'token': make_random_str(), 'transaction_amount': '100'}
+    assert wsgi_post(fast_lane, '/sale', data)['status'] == 200
+
+    response = wsgi_post(fast_lane, '/sale', data)
+
+    expected = wsgi_post(get_wsgi_application(), '/sale', data)
+    assert response['status'] == expected['status'] == 429
+    assert response['headers']['Retry-After'] == expected['headers']['Retry-After']
+    assert json.loads(response['content']) == json.loads(expected['content'])
+    assert payment_service_mock.sale.call_count == 1
+    assert not django_app_spy.called
+
+
+def test_fast_lane_unhandled_exception(fast_lane, django_app_spy, payment_service_mock,
+                                       make_random_str, caplog, wsgi_post):
+    payment_service_mock.sale.side_effect = KeyError('id')
+    data = {'token': make_random_str(), 'transaction_amount': '100'}
+    expected = wsgi_post(get_wsgi_application(), '/sale', data)
+    caplog.clear()
+
+    response = wsgi_post(fast_lane, '/sale', data)
+
+    assert response['status'] == expected['status'] == 500
+    assert response['headers']['Content-Type'] == expected['headers']['Content-Type']
+    assert response['content'] == expected['content']
+    assert not django_app_spy.called
+    assert caplog.messages == ['Internal Server Error: /sale']
+
+
+def test_fast_lane_merchant_authenticated(fast_lane, payment_service_mock, make_random_str,
+                                          merchant_credential_store, wsgi_post):
+    payment_service_mock.sale.return_value = SaleResult('id', 'status')
+    data = {'token': make_random_str(), 'transaction_amount': '100'}
+
+    response = wsgi_post(
+        fast_lane, '/sale', data,
+        HTTP_X_MERCHANT_ID='merchant-a', HTTP_AUTHORIZATION='Bearer client-key-a',
+    )
+
+    assert response['status'] == 200
+    assert payment_service_mock.sale.call_args[1]['merchant_id'] == 'merchant-a'
+
+
+def test_fast_lane_merchant_not_authenticated(fast_lane, django_app_spy, payment_service_mock,
+                                              make_random_str, merchant_credential_store, wsgi_post):
+    data = {'token': make_random_str(), 'transaction_amount': '100'}
+    headers = {'HTTP_X_MERCHANT_ID': 'merchant-a', 'HTTP_AUTHORIZATION': 'Bearer client-key-b'}
+
+    response = wsgi_post(fast_lane, '/sale', data, **headers)
+
+    expected = wsgi_post(get_wsgi_application(), '/sale', data, **headers)
+    assert response['status'] == expected['status'] == 401
+    assert response['headers']['WWW-Authenticate'] == expected['headers']['WWW-Authenticate']
+    assert json.loads(response['content']) == json.loads(expected['content'])
+    assert not payment_service_mock.sale.called
+    assert not django_app_spy.called
@@ -0,0 +1,127 @@
+import io
+import os
+import signal
+import tracemalloc
+
+import pytest
+from django.core.management import call_command
+
+from app.profiling import RequestProfiler, StackProfiler
+
+
+def _inner():
+    return sum(range(1000))
+
+
+def _outer():
+    return _inner()
+
+
+@pytest.fixture(autouse=True)
+def stop_tracing_allocations():
+    yield
+    tracemalloc.stop()
+
+
+@pytest.fixture
+def payment_service_mock(mocker):
+    return mocker.patch('payments.serializers.PaymentService')
+
+
+def test_stack_profiler_collects_full_stacks():
+    profiler = StackProfiler()
+
+    result = profiler.run(_outer)
+
+    assert result == sum(range(1000))
+    stacks = list(profiler.wall)
+    assert 'app.tests.test_profiling:_outer' in stacks
+    assert 'app.tests.test_profiling:_outer;app.tests.test_profiling:_inner' in stacks
+    assert set(profiler.cpu) == set(profiler.wall)
+
+
+def test_request_profiler_aggregates_and_dumps(tmp_path):
+    profiler = RequestProfiler(str(tmp_path), sample_rate=1.0, dump_every=0)
+
+    for _ in range(2):
+        profiler.profile('/tokenise', _outer)
+    profiler.dump()
+
+    pid = os.getpid()
+    assert (tmp_path / f'{pid}.tokenise.cpu.collapsed').exists()
+    for line in (tmp_path / f'{pid}.tokenise.wall.collapsed').read_text().splitlines():
+        stack, value = line.rsplit(' ', 1)
+        assert stack
+        assert int(value) > 0
+
+
+def test_request_profiler_toggle(tmp_path):
+    profiler = RequestProfiler(str(tmp_path))
+    assert not profiler.should_sample()
+
+    profiler.toggle()
+    assert profiler.active
+    assert profiler.should_sample()  # sample rate defaults to every request
+
+    profiler.toggle()
+    assert not profiler.active
+
+
+def test_profiling_middleware_disabled(api, settings, tmp_path, payment_service_mock, make_random_str):
+    settings.PROFILING_OUTPUT_DIR = str(tmp_path)
+    payment_service_mock.tokenize.return_value = make_random_str()
+    data = {'card_number': make_random_str(16, digits=True), 'expiry_date': '12/2020'}
+
+    response = api.post('/tokenise', data=data, format='json')
+
+    assert response.status_code == 200
+    assert not os.listdir(tmp_path)
+
+
+def test_profiling_middleware_samples_requests(api, settings, tmp_path, payment_service_mock,
+                                               make_random_str):
+    settings.PROFILING_OUTPUT_DIR = str(tmp_path)
+    settings.PROFILING_SAMPLE_RATE = 1.0
+    settings.PROFILING_DUMP_EVERY = 1
+    token = make_random_str()
+    payment_service_mock.tokenize.return_value = token
+    data = {'card_number': make_random_str(16, digits=True), 'expiry_date': '12/2020'}
+
+    response = api.post('/tokenise', data=data, format='json')
+
+    assert response.status_code == 200
+    assert response.data == {'token': token}
+    wall_profile = (tmp_path / f'{os.getpid()}.tokenise.wall.collapsed').read_text()
+    assert 'app.views:post' in wall_profile
+
+
+def _allocate():
+    return [bytearray(1024) for _ in range(100)]
+
+
+def test_request_profiler_traces_allocations_while_active(tmp_path):
+    assert not tracemalloc.is_tracing()
+    profiler = RequestProfiler(str(tmp_path), dump_every=0)
+
+    profiler.toggle()
+    assert tracemalloc.is_tracing()
+    kept = profiler.profile('/tokenise', _allocate)
+    profiler.profile('/tokenise', _allocate)  # one request doesn't stop tracing for another
+    assert tracemalloc.is_tracing()
+    profiler.toggle()
+
+    assert not tracemalloc.is_tracing()
+    allocations = profiler._stacks[('/tokenise', 'alloc')]
+    assert sum(allocations.values()) >= 100 * 1024
+    assert len(kept) == 100
+
+
+def test_toggle_profiling_command(settings, mocker):
+    settings.PROFILING_SIGNAL = 'SIGUSR2'
+    kill_mock = mocker.patch('app.management.commands.toggle_profiling.os.kill')
+    out = io.StringIO()
+
+    call_command('toggle_profiling', '123', stdout=out)
+
+    kill_mock.assert_called_once_with(123, signal.SIGUSR2)
+    assert 'Sent SIGUSR2 to 123' in out.getvalue()
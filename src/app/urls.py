@@ -5,9 +5,10 @@ The `urlpatterns` list routes URLs to views.
 """
 from django.urls import path
 
-from payments.views import TokenizeView, SaleView
+from payments.views import AuthorizeView, TokenizeView, SaleView
 
 urlpatterns = [
     path('tokenise', TokenizeView.as_view()),
     path('sale', SaleView.as_view()),
+    path('authorize', AuthorizeView.as_view()),
 ]
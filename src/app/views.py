@@ -1,12 +1,83 @@
+from typing import Optional
+
 from rest_framework import status
+from rest_framework.exceptions import APIException
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from app.admission import (
+    ADMITTED_ENVIRON_KEY, REQUEST_START_HEADER, get_admission_control,
+)
+from payments.service import PaymentService
+
+
+# merchant that request is made on behalf of (see `BRAINTREE_CREDENTIALS_FILE`),
+# must be authenticated with its client key: `Authorization: Bearer <key>`
+MERCHANT_ID_HEADER = 'HTTP_X_MERCHANT_ID'
+AUTHORIZATION_HEADER = 'HTTP_AUTHORIZATION'
+
+
+def get_client_ip(environ) -> Optional[str]:
+    """
+    Address of client: the last one in `X-Forwarded-For` (appended by our
+    nginx, previous ones are sent by client and can't be trusted) or peer
+    address if request didn't come through proxy.
+    """
+    forwarded_for = environ.get('HTTP_X_FORWARDED_FOR')
+    if forwarded_for:
+        return forwarded_for.rsplit(',', 1)[-1].strip()
+
+    return environ.get('REMOTE_ADDR') or None
+
+
+def authenticate_merchant(environ) -> Optional[str]:
+    """
+    Merchant that request is made on behalf of. Merchant id is taken from
+    `X-Merchant-Id` header only along with client key of that merchant
+    (`Authorization: Bearer <key>`), so nobody can make payments with
+    credentials of another merchant.
+    :raise MerchantNotAuthenticated: if client key is missing or wrong
+    :return: merchant id or None if request is made with default credentials
+    """
+    merchant_id = environ.get(MERCHANT_ID_HEADER)
+    if not merchant_id:
+        return None
+
+    scheme, _, client_key = environ.get(AUTHORIZATION_HEADER, '').partition(' ')
+    if scheme.lower() != 'bearer' or not PaymentService.authenticate_merchant(
+        merchant_id, client_key.strip(),
+    ):
+        raise MerchantNotAuthenticated()
+
+    return merchant_id
+
+
+class MerchantNotAuthenticated(APIException):
+    """
+    Not based on `NotAuthenticated`, since DRF turns it into 403 for views
+    without authentication classes.
+    """
+    status_code = status.HTTP_401_UNAUTHORIZED
+    default_detail = 'Valid client key of merchant was not provided.'
+    default_code = 'not_authenticated'
+    auth_header = 'Bearer'  # rendered as `WWW-Authenticate` header
+
+
+class ServiceOverloaded(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Service is overloaded, try again later.'
+    default_code = 'service_overloaded'
+
+    def __init__(self, wait: int, detail=None, code=None):
+        super().__init__(detail, code)
+        self.wait = wait  # rendered as `Retry-After` header
+
 
 class ExecutePOSTView(APIView):
     """
     Base view that handle POST request. It validates request data by serializer
-    and execute action (create) from serializer skipping auth.
+    and execute action (create) from serializer. The only authentication is
+    the one of merchant that request is made on behalf of.
     """
 
     @property
@@ -16,14 +87,41 @@ class ExecutePOSTView(APIView):
         """
         raise NotImplementedError('serializer_class attribute must be specified')
 
+    def initial(self, request, *args, **kwargs):
+        """
+        Shed request that spent too long in queue before anything else is
+        done for it (see `app.admission`), unless it's already admitted by
+        fast lane.
+        """
+        admission_control = get_admission_control()
+        if request.META.get(ADMITTED_ENVIRON_KEY):
+            admission_control = None
+
+        if admission_control is not None and admission_control.should_shed(
+            request.path_info, request.META.get(REQUEST_START_HEADER),
+        ):
+            raise ServiceOverloaded(admission_control.retry_after)
+
+        super().initial(request, *args, **kwargs)
+
     def post(self, request, *args, **kwargs):
-        serializer = self.serializer_class(data=request.data)
+        serializer = self.serializer_class(
+            data=request.data, context=self.get_serializer_context(),
+        )
         serializer.is_valid(raise_exception=True)
         serializer.save()
         return Response(serializer.data, status=status.HTTP_200_OK)
 
-    def perform_authentication(self, *args, **kwargs):
+    def get_serializer_context(self) -> dict:
+        return {
+            'merchant_id': self.merchant_id,
+            'client_ip': get_client_ip(self.request.META),
+        }
+
+    def perform_authentication(self, request):
         """
-        Overridden just to skip default authentication behavior since we don't
-        need it in this app.
+        Overridden to authenticate merchant (see `authenticate_merchant`)
+        instead of default authentication behavior, since there are no users
+        in this app.
         """
+        self.merchant_id = authenticate_merchant(request.META)
@@ -5,8 +5,16 @@ It exposes the WSGI callable as a module-level variable named ``application``.
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
 application = get_wsgi_application()
+
+if settings.FAST_LANE_ENABLED:
+    from app.fastlane import FastLaneApplication  # requires django to be set up
+
+    application = FastLaneApplication(
+        application, max_body_size=settings.FAST_LANE_MAX_BODY_SIZE,
+    )
@@ -0,0 +1,79 @@
+"""
+JSON vs MessagePack vs CBOR: bytes on the wire and server CPU per request
+(full Django/DRF stack, PSP replaced with a stub) and cost of parsing and
+rendering alone.
+
+    $ python -m benchmarks.bench_binary_formats [iterations]
+"""
+import json
+import logging
+import sys
+import time
+from functools import partial
+
+import cbor2
+import msgpack
+
+from benchmarks.common import call_wsgi, make_stub_gateway, measure, setup_django
+
+
+FORMATS = {
+    'json': ('application/json', lambda data: json.dumps(data).encode(), json.loads),
+    'msgpack': ('application/msgpack', msgpack.packb, msgpack.unpackb),
+    'cbor': ('application/cbor', cbor2.dumps, cbor2.loads),
+}
+REQUESTS = {
+    '/tokenise': {'card_number': '4111111111111111', 'expiry_date': '12/2030'},
+    '/sale': {'token': 'stub-token', 'transaction_amount': '100.50'},
+    '/sale (invalid)': {'token': 'stub-token', 'transaction_amount': '100.505'},
+}
+
+
+def cpu_per_request(func, *args, iterations: int) -> float:
+    """
+    :return: CPU time of process per call in microseconds
+    """
+    started_at = time.process_time()
+    for _ in range(iterations):
+        func(*args)
+    return (time.process_time() - started_at) / iterations * 1e6
+
+
+def round_trip(dumps, loads, body: bytes) -> None:
+    """
+    What server does with the codec: parse request and render response.
+    """
+    dumps(loads(body))
+
+
+def main(iterations: int) -> None:
+    application = setup_django()
+    logging.getLogger('django.request').setLevel(logging.ERROR)  # 400 responses
+
+    from payments.service import PaymentService
+
+    PaymentService.gateway = make_stub_gateway()
+
+    print(f'{"request":<28} {"req B":>6} {"resp B":>6} {"wall us":>8} {"cpu us":>8} {"codec us":>9}')
+    for title, data in REQUESTS.items():
+        path = title.split()[0]
+        for name, (media_type, dumps, loads) in FORMATS.items():
+            body = dumps(data)
+            request = partial(
+                call_wsgi, application, path, body, content_type=media_type,
+                HTTP_ACCEPT=media_type,
+            )
+            status, content = request()
+            assert loads(content), status
+
+            wall = measure(request, iterations=iterations)
+            cpu = cpu_per_request(request, iterations=iterations)
+            codec = cpu_per_request(round_trip, dumps, loads, body, iterations=iterations)
+            print(
+                f'{title + " " + name:<28} {len(body):>6} {len(content):>6} '
+                f'{wall["mean"]:>8.1f} {cpu:>8.1f} {codec:>9.2f}',
+            )
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3000)
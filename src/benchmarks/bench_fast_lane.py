@@ -0,0 +1,42 @@
+"""
+Framework overhead per request: full Django/DRF stack vs fast lane.
+PSP is replaced with a stub, so the difference is pure framework cost.
+
+    $ python -m benchmarks.bench_fast_lane [iterations]
+"""
+import sys
+
+from benchmarks.common import (
+    call_wsgi, json_body, make_stub_gateway, measure, print_stats, setup_django,
+)
+
+
+def main(iterations: int) -> None:
+    django_application = setup_django()
+
+    from django.conf import settings
+
+    from app.fastlane import FastLaneApplication
+    from payments.service import PaymentService
+
+    PaymentService.gateway = make_stub_gateway()
+    fast_lane = FastLaneApplication(
+        django_application, max_body_size=settings.FAST_LANE_MAX_BODY_SIZE,
+    )
+    requests = {
+        '/tokenise': json_body({'card_number': '4111111111111111', 'expiry_date': '12/2030'}),
+        '/sale': json_body({'token': 'stub-token', 'transaction_amount': '100.50'}),
+    }
+
+    for path, body in requests.items():
+        assert call_wsgi(django_application, path, body) == call_wsgi(fast_lane, path, body)
+
+        full = measure(call_wsgi, django_application, path, body, iterations=iterations)
+        fast = measure(call_wsgi, fast_lane, path, body, iterations=iterations)
+        print_stats(f'{path} full stack', full)
+        print_stats(f'{path} fast lane', fast)
+        print(f'{path} overhead removed per request: {full["mean"] - fast["mean"]:.1f}us\n')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,70 @@
+"""
+Connection count and latency of Braintree requests at high concurrency:
+HTTP/1.1 without pooling (what `requests.post` does), pooled HTTP/1.1 and
+HTTP/2 multiplexing (`HTTP2Transport`) against local stub servers.
+
+    $ python -m benchmarks.bench_http2 [concurrency] [requests] [delay ms]
+"""
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import requests
+
+from benchmarks.common import setup_django
+from benchmarks.stubs import H2StubServer, HTTP1StubServer
+
+
+def run(post, url: str, concurrency: int, total: int) -> dict:
+    payload = {'query': 'mutation tokenizeCreditCard {}', 'variables': {}}
+
+    def timed_post(_):
+        started_at = time.perf_counter()
+        response = post(url, json=payload, headers={}, timeout=25)
+        assert response.json()['data']
+        return (time.perf_counter() - started_at) * 1e3
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        timings = sorted(executor.map(timed_post, range(total)))
+    elapsed = time.perf_counter() - started_at
+
+    return {
+        'rps': total / elapsed,
+        'p50': statistics.median(timings),
+        'p99': timings[int(len(timings) * 0.99) - 1],
+    }
+
+
+def report(title: str, server, stats: dict) -> None:
+    print(
+        f'{title:<28} connections={server.connections:<6} rps={stats["rps"]:8.1f} '
+        f'p50={stats["p50"]:7.2f}ms p99={stats["p99"]:7.2f}ms',
+    )
+
+
+def main(concurrency: int, total: int, delay: float) -> None:
+    setup_django()
+
+    from payments.gateways.http2 import HTTP2Transport
+
+    with HTTP1StubServer(delay) as server:
+        report('HTTP/1.1 no pooling', server, run(requests.post, server.url, concurrency, total))
+
+    with HTTP1StubServer(delay) as server:
+        client = httpx.Client(limits=httpx.Limits(max_connections=concurrency))
+        report('HTTP/1.1 pooled', server, run(client.post, server.url, concurrency, total))
+        client.close()
+
+    with H2StubServer(delay) as server:
+        transport = HTTP2Transport(max_connections=2, http1=False)
+        report('HTTP/2 multiplexed', server, run(transport.post, server.url, concurrency, total))
+        transport.close()
+
+
+if __name__ == '__main__':
+    args = [float(arg) for arg in sys.argv[1:]]
+    concurrency, total, delay_ms = args + [64, 2000, 20][len(args):]
+    main(int(concurrency), int(total), delay_ms / 1000)
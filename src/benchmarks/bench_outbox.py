@@ -0,0 +1,41 @@
+"""
+Cost of recording sale event on the request path (with and without syncing
+every append to disk) and throughput of publishing to a queue sink.
+
+    $ python -m benchmarks.bench_outbox [iterations]
+"""
+import sys
+import tempfile
+import time
+
+from benchmarks.common import measure, print_stats
+
+
+def main(iterations: int) -> None:
+    from payments.events.outbox import Outbox
+    from payments.events.sinks import QueueSink
+
+    event = {
+        'transaction_id': 'stub-id', 'status': 'SUBMITTED_FOR_SETTLEMENT',
+        'amount': '100.50', 'merchant_id': None,
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for fsync in (False, True):
+            sink = QueueSink(maxsize=0)
+            outbox = Outbox(
+                f'{directory}/outbox-{fsync}.sqlite3', sinks=[sink],
+                batch_size=500, interval=0, fsync=fsync,
+            )
+            stats = measure(outbox.append, 'sale', event, iterations=iterations)
+            print_stats(f'append (fsync={fsync})', stats)
+
+            pending = outbox.lag()['pending']
+            started_at = time.perf_counter()
+            outbox.publish()
+            elapsed = time.perf_counter() - started_at
+            print(f'published {pending} events in {elapsed * 1e3:.1f}ms '
+                  f'({pending / elapsed:.0f} events/s)\n')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,73 @@
+"""
+Latency of the first request to PSP from a fresh worker (cold) vs. the one
+warmed up on boot, and of reconnects with and without TLS session
+resumption. Uses local HTTPS stub on `localhost`, so absolute numbers are
+lower than with real network, but DNS/TCP/TLS costs are still visible.
+
+    $ python -m benchmarks.bench_warm_up [rounds]
+"""
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.common import setup_django
+from benchmarks.stubs import HTTP1StubServer, make_self_signed_cert
+
+
+PAYLOAD = {'query': 'mutation tokenizeCreditCard {}', 'variables': {}}
+
+
+def first_request_ms(transport, url: str) -> float:
+    started_at = time.perf_counter()
+    transport.post(url, json=PAYLOAD, headers={}, timeout=25).close()
+    return (time.perf_counter() - started_at) * 1e3
+
+
+def main(rounds: int) -> None:
+    setup_django()
+
+    from payments.gateways.http1 import KeepAliveTransport
+    from payments.gateways.network import DNSCache, ResumingSSLContext
+
+    def make_context():
+        context = ResumingSSLContext()
+        context.load_verify_locations(certfile)
+        return context
+
+    results = {'cold': [], 'warm': [], 'reconnect, full handshake': [], 'reconnect, resumed': []}
+    with tempfile.TemporaryDirectory() as directory:
+        certfile, keyfile = make_self_signed_cert(directory)
+        with HTTP1StubServer(certfile=certfile, keyfile=keyfile) as server:
+            for _ in range(rounds):
+                transport = KeepAliveTransport(ssl_context=make_context())
+                results['cold'].append(first_request_ms(transport, server.url))
+                transport.close()
+
+                transport = KeepAliveTransport(ssl_context=make_context())
+                transport.warm_up(server.url, connections=1, timeout=25)
+                results['warm'].append(first_request_ms(transport, server.url))
+                transport.close()
+
+                # worker keeps DNS cache, idle connection was dropped
+                dns_cache, context = DNSCache(), make_context()
+                transport = KeepAliveTransport(dns_cache=dns_cache, ssl_context=context)
+                first_request_ms(transport, server.url)
+                transport.close()
+                context.sessions.clear()
+                transport = KeepAliveTransport(dns_cache=dns_cache, ssl_context=context)
+                results['reconnect, full handshake'].append(first_request_ms(transport, server.url))
+                transport.close()
+                transport = KeepAliveTransport(dns_cache=dns_cache, ssl_context=context)
+                results['reconnect, resumed'].append(first_request_ms(transport, server.url))
+                transport.close()
+
+            resumed = server.resumed_sessions
+
+    for title, timings in results.items():
+        print(f'{title:<28} p50={statistics.median(timings):7.2f}ms max={max(timings):7.2f}ms')
+    print(f'TLS sessions resumed by server: {resumed} of {rounds} expected')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
@@ -0,0 +1,116 @@
+"""
+Shared helpers for benchmarks. Benchmarks are plain scripts run from `src`:
+
+    $ python -m benchmarks.bench_fast_lane
+"""
+import io
+import json
+import logging
+import os
+import statistics
+import time
+from decimal import Decimal
+from typing import Callable, Optional
+
+
+def setup_django(**settings_env):
+    """
+    Configure django for benchmarks. Environment variables passed as kwargs
+    override the ones from `.env`. Per-request logging is muted.
+    :return: django WSGI application
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    os.environ.setdefault('BRAINTREE_API_KEY', '')
+    os.environ.setdefault('BRAINTREE_API_URL', '')
+    os.environ.update(settings_env)
+
+    from django.core.wsgi import get_wsgi_application
+
+    application = get_wsgi_application()
+    logging.getLogger('payments').setLevel(logging.WARNING)
+    return application
+
+
+def make_stub_gateway():
+    """
+    Gateway that answers instantly, so benchmarks measure only our code.
+    """
+    from payments.gateways.base import BaseGateway, CaptureResult, SaleResult
+
+    class StubGateway(BaseGateway):
+
+        def tokenize_card(self, card_number: str, expiry_date: str,
+                          merchant_id: Optional[str] = None) -> str:
+            return 'stub-token'
+
+        def sale_by_token(self, token: str, transaction_amount: Decimal,
+                          merchant_id: Optional[str] = None) -> SaleResult:
+            return SaleResult('stub-id', 'SUBMITTED_FOR_SETTLEMENT')
+
+        def authorize_by_token(self, token: str, transaction_amount: Decimal,
+                               merchant_id: Optional[str] = None) -> SaleResult:
+            return SaleResult('stub-id', 'AUTHORIZED')
+
+        def capture_transactions(self, transaction_ids: list,
+                                 merchant_id: Optional[str] = None) -> list:
+            return [
+                CaptureResult(transaction_id, 'SUBMITTED_FOR_SETTLEMENT', None)
+                for transaction_id in transaction_ids
+            ]
+
+    return StubGateway()
+
+
+def call_wsgi(application, path: str, body: bytes,
+              content_type: str = 'application/json', **extra) -> tuple:
+    """
+    Perform POST request to WSGI application in-process.
+    :return: status line and response content
+    """
+    environ = {
+        'REQUEST_METHOD': 'POST',
+        'PATH_INFO': path,
+        'SERVER_NAME': 'benchmark',
+        'SERVER_PORT': '80',
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': io.StringIO(),
+        'CONTENT_TYPE': content_type,
+        'CONTENT_LENGTH': str(len(body)),
+        **extra,
+    }
+    status = []
+    content = b''.join(application(environ, lambda line, headers: status.append(line)))
+    return status[0], content
+
+
+def json_body(data: dict) -> bytes:
+    return json.dumps(data).encode()
+
+
+def measure(func: Callable, *args, iterations: int, warmup: int = 100) -> dict:
+    """
+    Call `func` with `args` repeatedly measuring wall time of every call.
+    :return: latency stats in microseconds
+    """
+    for _ in range(warmup):
+        func(*args)
+
+    timings = []
+    for _ in range(iterations):
+        started_at = time.perf_counter()
+        func(*args)
+        timings.append((time.perf_counter() - started_at) * 1e6)
+
+    timings.sort()
+    return {
+        'mean': statistics.mean(timings),
+        'p50': timings[len(timings) // 2],
+        'p99': timings[int(len(timings) * 0.99) - 1],
+    }
+
+
+def print_stats(title: str, stats: dict) -> None:
+    values = ' '.join(f'{key}={value:9.1f}us' for key, value in stats.items())
+    print(f'{title:<40} {values}')
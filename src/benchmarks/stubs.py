@@ -0,0 +1,162 @@
+"""
+Local stand-ins for Braintree API used by benchmarks. Every server answers
+any POST with `response_body` after `delay` seconds and counts accepted
+connections.
+"""
+import asyncio
+import json
+import os
+import ssl
+import subprocess
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import h2.config
+import h2.connection
+import h2.events
+
+
+TOKENIZE_RESPONSE = {
+    'data': {'tokenizeCreditCard': {'paymentMethod': {'id': 'stub-token'}}},
+    'extensions': {'requestId': 'stub-request'},
+}
+
+
+def make_self_signed_cert(directory: str) -> tuple:
+    """
+    Generate certificate for `localhost` with `openssl` CLI.
+    :return: paths to certificate and key files
+    """
+    certfile = os.path.join(directory, 'cert.pem')
+    keyfile = os.path.join(directory, 'key.pem')
+    subprocess.run([
+        'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+        '-subj', '/CN=localhost', '-addext', 'subjectAltName=DNS:localhost',
+        '-keyout', keyfile, '-out', certfile,
+    ], check=True, capture_output=True)
+    return certfile, keyfile
+
+
+class HTTP1StubServer:
+    """
+    Threaded HTTP/1.1 server with keep-alive support. Serves HTTPS on
+    `localhost` if certificate is provided and counts resumed TLS sessions.
+    """
+
+    def __init__(self, delay: float = 0.0, response_body: dict = TOKENIZE_RESPONSE,
+                 certfile: str = None, keyfile: str = None):
+        self.connections = 0
+        self.resumed_sessions = 0
+        stub = self
+        body = json.dumps(response_body).encode()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                stub.connections += 1
+                if getattr(self.connection, 'session_reused', False):
+                    stub.resumed_sessions += 1
+
+            def do_POST(self):  # noqa: N802
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                time.sleep(delay)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_HEAD(self):  # noqa: N802
+                self.send_response(405)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        ThreadingHTTPServer.request_queue_size = 1024
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        port = self.server.server_address[1]
+        if certfile:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile, keyfile)
+            self.server.socket = context.wrap_socket(self.server.socket, server_side=True)
+            self.url = f'https://localhost:{port}/graphql'
+        else:
+            self.url = f'http://127.0.0.1:{port}/graphql'
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class H2StubServer:
+    """
+    HTTP/2 server over plain-text connections (clients must use prior
+    knowledge), running asyncio loop in a background thread.
+    """
+
+    def __init__(self, delay: float = 0.0, response_body: dict = TOKENIZE_RESPONSE):
+        self.connections = 0
+        self.delay = delay
+        self.body = json.dumps(response_body).encode()
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(
+            self.loop.create_server(lambda: _H2Protocol(self), '127.0.0.1', 0),
+        )
+        self.url = f'http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}/graphql'
+
+    def __enter__(self):
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+class _H2Protocol(asyncio.Protocol):
+
+    def __init__(self, stub: H2StubServer):
+        self.stub = stub
+        self.transport = None
+        self.connection = h2.connection.H2Connection(
+            config=h2.config.H2Configuration(client_side=False),
+        )
+
+    def connection_made(self, transport):
+        self.stub.connections += 1
+        self.transport = transport
+        self.connection.initiate_connection()
+        self.transport.write(self.connection.data_to_send())
+
+    def data_received(self, data: bytes):
+        for event in self.connection.receive_data(data):
+            if isinstance(event, h2.events.DataReceived):
+                self.connection.acknowledge_received_data(
+                    event.flow_controlled_length, event.stream_id,
+                )
+            elif isinstance(event, h2.events.StreamEnded):
+                self.stub.loop.call_later(self.stub.delay, self._respond, event.stream_id)
+
+        self.transport.write(self.connection.data_to_send())
+
+    def _respond(self, stream_id: int):
+        if self.transport.is_closing():
+            return
+
+        self.connection.send_headers(stream_id, [
+            (':status', '200'),
+            ('content-type', 'application/json'),
+            ('content-length', str(len(self.stub.body))),
+        ])
+        self.connection.send_data(stream_id, self.stub.body, end_stream=True)
+        self.transport.write(self.connection.data_to_send())
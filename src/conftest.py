@@ -1,9 +1,13 @@
+import hashlib
+import json
 import random
 import string
 
 import pytest
 from rest_framework.test import APIClient
 
+from payments.credentials import FileCredentialStore
+
 
 @pytest.fixture
 def make_random_str():
@@ -17,3 +21,19 @@ def make_random_str():
 @pytest.fixture
 def api():
     return APIClient()
+
+
+@pytest.fixture
+def merchant_credential_store(tmp_path, mocker):
+    """
+    Credentials of `merchant-a` (client key `client-key-a`) used by
+    `PaymentService`.
+    """
+    path = tmp_path / 'merchant_credentials.json'
+    path.write_text(json.dumps({'merchant-a': {
+        'api_key': 'key-a',
+        'client_key_sha256': hashlib.sha256(b'client-key-a').hexdigest(),
+    }}))
+    store = FileCredentialStore(str(path), reload_interval=0)
+    mocker.patch('payments.service.PaymentService.credential_store', store)
+    return store
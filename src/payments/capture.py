@@ -0,0 +1,221 @@
+import logging
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+from payments.gateways.base import CaptureResult
+from payments.workqueue import LeasedQueue
+
+
+logger = logging.getLogger(__name__)
+
+
+class CaptureScheduler(LeasedQueue):
+    """
+    Collects authorized transactions and captures them in batches of up to
+    `batch_size` every `interval` seconds (or as soon as a full batch is
+    collected) in a background thread, off the request path.
+
+    Batches are formed per merchant, since transactions are captured with
+    credentials of merchant that authorized them.
+
+    Transactions that PSP failed to capture are retried with exponential
+    backoff until `max_attempts` are made, then they are kept as failed
+    (see `failed`). When capture fails as a whole (PSP is down, credentials
+    are rejected), the batch is captured again after backoff without using
+    up attempts of its transactions.
+
+    Pending transactions are stored before `schedule` returns, so they
+    survive crash or restart of worker and are captured by any worker
+    later (see `LeasedQueue`). Transaction may be captured twice if its
+    worker dies during capture (the second capture just fails).
+    """
+    SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS pending_captures (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        transaction_id TEXT NOT NULL,
+        merchant_id TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        available_at REAL NOT NULL DEFAULT 0,
+        error TEXT
+    )
+    """
+    TABLE = 'pending_captures'
+    THREAD_NAME = 'capture-scheduler'
+    MAX_FAILED_SHOWN = 100
+
+    def __init__(self, path: str,
+                 capture: Callable[[List[str], Optional[str]], List[CaptureResult]],
+                 batch_size: int = 50, interval: float = 5.0, max_attempts: int = 3,
+                 lease: float = 60, max_backoff: float = 300, fsync: bool = False):
+        """
+        :param capture: function that captures transactions of merchant
+        in bulk (`BaseGateway.capture_transactions` interface)
+        :param interval: seconds between runs; if 0, there's no background
+        thread and `flush` should be called explicitly
+        """
+        super().__init__(
+            path, batch_size=batch_size, interval=interval, lease=lease,
+            max_backoff=max_backoff, fsync=fsync,
+        )
+        self.capture = capture
+        self.max_attempts = max_attempts
+        self.stats = Counter()  # captured, retried, failed, batches, failed_batches, schedule_failed
+        self._flush_lock = threading.Lock()
+
+    @property
+    def pending_count(self) -> int:
+        return self._get_connection().execute(
+            'SELECT COUNT(*) FROM pending_captures WHERE error IS NULL',
+        ).fetchone()[0]
+
+    @property
+    def failed(self) -> Dict[str, str]:
+        """
+        Transactions that could not be captured (the latest
+        `MAX_FAILED_SHOWN` ones) mapped to the last error.
+        """
+        rows = self._get_connection().execute(
+            'SELECT transaction_id, error FROM pending_captures '
+            'WHERE error IS NOT NULL ORDER BY id DESC LIMIT ?',
+            (self.MAX_FAILED_SHOWN,),
+        ).fetchall()
+        return dict(reversed(rows))
+
+    def schedule(self, transaction_id: str,
+                 merchant_id: Optional[str] = None) -> bool:
+        """
+        Add authorized transaction to the next capture batch. Failure to
+        store transaction is not raised (it's authorized at this point
+        anyway), but logged with transaction id to capture it manually.
+        :param merchant_id: merchant that authorized transaction (None if
+        it was authorized with default credentials)
+        :return: whether transaction is stored
+        """
+        try:
+            self._get_connection().execute(
+                'INSERT INTO pending_captures (transaction_id, merchant_id) VALUES (?, ?)',
+                (transaction_id, merchant_id),
+            )
+        except sqlite3.Error:
+            self.stats['schedule_failed'] += 1
+            logger.exception(
+                'Could not schedule capture of transaction with id=%s (merchant %s)',
+                transaction_id, merchant_id,
+            )
+            return False
+
+        self._added()
+        return True
+
+    def flush(self) -> None:
+        """
+        Capture all transactions available at the moment of call. Retried
+        transactions are captured by one of the following flushes, once
+        their backoff passes. Flush stops at the first batch that fails
+        as a whole.
+        """
+        with self._flush_lock:
+            last_id = self._get_connection().execute(
+                'SELECT MAX(id) FROM pending_captures',
+            ).fetchone()[0]
+            while last_id is not None:
+                merchant_id, batch = self._claim_batch(last_id)
+                if not batch or not self._capture_batch(batch, merchant_id):
+                    return
+
+    def _claim_batch(self, last_id: int) -> Tuple[Optional[str], list]:
+        """
+        Claim up to `batch_size` of the oldest available transactions (not
+        newer than `last_id`) of merchant of the oldest one.
+        :return: merchant and ids, transaction ids and attempts of claimed
+        transactions
+        """
+        available = 'error IS NULL AND available_at <= ?1 AND id <= ?2'
+        rows = self._claim(
+            'SELECT id, transaction_id, attempts, merchant_id FROM pending_captures '
+            f'WHERE {available} AND merchant_id IS ('
+            f'SELECT merchant_id FROM pending_captures WHERE {available} ORDER BY id LIMIT 1'
+            ') ORDER BY id LIMIT ?3',
+            (last_id, self.batch_size),
+        )
+        if not rows:
+            return None, []
+
+        return rows[0][3], [row[:3] for row in rows]
+
+    def _capture_batch(self, batch: list, merchant_id: Optional[str]) -> bool:
+        """
+        Capture batch and record outcome of every transaction: captured ones
+        are deleted, failed ones are scheduled again as new entries after
+        backoff (or marked as failed when they run out of attempts).
+        Any exception fails the whole batch: it's released after backoff
+        with attempts intact.
+        :return: whether batch is captured (even if some transactions failed)
+        """
+        transaction_ids = [transaction_id for _, transaction_id, _ in batch]
+        self.stats['batches'] += 1
+        try:
+            results = {
+                result.id: result
+                for result in self.capture(transaction_ids, merchant_id)
+            }
+        except Exception as exception:
+            self._failures += 1
+            self.stats['failed_batches'] += 1
+            logger.warning(
+                'Capture of %s transaction(s) failed: %s', len(batch), exception,
+                exc_info=True,
+            )
+            self._execute_for_ids(
+                'UPDATE pending_captures SET available_at = ? WHERE id IN ({})',
+                [row_id for row_id, _, _ in batch],
+                time.time() + self._get_backoff(self._failures),
+            )
+            return False
+
+        self._failures = 0
+        now = time.time()
+        captured, retried, failed = [], [], []
+        for row_id, transaction_id, attempts in batch:
+            result = results.get(transaction_id)
+            error = result.error if result else 'Capture result is missing'
+            if error is None:
+                captured.append((row_id,))
+            elif attempts + 1 < self.max_attempts:
+                retried.append((
+                    row_id, transaction_id, merchant_id, attempts + 1,
+                    now + self._get_backoff(attempts + 1),
+                ))
+            else:
+                failed.append((error, row_id))
+                logger.error(
+                    'Could not capture transaction with id=%s: %s',
+                    transaction_id, error,
+                )
+
+        connection = self._get_connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.executemany('DELETE FROM pending_captures WHERE id = ?', captured)
+            connection.executemany(
+                'DELETE FROM pending_captures WHERE id = ?', [row[:1] for row in retried],
+            )
+            connection.executemany(
+                'INSERT INTO pending_captures '
+                '(transaction_id, merchant_id, attempts, available_at) VALUES (?, ?, ?, ?)',
+                [row[1:] for row in retried],
+            )
+            connection.executemany(
+                'UPDATE pending_captures SET error = ? WHERE id = ?', failed,
+            )
+
+        self.stats['captured'] += len(captured)
+        self.stats['retried'] += len(retried)
+        self.stats['failed'] += len(failed)
+        return True
+
+    def _process(self) -> None:
+        self.flush()
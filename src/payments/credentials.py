@@ -0,0 +1,191 @@
+"""
+Stores of PSP credentials of merchants. Credentials are loaded into memory
+(so lookups are dict lookups) and reloaded once their source changes.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from typing import Dict, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+Credentials = namedtuple(
+    'Credentials', ('api_key', 'api_url', 'client_key_sha256'), defaults=(None,),
+)
+"""
+PSP credentials of merchant. `api_url` is None if default one should be used.
+`client_key_sha256` is SHA-256 hex digest of key that merchant authenticates
+its requests to us with (requests can't be made on behalf of merchant
+without it).
+"""
+
+
+class CredentialStore:
+    """
+    Base class for stores that keep credentials of all merchants in memory.
+    Source is checked for changes (by its modification time) not more often
+    than once in `reload_interval` seconds during lookups and is reloaded
+    if it has changed, so new and rotated credentials are picked up without
+    restart of worker. If reload fails, previously loaded credentials are
+    kept.
+
+    Lookups don't take locks: reload replaces the whole mapping at once.
+    """
+    SQLITE_SUFFIXES = ('.db', '.sqlite', '.sqlite3')
+
+    def __init__(self, path: str, reload_interval: float = 5.0):
+        """
+        :param reload_interval: seconds between checks of source for
+        changes; if 0, credentials are reloaded only by `reload` call
+        """
+        self.path = path
+        self.reload_interval = reload_interval
+        self._credentials = {}  # merchant id -> Credentials
+        self._version = None
+        self._next_check = math.inf if not reload_interval else 0
+        self._reload_lock = threading.Lock()
+        self.reload()
+
+    @classmethod
+    def from_path(cls, path: str, reload_interval: float = 5.0) -> 'CredentialStore':
+        """
+        Instantiate store for file by its extension: SQLite database or
+        JSON file.
+        """
+        store_class = (
+            SQLiteCredentialStore if path.endswith(cls.SQLITE_SUFFIXES)
+            else FileCredentialStore
+        )
+        return store_class(path, reload_interval=reload_interval)
+
+    def __len__(self) -> int:
+        return len(self._credentials)
+
+    def get(self, merchant_id: str) -> Optional[Credentials]:
+        """
+        :return: credentials of merchant or None if there's none
+        """
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.reload_interval
+            self._reload_if_changed()
+
+        return self._credentials.get(merchant_id)
+
+    def authenticate(self, merchant_id: str, client_key: Optional[str]) -> bool:
+        """
+        Check that client key is the one of merchant.
+        :return: whether merchant is known and key matches its digest
+        """
+        credentials = self.get(merchant_id)
+        if credentials is None or not credentials.client_key_sha256 or not client_key:
+            return False
+
+        digest = hashlib.sha256(client_key.encode()).hexdigest()
+        return hmac.compare_digest(digest, credentials.client_key_sha256.lower())
+
+    def reload(self) -> None:
+        """
+        Load credentials from source.
+        :raise OSError, ValueError: if source can't be read or parsed
+        """
+        with self._reload_lock:
+            version = self._get_version()
+            self._credentials = self._load()
+            self._version = version
+
+        logger.info('Loaded credentials of %s merchant(s)', len(self._credentials))
+
+    def _reload_if_changed(self) -> None:
+        if self._reload_lock.locked():  # being reloaded by another thread
+            return
+
+        try:
+            if self._get_version() != self._version:
+                self.reload()
+        except (OSError, ValueError):
+            logger.exception('Could not reload credentials from %s', self.path)
+
+    def _get_version(self) -> Tuple:
+        """
+        :return: value that changes whenever source is modified
+        """
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load(self) -> Dict[str, Credentials]:
+        raise NotImplementedError
+
+
+class FileCredentialStore(CredentialStore):
+    """
+    Credentials stored in JSON file:
+    `{"<merchant id>": {"api_key": "...", "api_url": "...",
+    "client_key_sha256": "..."}}` (`api_url` and `client_key_sha256` are
+    optional).
+    """
+
+    def _load(self) -> Dict[str, Credentials]:
+        with open(self.path) as file:
+            data = json.load(file)
+
+        try:
+            return {
+                str(merchant_id): Credentials(
+                    entry['api_key'], entry.get('api_url'), entry.get('client_key_sha256'),
+                )
+                for merchant_id, entry in data.items()
+            }
+        except (AttributeError, KeyError, TypeError) as exception:
+            raise ValueError(f'Invalid credentials file: {exception!r}')
+
+
+class SQLiteCredentialStore(CredentialStore):
+    """
+    Credentials stored in `merchant_credentials` table of SQLite database
+    (see `CREATE_TABLE_SQL`). Changes committed in WAL mode are detected
+    by modification of WAL file as well.
+    """
+    CREATE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS merchant_credentials (
+        merchant_id TEXT PRIMARY KEY,
+        api_key TEXT NOT NULL,
+        api_url TEXT,
+        client_key_sha256 TEXT
+    )
+    """
+
+    def _get_version(self) -> Tuple:
+        version = super()._get_version()
+        try:
+            wal_stat = os.stat(f'{self.path}-wal')
+        except FileNotFoundError:
+            return version
+
+        return (*version, wal_stat.st_mtime_ns, wal_stat.st_size)
+
+    def _load(self) -> Dict[str, Credentials]:
+        try:
+            connection = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True)
+            try:
+                rows = connection.execute(
+                    'SELECT merchant_id, api_key, api_url, client_key_sha256 '
+                    'FROM merchant_credentials',
+                ).fetchall()
+            finally:
+                connection.close()
+        except sqlite3.Error as exception:
+            raise ValueError(f'Invalid credentials database: {exception}')
+
+        return {
+            merchant_id: Credentials(*credentials)
+            for merchant_id, *credentials in rows
+        }
@@ -0,0 +1,304 @@
+import json
+import logging
+import sqlite3
+import time
+import uuid
+from collections import Counter
+from typing import Dict, List, Optional
+
+from payments.events.sinks import BaseSink, PermanentSinkError, SinkError
+from payments.workqueue import LeasedQueue
+
+
+logger = logging.getLogger(__name__)
+
+
+class Outbox(LeasedQueue):
+    """
+    Durable log of payment events drained to sinks by a background thread,
+    so publishing never adds latency or failures to the request path.
+    Events are stored and claimed as described in `LeasedQueue`.
+
+    Publisher of every process claims batches of up to `batch_size` events,
+    publishes them to all sinks and deletes them. Batches that failed (or
+    whose publisher died) are claimed again later, so delivery is
+    at-least-once and consumers should deduplicate events by `event_id`.
+    When sinks fail, publisher backs off exponentially (up to `max_backoff`
+    seconds) instead of hammering them, while events pile up in the log.
+    Log is bounded: once publisher finds more than `max_pending` events
+    waiting (see `lag`), the outbox is `full` and new events are logged and
+    dropped instead of being stored, until publisher drains it.
+
+    Events are moved to dead letters (`outbox_dead` table), so they don't
+    block the rest, when sink rejects them (`PermanentSinkError`, rejected
+    batch is split in halves until rejected events are found) or when
+    their batch fails `max_attempts` times. Dead letters are published again
+    only when requeued (see `requeue_dead`).
+    """
+    SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        payload TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        available_at REAL NOT NULL DEFAULT 0,
+        attempts INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS outbox_dead (
+        id INTEGER PRIMARY KEY,
+        payload TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        attempts INTEGER NOT NULL,
+        error TEXT NOT NULL
+    );
+    """
+    TABLE = 'outbox'
+    THREAD_NAME = 'outbox-publisher'
+
+    def __init__(self, path: str, sinks: List[BaseSink], batch_size: int = 100,
+                 interval: float = 1.0, lease: float = 30, max_backoff: float = 60,
+                 max_pending: int = 1000000, max_attempts: int = 20, fsync: bool = False):
+        """
+        :param interval: seconds between runs of publisher; if 0, there's no
+        background thread and `publish` should be called explicitly
+        """
+        super().__init__(
+            path, batch_size=batch_size, interval=interval, lease=lease,
+            max_backoff=max_backoff, fsync=fsync,
+        )
+        self.sinks = sinks
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.full = False  # as of the last check of publisher of this process
+        self.stats = Counter()  # appended, append_failed, dropped, published, batches, failed_batches, corrupt, dead
+
+    @property
+    def dead_count(self) -> int:
+        return self._get_connection().execute('SELECT COUNT(*) FROM outbox_dead').fetchone()[0]
+
+    def append(self, event_type: str, data: dict) -> Optional[str]:
+        """
+        Store event to be published. Failure to store event (or outbox
+        being full) is not raised (payment is done at this point anyway),
+        but logged with event data.
+        :return: id of event or None if it could not be stored
+        """
+        event = {
+            'event_id': uuid.uuid4().hex,
+            'type': event_type,
+            'created_at': time.time(),
+            **data,
+        }
+        payload = json.dumps(event, separators=(',', ':'), default=str)
+        if self.full:
+            self.stats['dropped'] += 1
+            logger.error('Outbox is full, dropped event: %s', payload)
+            return None
+
+        try:
+            self._get_connection().execute(
+                'INSERT INTO outbox (payload, created_at) VALUES (?, ?)',
+                (payload, event['created_at']),
+            )
+        except sqlite3.Error:
+            self.stats['append_failed'] += 1
+            logger.exception('Could not store event in outbox: %s', payload)
+            return None
+
+        self.stats['appended'] += 1
+        self._added()
+
+        return event['event_id']
+
+    def publish(self) -> int:
+        """
+        Publish pending events in batches until there are none left.
+        Events that can't be parsed are logged and deleted instead of being
+        published, so they don't block the rest.
+        :raise SinkError: if batch could not be published (it's published
+        again after backoff)
+        :return: number of published events
+        """
+        published = 0
+        while True:
+            batch = self._claim_batch()
+            if not batch:
+                return published
+
+            events = self._parse_events(batch)
+            self.stats['batches'] += 1
+            try:
+                rejected = self._publish_events(events) if events else {}
+            except Exception as exception:
+                self.stats['failed_batches'] += 1
+                self._release_batch(batch, exception)
+                raise
+
+            connection = self._get_connection()
+            with connection:
+                connection.execute('BEGIN IMMEDIATE')
+                self._move_to_dead(list(rejected.items()))
+                self._execute_for_ids(
+                    'DELETE FROM outbox WHERE id IN ({})', [row[0] for row in batch],
+                )
+
+            published += len(events) - len(rejected)
+            self.stats['published'] += len(events) - len(rejected)
+
+    def requeue_dead(self) -> int:
+        """
+        Move dead letters back to outbox to be published again.
+        :return: number of requeued events
+        """
+        connection = self._get_connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute(
+                'INSERT INTO outbox (payload, created_at) '
+                'SELECT payload, created_at FROM outbox_dead ORDER BY id',
+            )
+            return connection.execute('DELETE FROM outbox_dead').rowcount
+
+    def lag(self) -> dict:
+        """
+        Computed from the range of ids, so it's cheap however long the log
+        is, but `pending` is approximate: events published out of order
+        (while older ones wait for retry) are still counted.
+        :return: number of events waiting for publishing (`pending`) and
+        age of the oldest one in seconds (`oldest_age`)
+        """
+        connection = self._get_connection()
+        first_id, last_id = connection.execute('SELECT MIN(id), MAX(id) FROM outbox').fetchone()
+        if first_id is None:
+            return {'pending': 0, 'oldest_age': 0.0}
+
+        oldest, = connection.execute(
+            'SELECT created_at FROM outbox WHERE id = ?', (first_id,),
+        ).fetchone()
+        return {
+            'pending': last_id - first_id + 1,
+            'oldest_age': time.time() - oldest,
+        }
+
+    def _claim_batch(self) -> list:
+        """
+        Claim the oldest available events.
+        :return: ids, payloads and attempts of events
+        """
+        return self._claim(
+            'SELECT id, payload, attempts FROM outbox WHERE available_at <= ?1 ORDER BY id LIMIT ?2',
+            (self.batch_size,),
+        )
+
+    def _parse_events(self, batch: list) -> List[tuple]:
+        """
+        :return: ids and events of batch, except for the corrupt ones
+        """
+        events = []
+        for event_id, payload, _ in batch:
+            try:
+                events.append((event_id, json.loads(payload)))
+            except ValueError:
+                self.stats['corrupt'] += 1
+                logger.error('Dropped corrupt event %s from outbox: %r', event_id, payload)
+
+        return events
+
+    def _publish_events(self, events: List[tuple]) -> Dict[int, str]:
+        """
+        Publish events to all sinks. If sink rejects them, halves of events
+        are published separately (so they may be published to other sinks
+        more than once) until rejected events are found.
+        :param events: ids and events
+        :return: ids of rejected events mapped to errors
+        """
+        try:
+            for sink in self.sinks:
+                sink.publish([event for _, event in events])
+        except PermanentSinkError as exception:
+            if len(events) == 1:
+                return {events[0][0]: str(exception)}
+
+            middle = len(events) // 2
+            return {
+                **self._publish_events(events[:middle]),
+                **self._publish_events(events[middle:]),
+            }
+
+        return {}
+
+    def _release_batch(self, batch: list, exception: Exception) -> None:
+        """
+        Make failed events available again after backoff, or move them to
+        dead letters once they run out of attempts.
+        """
+        dead = [
+            (row_id, str(exception)) for row_id, _, attempts in batch
+            if attempts + 1 >= self.max_attempts
+        ]
+        retried = [row_id for row_id, _, attempts in batch if attempts + 1 < self.max_attempts]
+        connection = self._get_connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            self._move_to_dead(dead)
+            if retried:
+                self._execute_for_ids(
+                    'UPDATE outbox SET available_at = ?, attempts = attempts + 1 '
+                    'WHERE id IN ({})',
+                    retried, time.time() + self._get_backoff(self._failures + 1),
+                )
+
+    def _move_to_dead(self, errors: List[tuple]) -> None:
+        """
+        Move events to dead letters (within transaction of caller).
+        :param errors: ids of events and errors they failed with
+        """
+        if not errors:
+            return
+
+        for row_id, error in errors:
+            logger.error('Moved event %s of outbox to dead letters: %s', row_id, error)
+
+        connection = self._get_connection()
+        connection.executemany(
+            'INSERT INTO outbox_dead (id, payload, created_at, attempts, error) '
+            'SELECT id, payload, created_at, attempts + 1, ? FROM outbox WHERE id = ?',
+            [(error, row_id) for row_id, error in errors],
+        )
+        connection.executemany(
+            'DELETE FROM outbox WHERE id = ?', [(row_id,) for row_id, _ in errors],
+        )
+        self.stats['dead'] += len(errors)
+
+    def _check_lag(self) -> None:
+        """
+        Update whether outbox is `full`, logging only changes of it (rather
+        than every check of publisher of every process).
+        """
+        lag = self.lag()
+        full = lag['pending'] > self.max_pending
+        if full and not self.full:
+            logger.error(
+                'Outbox is full: %s events pending, the oldest is %.1fs old, '
+                'new events are dropped',
+                lag['pending'], lag['oldest_age'],
+            )
+        elif self.full and not full:
+            logger.warning('Outbox is drained: %s events pending', lag['pending'])
+        self.full = full
+
+    def _process(self) -> None:
+        try:
+            self.publish()
+        except SinkError as exception:
+            self._failures += 1
+            logger.warning('Could not publish events: %s', exception)
+        except Exception:
+            self._failures += 1
+            logger.exception('Publishing of events failed')
+        else:
+            self._failures = 0
+
+        try:
+            self._check_lag()
+        except sqlite3.Error:
+            logger.exception('Could not check outbox lag')
@@ -0,0 +1,136 @@
+"""
+Destinations that payment events are published to by `Outbox`.
+"""
+import json
+import os
+import queue
+import threading
+from abc import ABC, abstractmethod
+from typing import List
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+
+class SinkError(RuntimeError):
+    """
+    Events could not be published (and should be published again later).
+    """
+
+
+class PermanentSinkError(SinkError):
+    """
+    Events were rejected by sink, so publishing them again won't help.
+    """
+
+
+class BaseSink(ABC):
+    """
+    Base abstract class for sinks. Sink publishes batch of events as a
+    whole: if it fails, the whole batch is published again later, so events
+    may be delivered more than once and consumers should deduplicate them
+    by `event_id`.
+    """
+
+    @abstractmethod
+    def publish(self, events: List[dict]) -> None:
+        """
+        :raise SinkError: if batch could not be published
+        :raise PermanentSinkError: if batch (some of its events) is rejected
+        """
+
+
+class FileSink(BaseSink):
+    """
+    Appends events as JSON lines to a file (e.g. one collected by log
+    shipper). Batch is synced to disk before it's considered published.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def publish(self, events: List[dict]) -> None:
+        lines = ''.join(
+            json.dumps(event, separators=(',', ':')) + '\n' for event in events
+        )
+        try:
+            with self._lock, open(self.path, 'a') as file:
+                file.write(lines)
+                file.flush()
+                os.fsync(file.fileno())
+        except OSError as exception:
+            raise SinkError(f'Could not write events to {self.path}: {exception}')
+
+
+class HTTPSink(BaseSink):
+    """
+    POSTs batch of events as JSON array to `url` over kept-alive connection.
+    Any response but 2xx fails the batch, 4xx ones (except for 408 and 429)
+    reject it.
+    """
+    RETRYABLE_STATUS_CODES = (408, 429)
+
+    def __init__(self, url: str, timeout: float = 10):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def publish(self, events: List[dict]) -> None:
+        try:
+            response = self.session.post(self.url, json=events, timeout=self.timeout)
+        except (requests.ConnectionError, requests.Timeout) as exception:
+            raise SinkError(f'Could not send events to {self.url}: {exception}')
+
+        if response.ok:
+            return
+
+        if 400 <= response.status_code < 500 and response.status_code not in self.RETRYABLE_STATUS_CODES:
+            raise PermanentSinkError(
+                f'Events were rejected by {self.url}: {response.status_code}',
+            )
+        raise SinkError(
+            f'Could not send events to {self.url}: {response.status_code}',
+        )
+
+
+class QueueSink(BaseSink):
+    """
+    Stand-in for message broker: puts events into bounded in-process queue
+    consumed by other threads (local development, tests, benchmarks).
+    Batch fails if it doesn't fit into the queue (and is rejected if it's
+    larger than the queue).
+    """
+
+    def __init__(self, maxsize: int = 10000):
+        self.queue = queue.Queue(maxsize)
+        self._lock = threading.Lock()
+
+    def publish(self, events: List[dict]) -> None:
+        if self.queue.maxsize and len(events) > self.queue.maxsize:
+            raise PermanentSinkError('Batch is larger than queue')
+
+        with self._lock:
+            if self.queue.maxsize and self.queue.qsize() + len(events) > self.queue.maxsize:
+                raise SinkError('Queue is full')
+
+            for event in events:
+                self.queue.put_nowait(event)
+
+
+def build_sink(url: str) -> BaseSink:
+    """
+    Instantiate sink by URL: `file:///path/to/events.log`,
+    `http(s)://host/path` or `queue://[?maxsize=N]`.
+    :raise ValueError: if URL scheme is not supported
+    """
+    parts = urlsplit(url)
+    if parts.scheme == 'file':
+        return FileSink(parts.path)
+    if parts.scheme in ('http', 'https'):
+        return HTTPSink(url)
+    if parts.scheme == 'queue':
+        maxsize = parse_qs(parts.query).get('maxsize', ['10000'])[0]
+        return QueueSink(int(maxsize))
+
+    raise ValueError(f'Unsupported events sink: {url}')
@@ -1,6 +1,7 @@
 from abc import ABC, abstractmethod
 from collections import namedtuple
 from decimal import Decimal
+from typing import List, Optional
 
 
 class GatewayError(RuntimeError):
@@ -14,14 +15,23 @@ SaleResult = namedtuple('SaleResult', ('id', 'status'))
 Represents successful sale request. Contains PSP data about sale.
 """
 
+CaptureResult = namedtuple('CaptureResult', ('id', 'status', 'error'))
+"""
+Represents result of capture of previously authorized transaction.
+`error` contains PSP error message if capture failed, otherwise None.
+"""
+
 
 class BaseGateway(ABC):
     """
     Base abstract class for gateways (implementations of integration with PSP).
+    Every operation takes optional `merchant_id`: merchant whose PSP
+    credentials should be used (default ones if None).
     """
 
     @abstractmethod
-    def tokenize_card(self, card_number: str, expiry_date: str) -> str:
+    def tokenize_card(self, card_number: str, expiry_date: str,
+                      merchant_id: Optional[str] = None) -> str:
         """
         Abstract method that should be implemented on concrete gateway class in
         order to tokenize provided card details on PSP.
@@ -29,8 +39,8 @@ class BaseGateway(ABC):
         """
 
     @abstractmethod
-    def sale_by_token(self, token: str,
-                      transaction_amount: Decimal) -> SaleResult:
+    def sale_by_token(self, token: str, transaction_amount: Decimal,
+                      merchant_id: Optional[str] = None) -> SaleResult:
         """
         Abstract method that should be implemented on concrete gateway class in
         order to request sale on PSP for provided token with specified amount.
@@ -38,3 +48,31 @@ class BaseGateway(ABC):
         :param transaction_amount:
         :return: transaction data
         """
+
+    @abstractmethod
+    def authorize_by_token(self, token: str, transaction_amount: Decimal,
+                           merchant_id: Optional[str] = None) -> SaleResult:
+        """
+        Abstract method that should be implemented on concrete gateway class in
+        order to authorize (without capturing) specified amount on PSP for
+        provided token.
+        :return: transaction data
+        """
+
+    @abstractmethod
+    def capture_transactions(self, transaction_ids: List[str],
+                             merchant_id: Optional[str] = None) -> List[CaptureResult]:
+        """
+        Abstract method that should be implemented on concrete gateway class in
+        order to capture previously authorized transactions on PSP in bulk.
+        Failure of single capture should be reported in its result, not raised.
+        :raise GatewayError: if none of transactions could be captured
+        :return: results of captures in the same order as `transaction_ids`
+        """
+
+    def warm_up(self) -> None:  # noqa: B027 optional for subclasses
+        """
+        Prepare gateway to serve requests (e.g. open connections to PSP).
+        Called once per worker process before serving requests.
+        Does nothing by default.
+        """
@@ -1,26 +1,111 @@
 import logging
+import queue
+import threading
+import time
+from collections import OrderedDict, defaultdict
 from decimal import Decimal
 from operator import itemgetter
-from typing import Optional
+from typing import List, Optional, Tuple, Union
 
+import httpx
 import requests
 
 from django.conf import settings
 
-from payments.gateways.base import BaseGateway, GatewayError, SaleResult
+from payments.credentials import CredentialStore, Credentials
+from payments.gateways.base import (
+    BaseGateway, CaptureResult, GatewayError, SaleResult,
+)
+from payments.gateways.http1 import KeepAliveTransport
+from payments.gateways.http2 import HTTP2Transport
+from payments.gateways.network import DNSCache, ResumingSSLContext
+from payments.gateways.recording import record_exchange
 
 
 logger = logging.getLogger(__name__)
 
 
+class TransportReaper:
+    """
+    Closes transports `delay` seconds after they are handed over, so
+    requests still sent over them can finish. A single background thread
+    closes all of them: transports wait in queue in order of their deadlines
+    (the same delay for all).
+    """
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """
+        :return: number of transports waiting to be closed
+        """
+        return self._queue.qsize()
+
+    def close_later(self, transport: Union[HTTP2Transport, KeepAliveTransport]) -> None:
+        self._queue.put((time.monotonic() + self.delay, transport))
+        if self._thread is not None:
+            return
+
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='transport-reaper', daemon=True,
+                )
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            deadline, transport = self._queue.get()
+            time.sleep(max(deadline - time.monotonic(), 0))
+            try:
+                transport.close()
+            except Exception:
+                logger.warning('Could not close Braintree transport', exc_info=True)
+            del transport  # don't keep closed transport while waiting
+
+
 class BraintreeGateway(BaseGateway):
     """
     Integration with Braintree GraphQL API.
+    Requests of every merchant are sent with their own credentials (taken
+    from `credential_store`) over their own connections, requests without
+    merchant use default credentials from settings.
     """
     API_REQUEST_TIMEOUT = 25
     API_VERSION = '2020-05-24'
+    TRANSPORTS = ('http2', 'keep-alive', 'none')
 
-    def tokenize_card(self, card_number: str, expiry_date: str) -> str:
+    def __init__(self, credential_store: Optional[CredentialStore] = None,
+                 default_credentials: Optional[Credentials] = None,
+                 api_version: Optional[str] = None,
+                 transport: Optional[str] = None):
+        """
+        :param credential_store: credentials of merchants; if None, only
+        requests without merchant can be served
+        :param default_credentials: credentials of requests without merchant
+        (`BRAINTREE_API_KEY`/`BRAINTREE_API_URL` settings if None)
+        :param api_version: Braintree API version (`API_VERSION` if None)
+        :param transport: one of `TRANSPORTS` (chosen by `BRAINTREE_HTTP2`
+        and `BRAINTREE_KEEP_ALIVE` settings if None)
+        """
+        self.credential_store = credential_store
+        self.default_credentials = default_credentials
+        self.api_version = api_version or self.API_VERSION
+        self.transport = transport
+        self._headers = {}  # merchant id (None if default) -> (credentials, headers)
+        # merchant id (None if default) -> transport, least recently used first
+        self._transports = OrderedDict()
+        self._transport_lock = threading.Lock()
+        self._reaper = TransportReaper(delay=self.API_REQUEST_TIMEOUT)
+        self._ssl_context = None
+        self._dns_cache = None
+
+    def tokenize_card(self, card_number: str, expiry_date: str,
+                      merchant_id: Optional[str] = None) -> str:
         exp_month, exp_year = expiry_date.split('/')
         query = """
         mutation tokenizeCreditCard($input: TokenizeCreditCardInput!) {
@@ -35,7 +120,9 @@ class BraintreeGateway(BaseGateway):
             },
         }
 
-        response_data = self._perform_query(query, {'input': input_data})
+        response_data = self._perform_query(
+            query, {'input': input_data}, merchant_id,
+        )
         query_result = self._extract_query_result(
             response_data, 'tokenizeCreditCard',
         )
@@ -47,28 +134,97 @@ class BraintreeGateway(BaseGateway):
 
         return token
 
-    def sale_by_token(self, token: str,
-                      transaction_amount: Decimal) -> SaleResult:
-        query = """
-        mutation chargePaymentMethod($input: ChargePaymentMethodInput!) {
-          chargePaymentMethod(input: $input) {
-            transaction {
+    def sale_by_token(self, token: str, transaction_amount: Decimal,
+                      merchant_id: Optional[str] = None) -> SaleResult:
+        return self._perform_transaction_mutation(
+            'chargePaymentMethod', 'ChargePaymentMethodInput',
+            token, transaction_amount, merchant_id,
+        )
+
+    def authorize_by_token(self, token: str, transaction_amount: Decimal,
+                           merchant_id: Optional[str] = None) -> SaleResult:
+        return self._perform_transaction_mutation(
+            'authorizePaymentMethod', 'AuthorizePaymentMethodInput',
+            token, transaction_amount, merchant_id,
+        )
+
+    def capture_transactions(self, transaction_ids: List[str],
+                             merchant_id: Optional[str] = None) -> List[CaptureResult]:
+        """
+        Captures all transactions with a single request: every capture is
+        a separate aliased mutation (`capture<N>`) of the same document,
+        so Braintree reports errors for each of them separately.
+        Errors of the whole request (e.g. authentication) come without data
+        and are raised.
+        """
+        variables = {
+            f'input{index}': {'transactionId': transaction_id}
+            for index, transaction_id in enumerate(transaction_ids)
+        }
+        arguments = ', '.join(
+            f'${name}: CaptureTransactionInput!' for name in variables
+        )
+        mutations = ' '.join(
+            f'capture{index}: captureTransaction(input: $input{index}) '
+            f'{{transaction {{id status}}}}'
+            for index in range(len(transaction_ids))
+        )
+        query = f'mutation captureTransactions({arguments}) {{{mutations}}}'
+
+        response_data = self._perform_query(query, variables, merchant_id)
+        data = response_data.get('data') or {}
+        if not data and response_data.get('errors'):
+            raise GatewayError(' '.join(
+                error.get('message', '') for error in response_data['errors']
+            ))
+
+        errors = defaultdict(list)
+        for error in response_data.get('errors') or []:
+            path = error.get('path') or [None]
+            errors[path[0]].append(error.get('message', ''))
+
+        results = []
+        for index, transaction_id in enumerate(transaction_ids):
+            alias = f'capture{index}'
+            transaction = (data.get(alias) or {}).get('transaction')
+            if transaction:
+                result = CaptureResult(transaction_id, transaction.get('status'), None)
+            else:
+                message = ' '.join(errors[alias]) or 'Braintree misbehavior: data is missing'
+                result = CaptureResult(transaction_id, None, message)
+            results.append(result)
+
+        return results
+
+    def _perform_transaction_mutation(
+            self, mutation_name: str, input_type: str, token: str,
+            transaction_amount: Decimal,
+            merchant_id: Optional[str] = None) -> SaleResult:
+        """
+        Performs one of mutations that create transaction for payment method
+        (they differ only in name and type of input).
+        :return: created transaction data
+        """
+        query = f"""
+        mutation {mutation_name}($input: {input_type}!) {{
+          {mutation_name}(input: $input) {{
+            transaction {{
               id
-              amount { value currencyIsoCode }
+              amount {{ value currencyIsoCode }}
               status
-            }
-          }
-        }
+            }}
+          }}
+        }}
         """
         input_data = {
             'paymentMethodId': token,
             'transaction': {'amount': str(transaction_amount)},
         }
 
-        response_data = self._perform_query(query, {'input': input_data})
-        query_result = self._extract_query_result(
-            response_data, 'chargePaymentMethod',
+        response_data = self._perform_query(
+            query, {'input': input_data}, merchant_id,
         )
+        query_result = self._extract_query_result(response_data, mutation_name)
 
         try:
             transaction = query_result['transaction']
@@ -77,22 +233,29 @@ class BraintreeGateway(BaseGateway):
 
         return SaleResult(transaction.get('id'), transaction.get('status'))
 
-    def _perform_query(self, query: str, variables: dict) -> dict:
+    def _perform_query(self, query: str, variables: dict,
+                       merchant_id: Optional[str] = None) -> dict:
         """
         Holds logic of performing requests to Braintree GraphQL API.
         :param query: GraphQL query
         :param variables: variables for GraphQL query
+        :param merchant_id: merchant whose credentials are used (default
+        ones if None)
         :raise GatewayError: if any issue during processing of request occurred
         :return: response json parsed as dict
         """
-        url = settings.BRAINTREE_API_URL
+        url, headers = self._get_endpoint(merchant_id)
+        started_at = time.perf_counter()
         try:
-            response = requests.post(
-                url, json={'query': query, 'variables': variables},
-                headers=self._prepare_headers(),
-                timeout=self.API_REQUEST_TIMEOUT,
+            response = self._post(
+                url, {'query': query, 'variables': variables}, headers,
+                merchant_id,
+            )
+        except (requests.ConnectionError, requests.Timeout,
+                *HTTP2Transport.CONNECTION_ERRORS):
+            self._record(
+                query, variables, started_at, error='Connection issues',
             )
-        except (requests.ConnectionError, requests.Timeout):
             log_msg = 'Connection issues for request to Braintree API'
             self._log_request(logging.ERROR, log_msg, url=url)
             raise GatewayError('Connection issues')
@@ -100,10 +263,18 @@ class BraintreeGateway(BaseGateway):
         try:
             response_data = response.json()
         except ValueError:
+            self._record(
+                query, variables, started_at, status_code=response.status_code,
+            )
             log_msg = 'Could not extract json data from Braintree response'
             self._log_request(logging.ERROR, log_msg, response)
             raise GatewayError('Unexpected data format')
 
+        self._record(
+            query, variables, started_at,
+            status_code=response.status_code, response_data=response_data,
+        )
+
         if {'data', 'errors'} & response_data.keys():
             # if any of these keys included in response body
             request_id = response_data.get('extensions', {}).get('requestId')
@@ -118,10 +289,162 @@ class BraintreeGateway(BaseGateway):
 
         return response_data
 
-    def _prepare_headers(self) -> dict:
+    def warm_up(self) -> None:
+        """
+        Resolve Braintree host and open `BRAINTREE_WARM_UP_CONNECTIONS`
+        connections to it in advance. Does nothing if connections are not
+        kept between requests (neither `BRAINTREE_HTTP2` nor
+        `BRAINTREE_KEEP_ALIVE` is on). Connections of merchants are opened
+        on their first requests.
+        """
+        transport = self._get_transport()
+        connections = settings.BRAINTREE_WARM_UP_CONNECTIONS
+        if transport is None or not connections:
+            return
+
+        transport.warm_up(
+            settings.BRAINTREE_API_URL, connections,
+            timeout=self.API_REQUEST_TIMEOUT,
+        )
+        logger.info('Opened %s connection(s) to Braintree API', connections)
+
+    def _post(self, url: str, payload: dict, headers: dict,
+              merchant_id: Optional[str] = None):
+        """
+        Send request to Braintree with transport of merchant configured in
+        settings or over new HTTP/1.1 connection if there's none.
+        :return: response object (`requests` or `httpx` one)
+        """
+        transport = self._get_transport(merchant_id)
+        post = transport.post if transport is not None else requests.post
+        return post(
+            url, json=payload, headers=headers,
+            timeout=self.API_REQUEST_TIMEOUT,
+        )
+
+    def _get_transport(
+            self, merchant_id: Optional[str] = None,
+    ) -> Optional[Union[HTTP2Transport, KeepAliveTransport]]:
+        """
+        Lazily create transport of merchant that keeps connections between
+        requests: HTTP/2 one or HTTP/1.1 connection pool (see
+        `_get_transport_kind`). Transport is shared by all
+        threads and created after worker process is forked.
+        Every merchant gets own connections, so slow requests of one merchant
+        don't exhaust connections of others. All transports share TLS
+        sessions (and DNS cache, event loop) and resume them on reconnects.
+        Transports of only `BRAINTREE_MAX_MERCHANT_TRANSPORTS` recently
+        active merchants are kept, the default one is never evicted (so it
+        owns event loop shared by HTTP/2 transports). Evicted transports are
+        closed by `TransportReaper` once their requests time out.
+        :return: transport or None if none of them is enabled
+        """
+        if self._get_transport_kind() == 'none':
+            return None
+
+        with self._transport_lock:
+            if None not in self._transports:
+                self._transports[None] = self._create_transport()
+
+            transport = self._transports.get(merchant_id)
+            if transport is not None:
+                self._transports.move_to_end(merchant_id)
+                return transport
+
+            transport = self._transports[merchant_id] = self._create_transport()
+            while len(self._transports) > settings.BRAINTREE_MAX_MERCHANT_TRANSPORTS + 1:
+                evicted_id = next(key for key in self._transports if key is not None)
+                self._reaper.close_later(self._transports.pop(evicted_id))
+
+        return transport
+
+    def _create_transport(self) -> Union[HTTP2Transport, KeepAliveTransport]:
+        if self._ssl_context is None:
+            self._ssl_context = ResumingSSLContext()
+            self._dns_cache = DNSCache(ttl=settings.BRAINTREE_DNS_TTL)
+
+        if self._get_transport_kind() == 'http2':
+            return HTTP2Transport(
+                max_connections=settings.BRAINTREE_HTTP2_MAX_CONNECTIONS,
+                ssl_context=self._ssl_context,
+                loop=getattr(self._transports.get(None), 'loop', None),
+                dns_cache=self._dns_cache,
+            )
+
+        return KeepAliveTransport(
+            pool_size=settings.BRAINTREE_POOL_SIZE,
+            dns_cache=self._dns_cache,
+            ssl_context=self._ssl_context,
+        )
+
+    def _get_transport_kind(self) -> str:
+        """
+        :return: transport given explicitly or, if none, `http2` if
+        `BRAINTREE_HTTP2` is on, `keep-alive` if `BRAINTREE_KEEP_ALIVE`
+        is on, otherwise `none` (new HTTP/1.1 connection per request)
+        """
+        if self.transport is not None:
+            return self.transport
+        if settings.BRAINTREE_HTTP2:
+            return 'http2'
+        if settings.BRAINTREE_KEEP_ALIVE:
+            return 'keep-alive'
+        return 'none'
+
+    def _record(self, query: str, variables: dict, started_at: float,
+                **kwargs) -> None:
+        """
+        Append request/response pair to records file if record mode is on
+        (`BRAINTREE_RECORD_FILE` setting is not empty).
+        :param started_at: `time.perf_counter` value taken before request
+        :param kwargs: response details passed to `record_exchange`
+        """
+        path = settings.BRAINTREE_RECORD_FILE
+        if not path:
+            return
+
+        elapsed = time.perf_counter() - started_at
+        try:
+            record_exchange(path, query, variables, elapsed, **kwargs)
+        except OSError:
+            logger.exception('Could not record Braintree request')
+
+    def _get_endpoint(self, merchant_id: Optional[str] = None) -> Tuple[str, dict]:
+        """
+        Find API URL and request headers of merchant. Headers are built once
+        per credentials and rebuilt only when they change.
+        :param merchant_id: merchant or None for default credentials
+        from settings
+        :raise GatewayError: if there are no credentials for merchant
+        :return: API URL and headers
+        """
+        if merchant_id is None:
+            credentials = self.default_credentials or Credentials(
+                settings.BRAINTREE_API_KEY, settings.BRAINTREE_API_URL,
+            )
+        elif self.credential_store is not None:
+            credentials = self.credential_store.get(merchant_id)
+        else:
+            credentials = None
+
+        if credentials is None:
+            raise GatewayError(f'Unknown merchant: {merchant_id}')
+
+        cached = self._headers.get(merchant_id)
+        if cached is None or cached[0] != credentials:
+            cached = self._headers[merchant_id] = (
+                credentials, self._build_headers(credentials.api_key),
+            )
+
+        return credentials.api_url or settings.BRAINTREE_API_URL, cached[1]
+
+    def _prepare_headers(self, merchant_id: Optional[str] = None) -> dict:
+        return self._get_endpoint(merchant_id)[1]
+
+    def _build_headers(self, api_key: str) -> dict:
         return {
-            'Authorization': f'Basic {settings.BRAINTREE_API_KEY}',
-            'Braintree-Version': self.API_VERSION,
+            'Authorization': f'Basic {api_key}',
+            'Braintree-Version': self.api_version,
         }
 
     def _extract_query_result(self, resp_data: dict, query_name: str) -> dict:
@@ -144,7 +467,7 @@ class BraintreeGateway(BaseGateway):
 
     def _log_request(
             self, level: int, message: str,
-            response: Optional[requests.Response] = None,
+            response: Optional[Union[requests.Response, httpx.Response]] = None,
             **kwargs) -> None:
         """
         Shortcut to log communication with API that gather extra data from
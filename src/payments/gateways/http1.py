@@ -0,0 +1,117 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from payments.gateways.network import DNSCache, ResumingSSLContext
+
+
+class KeepAliveTransport:
+    """
+    HTTP/1.1 client that keeps up to `pool_size` connections per origin
+    open between requests. Host addresses are taken from `dns_cache` and
+    TLS sessions are resumed on reconnects (see `ResumingSSLContext`).
+    Thread-safe, so single instance should be shared by all threads of
+    a process.
+    """
+    CONNECTION_ERRORS = (requests.ConnectionError, requests.Timeout)
+
+    def __init__(self, pool_size: int = 10, dns_cache: Optional[DNSCache] = None,
+                 ssl_context: Optional[ResumingSSLContext] = None):
+        self.dns_cache = dns_cache or DNSCache()
+        self.ssl_context = ssl_context or ResumingSSLContext()
+        self.session = requests.Session()
+        adapter = _KeepAliveAdapter(
+            self.dns_cache, self.ssl_context,
+            pool_connections=1, pool_maxsize=pool_size,
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def post(self, url: str, json: dict, headers: dict,
+             timeout: float) -> requests.Response:
+        """
+        Perform POST request.
+        :raise requests.RequestException: on connection issues and timeouts
+        """
+        return self.session.post(url, json=json, headers=headers, timeout=timeout)
+
+    def warm_up(self, url: str, connections: int, timeout: float) -> None:
+        """
+        Resolve host of `url` and open `connections` connections to it
+        (including TLS handshake), which are kept in pool afterwards.
+        Connections are opened by concurrent HEAD requests, so their
+        responses don't matter.
+        """
+        with ThreadPoolExecutor(max_workers=connections) as executor:
+            responses = executor.map(
+                lambda _: self.session.head(url, timeout=timeout),
+                range(connections),
+            )
+            for response in responses:
+                response.close()
+
+    def close(self) -> None:
+        self.session.close()
+
+
+class _KeepAliveAdapter(HTTPAdapter):
+    """
+    Adapter that creates connections resolving hosts via DNS cache and
+    using TLS context with session resumption.
+    """
+
+    def __init__(self, dns_cache: DNSCache, ssl_context: ResumingSSLContext,
+                 **kwargs):
+        self.dns_cache = dns_cache
+        self.ssl_context = ssl_context
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['ssl_context'] = self.ssl_context
+        super().init_poolmanager(*args, **kwargs)
+
+        dns_cache = self.dns_cache
+        http_connection = type(
+            'CachedDNSHTTPConnection', (_CachedDNSConnectionMixin, HTTPConnection),
+            {'dns_cache': dns_cache},
+        )
+        https_connection = type(
+            'CachedDNSHTTPSConnection', (_CachedDNSConnectionMixin, HTTPSConnection),
+            {'dns_cache': dns_cache},
+        )
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': type('HTTPPool', (HTTPConnectionPool,), {'ConnectionCls': http_connection}),
+            'https': type('HTTPSPool', (HTTPSConnectionPool,), {'ConnectionCls': https_connection}),
+        }
+
+    def cert_verify(self, conn, url, verify, cert):
+        """
+        CA certificates are loaded into `ssl_context` once instead of being
+        set for pool (then urllib3 loads them on every new connection).
+        """
+        super().cert_verify(conn, url, verify, cert)
+        if isinstance(verify, str):
+            self.ssl_context.load_ca_bundle(verify)
+        if verify:
+            conn.ca_certs = conn.ca_cert_dir = None
+
+
+class _CachedDNSConnectionMixin:
+    """
+    urllib3 opens TCP connection to `_dns_host`, which is replaced with
+    cached address just for that. Original host is still used for TLS SNI,
+    certificate checks and `Host` header.
+    """
+    dns_cache: DNSCache
+
+    def _new_conn(self):
+        host = self._dns_host
+        self._dns_host = self.dns_cache.resolve(host, self.port)
+        try:
+            return super()._new_conn()
+        finally:
+            self._dns_host = host
@@ -0,0 +1,144 @@
+import asyncio
+import concurrent.futures
+import ssl
+import threading
+from typing import Optional
+
+import httpcore
+import httpx
+
+from payments.gateways.network import DNSCache
+
+
+class HTTP2Transport:
+    """
+    HTTP client that multiplexes concurrent requests as HTTP/2 streams over
+    a few connections (not more than `max_connections`) per origin.
+    HTTP/1.1 is used instead if server doesn't support HTTP/2 (negotiated
+    via ALPN during TLS handshake).
+
+    Host addresses are taken from `dns_cache` if it's given (TLS server
+    name is still the host name).
+
+    Requests are executed by async client on the event loop running in
+    a background thread: sync HTTP/2 connections of httpx are not safe to
+    share between threads. Single instance should be shared by all threads
+    of a process. Several transports can share one event loop thread
+    (see `loop` argument). Requesting threads wait for the loop not longer
+    than request timeout, so they don't hang if the loop thread does.
+    """
+    CONNECTION_ERRORS = (httpx.TransportError, concurrent.futures.TimeoutError)
+
+    def __init__(self, max_connections: int = 2, http1: bool = True,
+                 ssl_context: Optional[ssl.SSLContext] = None,
+                 loop: Optional[asyncio.AbstractEventLoop] = None,
+                 dns_cache: Optional[DNSCache] = None):
+        """
+        :param max_connections: limit of connections per origin
+        :param http1: allow HTTP/1.1, otherwise HTTP/2 is used even for
+        plain-text connections (prior knowledge)
+        :param ssl_context: TLS context for connections (default one if None)
+        :param loop: running event loop of another transport to execute
+        requests on (own loop thread is started if None)
+        :param dns_cache: cache of host addresses (resolved on every
+        connect if None)
+        """
+        transport = httpx.AsyncHTTPTransport(
+            http1=http1, http2=True, verify=ssl_context or True,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+        )
+        if dns_cache is not None:
+            # httpx doesn't expose network backend of its connection pool
+            pool = transport._pool
+            pool._network_backend = _DNSCachingBackend(dns_cache, pool._network_backend)
+        self.client = httpx.AsyncClient(transport=transport)
+        if loop is not None:
+            self.loop = loop
+            self._thread = None
+            return
+
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name='http2-transport', daemon=True,
+        )
+        self._thread.start()
+
+    def post(self, url: str, json: dict, headers: dict,
+             timeout: float) -> httpx.Response:
+        """
+        Perform POST request and wait for the response.
+        :param timeout: timeout of every stage of request (waiting for free
+        stream/connection, connecting, sending and waiting for response)
+        and of the whole request
+        :raise httpx.TransportError: on connection issues and timeouts
+        :raise concurrent.futures.TimeoutError: if the whole request took
+        longer than `timeout`
+        """
+        return self._run(self.client.post(
+            url, json=json, headers=headers, timeout=httpx.Timeout(timeout),
+        ), timeout)
+
+    def warm_up(self, url: str, connections: int, timeout: float) -> None:
+        """
+        Open connection to host of `url` (including TLS handshake), which is
+        kept afterwards. A single HTTP/2 connection serves all concurrent
+        requests, so `connections` only matters for HTTP/1.1 fallback.
+        Connections are opened by HEAD requests, so their responses
+        don't matter.
+        """
+        async def heads():
+            await asyncio.gather(*(
+                self.client.head(url, timeout=httpx.Timeout(timeout))
+                for _ in range(connections)
+            ))
+
+        self._run(heads(), timeout)
+
+    def close(self) -> None:
+        self._run(self.client.aclose())
+        if self._thread is None:  # loop is owned by another transport
+            return
+
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+    def _run(self, coroutine, timeout: Optional[float] = None):
+        """
+        Execute coroutine on the event loop and wait for its result.
+        :raise concurrent.futures.TimeoutError: if there's no result within
+        `timeout` seconds (coroutine is cancelled then)
+        """
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+
+class _DNSCachingBackend(httpcore.AsyncNetworkBackend):
+    """
+    Network backend of httpcore that connects to addresses from DNS cache.
+    Addresses are resolved in executor, so the event loop isn't blocked
+    when cache entry expires.
+    """
+
+    def __init__(self, dns_cache: DNSCache, backend: httpcore.AsyncNetworkBackend):
+        self.dns_cache = dns_cache
+        self._backend = backend
+
+    async def connect_tcp(self, host: str, port: int, *args, **kwargs):
+        address = await asyncio.get_running_loop().run_in_executor(
+            None, self.dns_cache.resolve, host, port,
+        )
+        return await self._backend.connect_tcp(address, port, *args, **kwargs)
+
+    async def connect_unix_socket(self, *args, **kwargs):
+        return await self._backend.connect_unix_socket(*args, **kwargs)
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
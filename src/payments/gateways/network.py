@@ -0,0 +1,136 @@
+"""
+Network helpers that make (re)connecting to PSP cheaper: DNS cache and
+TLS context that resumes TLS sessions.
+"""
+import os
+import socket
+import ssl
+import threading
+import time
+from typing import Optional
+
+import certifi
+
+
+class DNSCache:
+    """
+    Cache of resolved host addresses that are kept for `ttl` seconds.
+    Standard library doesn't expose TTL of DNS records, so it's configured.
+    If host can't be resolved after entry has expired, stale address is
+    served (and error raised only if there's none).
+    """
+
+    def __init__(self, ttl: float = 60):
+        self.ttl = ttl
+        self._entries = {}  # host -> (address, expires at)
+        self._lock = threading.Lock()
+
+    def resolve(self, host: str, port: int = 443) -> str:
+        """
+        :return: IP address of host
+        :raise socket.gaierror: if host can't be resolved
+        """
+        entry = self._entries.get(host)
+        if entry is not None and entry[1] > time.monotonic():
+            return entry[0]
+
+        try:
+            address = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0][4][0]
+        except socket.gaierror:
+            if entry is None:
+                raise
+            return entry[0]
+
+        with self._lock:
+            self._entries[host] = (address, time.monotonic() + self.ttl)
+
+        return address
+
+
+class _SessionSavingMixin:
+    """
+    Saves TLS session of the connection into its context once session can
+    be resumed. With TLS 1.3 a session ticket arrives after handshake,
+    so it's checked on reads.
+    """
+    _session_saved = False
+
+    def read(self, *args, **kwargs):
+        data = super().read(*args, **kwargs)
+        if not self._session_saved:
+            self._save_session()
+        return data
+
+    def do_handshake(self, *args, **kwargs):
+        result = super().do_handshake(*args, **kwargs)
+        self._save_session()
+        return result
+
+    def _save_session(self) -> None:
+        session = self.session
+        if session is None or not self.server_hostname:
+            return
+
+        if session.has_ticket or self.version() != 'TLSv1.3':
+            self.context.sessions[self.server_hostname] = session
+            self._session_saved = True
+
+
+class _SessionSavingSSLSocket(_SessionSavingMixin, ssl.SSLSocket):
+    pass
+
+
+class _SessionSavingSSLObject(_SessionSavingMixin, ssl.SSLObject):
+    pass
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """
+    Client TLS context that remembers the last TLS session per server
+    hostname and offers it on the next connection to the same server,
+    so reconnects do abbreviated handshake instead of the full one.
+    Works for both socket (`requests`) and memory BIO (`httpx`) connections.
+    Trusts the same CA certificates (`certifi` bundle) as both libraries
+    do by default.
+    """
+    sslsocket_class = _SessionSavingSSLSocket
+    sslobject_class = _SessionSavingSSLObject
+
+    def __new__(cls, protocol=ssl.PROTOCOL_TLS_CLIENT, *args, **kwargs):
+        return super().__new__(cls, protocol, *args, **kwargs)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self.sessions = {}
+        self._ca_bundles = set()
+        self.load_ca_bundle(certifi.where())
+
+    def load_ca_bundle(self, path: str) -> None:
+        """
+        Trust CA certificates from file or directory unless they're loaded
+        already (loading of bundle takes tens of milliseconds).
+        """
+        if path in self._ca_bundles:
+            return
+
+        if os.path.isdir(path):
+            self.load_verify_locations(capath=path)
+        else:
+            self.load_verify_locations(cafile=path)
+        self._ca_bundles.add(path)
+
+    def wrap_socket(self, sock, *args, server_hostname: Optional[str] = None,
+                    session=None, **kwargs):
+        session = session or self.sessions.get(server_hostname)
+        return super().wrap_socket(
+            sock, *args, server_hostname=server_hostname, session=session,
+            **kwargs,
+        )
+
+    def wrap_bio(self, incoming, outgoing, *args,
+                 server_hostname: Optional[str] = None, session=None, **kwargs):
+        session = session or self.sessions.get(server_hostname)
+        return super().wrap_bio(
+            incoming, outgoing, *args, server_hostname=server_hostname,
+            session=session, **kwargs,
+        )
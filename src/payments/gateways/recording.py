@@ -0,0 +1,90 @@
+"""
+Capturing of PSP traffic into append-only JSON lines files and
+reading it back. Used for offline performance tests (see `ReplayGateway`).
+"""
+import json
+import re
+import threading
+import time
+from typing import Iterator, Optional
+
+
+OPERATION_NAME_REGEX = re.compile(r'(?:mutation|query)\s+(\w+)')
+REDACTED_KEYS = frozenset({'number'})
+
+_write_lock = threading.Lock()
+
+
+def extract_operation_name(query: str) -> str:
+    """
+    Get name of GraphQL operation from query text.
+    :return: operation name or empty string if query is anonymous
+    """
+    match = OPERATION_NAME_REGEX.search(query)
+    return match.group(1) if match else ''
+
+
+def redact_pan(value: str) -> str:
+    """
+    Mask card number leaving only last four digits visible.
+    """
+    return '*' * max(len(value) - 4, 0) + value[-4:]
+
+
+def redact_variables(variables):
+    """
+    Recursively copy GraphQL variables masking values of sensitive keys
+    (card numbers).
+    """
+    if isinstance(variables, dict):
+        return {
+            key: redact_pan(str(value)) if key in REDACTED_KEYS
+            else redact_variables(value)
+            for key, value in variables.items()
+        }
+    if isinstance(variables, list):
+        return [redact_variables(item) for item in variables]
+
+    return variables
+
+
+def record_exchange(path: str, query: str, variables: dict, elapsed: float,
+                    status_code: Optional[int] = None,
+                    response_data: Optional[dict] = None,
+                    error: Optional[str] = None) -> None:
+    """
+    Append single request/response pair to the records file.
+    Every record is one compact JSON document per line, so file can be
+    appended concurrently by threads and read back line by line.
+    :param path: path to records file
+    :param query: GraphQL query that was sent
+    :param variables: variables for GraphQL query (will be redacted)
+    :param elapsed: time in seconds spent on request
+    :param status_code: HTTP status code of response
+    :param response_data: response json parsed as dict
+    :param error: error description if there was no response at all
+    """
+    record = {
+        'ts': round(time.time(), 3),
+        'op': extract_operation_name(query),
+        'vars': redact_variables(variables),
+        'elapsed': round(elapsed, 6),
+        'status': status_code,
+        'response': response_data,
+    }
+    if error is not None:
+        record['error'] = error
+
+    line = json.dumps(record, separators=(',', ':'), default=str) + '\n'
+    with _write_lock, open(path, 'a') as records_file:
+        records_file.write(line)
+
+
+def read_records(path: str) -> Iterator[dict]:
+    """
+    Read records file written by `record_exchange` skipping blank lines.
+    """
+    with open(path) as records_file:
+        for line in records_file:
+            if line.strip():
+                yield json.loads(line)
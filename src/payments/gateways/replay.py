@@ -0,0 +1,69 @@
+import itertools
+import logging
+import time
+from collections import defaultdict
+from typing import Optional
+
+from payments.gateways.base import GatewayError
+from payments.gateways.braintree import BraintreeGateway
+from payments.gateways.recording import extract_operation_name, read_records
+
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayGateway(BraintreeGateway):
+    """
+    Braintree gateway that never goes to network, but serves responses
+    captured in record mode (see `BRAINTREE_RECORD_FILE` setting).
+    Records are served per GraphQL operation in the recorded order (and
+    cycled over once exhausted), with the original latencies multiplied
+    by `latency_scale`. Records are shared by all merchants.
+    """
+
+    def __init__(self, records_path: str, latency_scale: float = 1.0):
+        super().__init__()
+        records = defaultdict(list)
+        for record in read_records(records_path):
+            records[record['op']].append(record)
+
+        self.latency_scale = latency_scale
+        self._records = {
+            operation: itertools.cycle(operation_records)
+            for operation, operation_records in records.items()
+        }
+
+    def warm_up(self) -> None:
+        """
+        Nothing to warm up, Braintree API is not used.
+        """
+
+    def _perform_query(self, query: str, variables: dict,
+                       merchant_id: Optional[str] = None) -> dict:
+        """
+        Reproduce recorded request to Braintree GraphQL API including
+        its latency and errors.
+        :raise GatewayError: if there's no records for operation or if
+        recorded request failed
+        :return: recorded response json parsed as dict
+        """
+        operation = extract_operation_name(query)
+        try:
+            record = next(self._records[operation])
+        except KeyError:
+            raise GatewayError(f'No recorded responses for {operation}')
+
+        if self.latency_scale:
+            time.sleep(record['elapsed'] * self.latency_scale)
+
+        if 'error' in record:
+            raise GatewayError(record['error'])
+
+        response_data = record['response']
+        if response_data is None:
+            raise GatewayError('Unexpected data format')
+        if not {'data', 'errors'} & response_data.keys():
+            raise GatewayError('Braintree misbehavior')
+
+        logger.debug('Replayed recorded %s response', operation)
+        return response_data
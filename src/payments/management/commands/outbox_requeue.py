@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.service import PaymentService
+
+
+class Command(BaseCommand):
+    help = (  # noqa: A003
+        'Move dead-lettered events back to outbox to be published again '
+        '(e.g. once sink that rejected them is fixed).'
+    )
+
+    def handle(self, *args, **options):
+        if PaymentService.outbox is None:
+            raise CommandError('OUTBOX_PATH setting is not configured')
+
+        requeued = PaymentService.outbox.requeue_dead()
+        self.stdout.write(f'{requeued} event(s) requeued')
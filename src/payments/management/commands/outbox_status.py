@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.service import PaymentService
+
+
+class Command(BaseCommand):
+    help = (  # noqa: A003
+        'Show how many sale events are waiting in outbox to be published '
+        'and how old the oldest of them is, and how many are dead-lettered.'
+    )
+
+    def handle(self, *args, **options):
+        if PaymentService.outbox is None:
+            raise CommandError('OUTBOX_PATH setting is not configured')
+
+        lag = PaymentService.outbox.lag()
+        self.stdout.write(
+            f'{lag["pending"]} event(s) pending in {settings.OUTBOX_PATH}, '
+            f'the oldest is {lag["oldest_age"]:.1f}s old, '
+            f'{PaymentService.outbox.dead_count} dead-lettered',
+        )
@@ -1,13 +1,41 @@
-from rest_framework import serializers
+from rest_framework import exceptions, serializers
 
 from payments.service import PaymentService, PaymentServiceError
+from payments.velocity import (
+    VelocityLimitExceeded, fingerprint_card, get_velocity_filter,
+)
 
 
 EXPIRY_DATE_REGEX = r'^(0[1-9]|1[0-2])\/?([0-9]{4}|[0-9]{2})$'
 EXPIRY_DATE_INVALID_MESSAGE = 'This value does not match the required pattern.'
 
 
-class TokenizeSerializer(serializers.Serializer):
+class VelocityCheckMixin:
+    """
+    Checks attempts against velocity limits (see `VELOCITY_LIMITS`) before
+    payment action is performed. Client IP is taken from `client_ip` in
+    serializer context.
+    """
+
+    def check_velocity(self, **values) -> None:
+        """
+        :raise Throttled: if any velocity limit is exceeded
+        """
+        velocity_filter = get_velocity_filter()
+        if velocity_filter is None:
+            return
+
+        try:
+            velocity_filter.check(ip=self.context.get('client_ip'), **values)
+        except VelocityLimitExceeded as exception:
+            raise exceptions.Throttled(wait=exception.retry_after)
+
+
+class TokenizeSerializer(VelocityCheckMixin, serializers.Serializer):
+    """
+    Payment serializers perform action on behalf of merchant passed as
+    `merchant_id` in serializer context (if any).
+    """
     card_number = serializers.CharField(min_length=12, max_length=19)
     expiry_date = serializers.RegexField(
         regex=EXPIRY_DATE_REGEX,
@@ -26,10 +54,12 @@ class TokenizeSerializer(serializers.Serializer):
         return value
 
     def create(self, validated_data: dict) -> dict:
+        self.check_velocity(card=fingerprint_card(validated_data['card_number']))
         try:
             token = PaymentService.tokenize(
                 card_number=validated_data['card_number'],
                 expiry_date=validated_data['expiry_date'],
+                merchant_id=self.context.get('merchant_id'),
             )
         except PaymentServiceError as exception:
             raise serializers.ValidationError({'error': str(exception)})
@@ -38,18 +68,37 @@ class TokenizeSerializer(serializers.Serializer):
         return self._data
 
 
-class SaleSerializer(serializers.Serializer):
+class SaleSerializer(VelocityCheckMixin, serializers.Serializer):
     token = serializers.CharField()
     transaction_amount = serializers.DecimalField(max_digits=10, decimal_places=2)
 
     def create(self, validated_data: dict) -> dict:
+        self.check_velocity(token=validated_data['token'])
         try:
             sale_result = PaymentService.sale(
                 token=validated_data['token'],
                 transaction_amount=validated_data['transaction_amount'],
+                merchant_id=self.context.get('merchant_id'),
             )
         except PaymentServiceError as exception:
             raise serializers.ValidationError({'error': str(exception)})
 
         self._data = {'id': sale_result.id, 'status': sale_result.status}
         return self._data
+
+
+class AuthorizeSerializer(SaleSerializer):
+
+    def create(self, validated_data: dict) -> dict:
+        self.check_velocity(token=validated_data['token'])
+        try:
+            authorization = PaymentService.authorize(
+                token=validated_data['token'],
+                transaction_amount=validated_data['transaction_amount'],
+                merchant_id=self.context.get('merchant_id'),
+            )
+        except PaymentServiceError as exception:
+            raise serializers.ValidationError({'error': str(exception)})
+
+        self._data = {'id': authorization.id, 'status': authorization.status}
+        return self._data
@@ -1,8 +1,21 @@
 import logging
+import time
 from decimal import Decimal
+from typing import List, Optional
 
-from payments.gateways.base import GatewayError, SaleResult
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from payments.capture import CaptureScheduler
+from payments.credentials import CredentialStore, Credentials
+from payments.events.outbox import Outbox
+from payments.events.sinks import build_sink
+from payments.gateways.base import (
+    BaseGateway, CaptureResult, GatewayError, SaleResult,
+)
 from payments.gateways.braintree import BraintreeGateway
+from payments.gateways.replay import ReplayGateway
+from payments.shadow import ShadowTraffic, get_outcome
 
 
 logger = logging.getLogger(__name__)
@@ -15,36 +28,188 @@ class PaymentServiceError(RuntimeError):
     """
 
 
+def build_credential_store() -> Optional[CredentialStore]:
+    """
+    Instantiate store of merchant credentials configured in settings.
+    :return: store or None if requests can't be made on behalf of merchants
+    """
+    if not settings.BRAINTREE_CREDENTIALS_FILE:
+        return None
+
+    return CredentialStore.from_path(
+        settings.BRAINTREE_CREDENTIALS_FILE,
+        reload_interval=settings.BRAINTREE_CREDENTIALS_RELOAD_INTERVAL,
+    )
+
+
+def build_gateway(credential_store: Optional[CredentialStore] = None) -> BaseGateway:
+    """
+    Instantiate gateway configured in settings: the real Braintree one or,
+    for offline performance tests, the one that replays recorded traffic.
+    """
+    if settings.BRAINTREE_REPLAY_FILE:
+        return ReplayGateway(
+            settings.BRAINTREE_REPLAY_FILE,
+            latency_scale=settings.BRAINTREE_REPLAY_LATENCY_SCALE,
+        )
+
+    return BraintreeGateway(credential_store=credential_store)
+
+
+def build_outbox() -> Optional[Outbox]:
+    """
+    Instantiate outbox of payment events configured in settings.
+    :raise ImproperlyConfigured: if there are no sinks to publish events to
+    (they would be deleted from outbox without being delivered anywhere)
+    :return: outbox or None if events are not recorded
+    """
+    if not settings.OUTBOX_PATH:
+        return None
+
+    if not settings.OUTBOX_SINKS:
+        raise ImproperlyConfigured('OUTBOX_SINKS must be set when OUTBOX_PATH is set')
+
+    return Outbox(
+        settings.OUTBOX_PATH,
+        sinks=[build_sink(url) for url in settings.OUTBOX_SINKS],
+        batch_size=settings.OUTBOX_BATCH_SIZE,
+        interval=settings.OUTBOX_INTERVAL,
+        max_pending=settings.OUTBOX_MAX_PENDING,
+        max_attempts=settings.OUTBOX_MAX_ATTEMPTS,
+        fsync=settings.OUTBOX_FSYNC,
+    )
+
+
+def build_shadow() -> Optional[ShadowTraffic]:
+    """
+    Instantiate shadow traffic to candidate gateway configured in settings:
+    the one that replays recorded traffic (local stub) or Braintree one
+    with its own URL, API key, version and transport.
+    :raise ImproperlyConfigured: if candidate is Braintree, but its URL or
+    key is missing or URL is the production one (real cards would be sent
+    to production twice)
+    :return: shadow traffic or None if nothing is mirrored
+    """
+    if not settings.SHADOW_SAMPLE_RATE:
+        return None
+
+    if settings.SHADOW_REPLAY_FILE:
+        candidate = ReplayGateway(
+            settings.SHADOW_REPLAY_FILE,
+            latency_scale=settings.BRAINTREE_REPLAY_LATENCY_SCALE,
+        )
+    else:
+        if not (settings.SHADOW_API_URL and settings.SHADOW_API_KEY):
+            raise ImproperlyConfigured(
+                'SHADOW_API_URL and SHADOW_API_KEY (or SHADOW_REPLAY_FILE) '
+                'must be set when SHADOW_SAMPLE_RATE is set',
+            )
+        if settings.SHADOW_API_URL.rstrip('/') == (settings.BRAINTREE_API_URL or '').rstrip('/'):
+            raise ImproperlyConfigured('SHADOW_API_URL must differ from BRAINTREE_API_URL')
+        if settings.SHADOW_TRANSPORT not in (None, *BraintreeGateway.TRANSPORTS):
+            raise ImproperlyConfigured(
+                f'SHADOW_TRANSPORT must be one of {", ".join(BraintreeGateway.TRANSPORTS)}',
+            )
+
+        candidate = BraintreeGateway(
+            default_credentials=Credentials(settings.SHADOW_API_KEY, settings.SHADOW_API_URL),
+            api_version=settings.SHADOW_API_VERSION,
+            transport=settings.SHADOW_TRANSPORT,
+        )
+
+    return ShadowTraffic(
+        candidate,
+        sample_rate=settings.SHADOW_SAMPLE_RATE,
+        max_rate=settings.SHADOW_MAX_RATE,
+        queue_size=settings.SHADOW_QUEUE_SIZE,
+        report_interval=settings.SHADOW_REPORT_INTERVAL,
+    )
+
+
 class PaymentService:
     """
     Service that holds all payment-related logic.
     An entry point for code that performs payment activity.
+    Payments are performed on behalf of `merchant_id` (with its PSP
+    credentials) or with default credentials if it's None.
     """
-    gateway = BraintreeGateway()
+    credential_store = build_credential_store()
+    gateway = build_gateway(credential_store)
+    capture_scheduler = CaptureScheduler(
+        settings.CAPTURE_PATH,
+        capture=lambda transaction_ids, merchant_id: PaymentService.capture(
+            transaction_ids, merchant_id,
+        ),
+        batch_size=settings.CAPTURE_BATCH_SIZE,
+        interval=settings.CAPTURE_INTERVAL,
+        max_attempts=settings.CAPTURE_MAX_ATTEMPTS,
+        fsync=settings.CAPTURE_FSYNC,
+    )
+    outbox = build_outbox()
+    shadow = build_shadow()
 
     @classmethod
-    def tokenize(cls, card_number: str, expiry_date: str) -> str:
+    def warm_up(cls) -> None:
+        """
+        Prepare gateway to serve requests. Failures are only logged, since
+        gateway will be able to serve requests anyway (just slower).
+        Publishing of events and capture of transactions left by previous
+        workers are started as well.
+        """
+        try:
+            cls.gateway.warm_up()
+        except Exception:
+            logger.warning('Could not warm up payment gateway', exc_info=True)
+
+        if cls.outbox is not None:
+            cls.outbox.start()
+        cls.capture_scheduler.start()
+
+    @classmethod
+    def authenticate_merchant(cls, merchant_id: str,
+                              client_key: Optional[str]) -> bool:
+        """
+        Check that request is made by merchant: client key must match the
+        one in merchant credentials (see `CredentialStore.authenticate`).
+        """
+        return cls.credential_store is not None and cls.credential_store.authenticate(
+            merchant_id, client_key,
+        )
+
+    @classmethod
+    def tokenize(cls, card_number: str, expiry_date: str,
+                 merchant_id: Optional[str] = None) -> str:
         """
         Holds a logic of card tokenizing.
         For now it's just delegating call to the corresponding gateway.
+        Sampled requests are mirrored to candidate gateway in shadow mode
+        (see `ShadowTraffic`).
         :return: token generated by PSP for provided card details
         """
+        started_at = time.perf_counter()
         try:
-            token = cls.gateway.tokenize_card(card_number, expiry_date)
+            token = cls.gateway.tokenize_card(
+                card_number, expiry_date, merchant_id=merchant_id,
+            )
         except GatewayError as exception:
+            cls._mirror(card_number, expiry_date, started_at, exception)
             raise PaymentServiceError(exception)
 
+        cls._mirror(card_number, expiry_date, started_at)
         return token
 
     @classmethod
-    def sale(cls, token: str, transaction_amount: Decimal) -> SaleResult:
+    def sale(cls, token: str, transaction_amount: Decimal,
+             merchant_id: Optional[str] = None) -> SaleResult:
         """
         Holds a logic of processing sale by provided token.
         For now it's just delegating call to the corresponding gateway.
         :return: result of sale request from PSP
         """
         try:
-            sale_result = cls.gateway.sale_by_token(token, transaction_amount)
+            sale_result = cls.gateway.sale_by_token(
+                token, transaction_amount, merchant_id=merchant_id,
+            )
         except GatewayError as exception:
             raise PaymentServiceError(exception)
 
@@ -52,5 +217,94 @@ class PaymentService:
             'Sale with id=%s requested successfully and has status=%s',
             sale_result.id, sale_result.status,
         )
+        cls._append_event('sale', {
+            'transaction_id': sale_result.id,
+            'status': sale_result.status,
+            'amount': str(transaction_amount),
+            'merchant_id': merchant_id,
+        })
 
         return sale_result
+
+    @classmethod
+    def authorize(cls, token: str, transaction_amount: Decimal,
+                  merchant_id: Optional[str] = None) -> SaleResult:
+        """
+        Holds a logic of authorizing payment by provided token. Authorized
+        transaction is captured later, in bulk with others
+        (see `CaptureScheduler`).
+        :return: result of authorization request from PSP
+        """
+        try:
+            authorization = cls.gateway.authorize_by_token(
+                token, transaction_amount, merchant_id=merchant_id,
+            )
+        except GatewayError as exception:
+            raise PaymentServiceError(exception)
+
+        logger.info(
+            'Authorization with id=%s requested successfully and has status=%s',
+            authorization.id, authorization.status,
+        )
+        cls._append_event('authorize', {
+            'transaction_id': authorization.id,
+            'status': authorization.status,
+            'amount': str(transaction_amount),
+            'merchant_id': merchant_id,
+        })
+        cls.capture_scheduler.schedule(authorization.id, merchant_id)
+
+        return authorization
+
+    @classmethod
+    def capture(cls, transaction_ids: List[str],
+                merchant_id: Optional[str] = None) -> List[CaptureResult]:
+        """
+        Holds a logic of capturing of authorized transactions in bulk.
+        For now it's just delegating call to the corresponding gateway.
+        Event is recorded for every captured transaction (failed ones are
+        retried by `CaptureScheduler`).
+        :raise PaymentServiceError: if none of transactions could be captured
+        :return: results of captures from PSP
+        """
+        try:
+            results = cls.gateway.capture_transactions(
+                transaction_ids, merchant_id=merchant_id,
+            )
+        except GatewayError as exception:
+            raise PaymentServiceError(exception)
+
+        logger.info(
+            'Capture of %s transaction(s) requested, %s failed',
+            len(results), sum(result.error is not None for result in results),
+        )
+        for result in results:
+            if result.error is None:
+                cls._append_event('capture', {
+                    'transaction_id': result.id,
+                    'status': result.status,
+                    'merchant_id': merchant_id,
+                })
+
+        return results
+
+    @classmethod
+    def _append_event(cls, event_type: str, data: dict) -> None:
+        """
+        Record payment event if outbox is configured (see `Outbox`).
+        """
+        if cls.outbox is not None:
+            cls.outbox.append(event_type, data)
+
+    @classmethod
+    def _mirror(cls, card_number: str, expiry_date: str, started_at: float,
+                exception: Optional[GatewayError] = None) -> None:
+        """
+        Mirror tokenize request to candidate gateway if shadow mode is on.
+        :param started_at: `time.perf_counter` value taken before request
+        """
+        if cls.shadow is not None:
+            cls.shadow.mirror(
+                card_number, expiry_date, time.perf_counter() - started_at,
+                get_outcome(exception),
+            )
@@ -0,0 +1,240 @@
+"""
+Shadow traffic: a sampled fraction of tokenize requests is mirrored to
+a candidate gateway (e.g. Braintree sandbox with new API version, or a local
+stub) off the request path, to compare its latencies and responses with
+the gateway that serves production before rolling it out.
+"""
+import logging
+import math
+import queue
+import random
+import threading
+import time
+from array import array
+from collections import Counter
+from typing import Optional
+
+from payments.gateways.base import BaseGateway, GatewayError
+
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyHistogram:
+    """
+    Latency distribution in fixed memory: counts of latencies in buckets
+    growing by `growth` factor from `min_latency` to `max_latency` seconds,
+    so percentiles are accurate within that factor.
+    """
+
+    def __init__(self, min_latency: float = 0.001, max_latency: float = 60,
+                 growth: float = 1.05):
+        self.min_latency = min_latency
+        self.growth = growth
+        self._log_growth = math.log(growth)
+        size = math.ceil(math.log(max_latency / min_latency) / self._log_growth) + 1
+        self.counts = array('L', bytes(array('L').itemsize * size))
+        self.total = 0
+
+    def add(self, latency: float) -> None:
+        if latency <= self.min_latency:
+            index = 0
+        else:
+            index = min(
+                int(math.log(latency / self.min_latency) / self._log_growth) + 1,
+                len(self.counts) - 1,
+            )
+        self.counts[index] += 1
+        self.total += 1
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """
+        :return: upper bound of bucket with `percent` percentile of latencies
+        in seconds or None if there are none
+        """
+        if not self.total:
+            return None
+
+        rank = math.ceil(self.total * percent / 100)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.min_latency * self.growth ** index
+
+    def summary(self) -> dict:
+        """
+        :return: p50/p90/p99 latencies in milliseconds
+        """
+        return {
+            f'p{percent}': round(self.percentile(percent) * 1000, 1) if self.total else None
+            for percent in (50, 90, 99)
+        }
+
+
+class ShadowTraffic:
+    """
+    Mirrors sampled tokenize requests to `candidate` gateway and records
+    latencies of both gateways side by side and differences of their
+    outcomes (success or error message; tokens are unique per request and
+    not compared).
+
+    Extra load and memory are strictly bounded: at most `max_rate` requests
+    per second (on top of `sample_rate`) are mirrored by a single background
+    thread, one at a time. Requests that don't fit into queue of `queue_size`
+    are dropped instead of waiting, so a slow candidate never affects the
+    request path. Latencies are kept in histograms and at most `max_diffs`
+    distinct differences are tracked. Summary is logged every
+    `report_interval` seconds.
+    Requests are mirrored without merchant: candidate uses own credentials.
+    """
+
+    def __init__(self, candidate: BaseGateway, sample_rate: float, max_rate: float = 10,
+                 queue_size: int = 100, max_diffs: int = 100, report_interval: float = 60):
+        self.candidate = candidate
+        self.sample_rate = sample_rate
+        self.max_rate = max_rate
+        self.max_diffs = max_diffs
+        self.report_interval = report_interval
+        self.latencies = {'primary': LatencyHistogram(), 'candidate': LatencyHistogram()}
+        self.diffs = Counter()  # (primary outcome, candidate outcome) -> count
+        self.stats = Counter()  # mirrored, matched, differed, dropped, failed
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._allowance = max_rate
+        self._allowance_updated_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._reported_at = time.monotonic()
+
+    def mirror(self, card_number: str, expiry_date: str, latency: float,
+               outcome: str) -> bool:
+        """
+        Schedule tokenize request served by primary gateway to be sent
+        to candidate (if it's sampled and fits into limits).
+        :param latency: seconds primary gateway took
+        :param outcome: outcome of primary gateway (see `get_outcome`)
+        :return: whether request is scheduled
+        """
+        if random.random() >= self.sample_rate or not self._take_allowance():
+            return False
+
+        try:
+            self._queue.put_nowait((card_number, expiry_date, latency, outcome))
+        except queue.Full:
+            self._count('dropped')
+            return False
+
+        self.start()
+        return True
+
+    def compare(self, card_number: str, expiry_date: str, latency: float,
+                outcome: str) -> None:
+        """
+        Send request to candidate and record it side by side with
+        the primary one.
+        """
+        started_at = time.perf_counter()
+        try:
+            self.candidate.tokenize_card(card_number, expiry_date)
+        except GatewayError as exception:
+            candidate_outcome = get_outcome(exception)
+        else:
+            candidate_outcome = get_outcome()
+        candidate_latency = time.perf_counter() - started_at
+
+        self.latencies['primary'].add(latency)
+        self.latencies['candidate'].add(candidate_latency)
+        if candidate_outcome == outcome:
+            self._count('mirrored', 'matched')
+            return
+
+        self._count('mirrored', 'differed')
+        diff = (outcome, candidate_outcome)
+        if diff in self.diffs or len(self.diffs) < self.max_diffs:
+            self.diffs[diff] += 1
+
+    def report(self) -> dict:
+        """
+        :return: counts of requests, latency percentiles of both gateways
+        and the most common differences
+        """
+        with self._lock:
+            stats = dict(self.stats)
+
+        return {
+            **stats,
+            'primary': self.latencies['primary'].summary(),
+            'candidate': self.latencies['candidate'].summary(),
+            'diffs': [
+                {'primary': primary, 'candidate': candidate, 'count': count}
+                for (primary, candidate), count in self.diffs.most_common(10)
+            ],
+        }
+
+    def start(self) -> None:
+        """
+        Start background thread (once), so it's started in the worker
+        process rather than in the one it's forked from.
+        """
+        if self._thread is not None:
+            return
+
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='shadow-traffic', daemon=True,
+                )
+                self._thread.start()
+
+    def _count(self, *keys: str) -> None:
+        """
+        Increment stats, which are updated both by request threads and
+        background one.
+        """
+        with self._lock:
+            for key in keys:
+                self.stats[key] += 1
+
+    def _take_allowance(self) -> bool:
+        """
+        Token bucket of `max_rate` mirrored requests per second.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._allowance = min(
+                self.max_rate,
+                self._allowance + (now - self._allowance_updated_at) * self.max_rate,
+            )
+            self._allowance_updated_at = now
+            if self._allowance < 1:
+                return False
+
+            self._allowance -= 1
+            return True
+
+    def _run(self) -> None:
+        while True:
+            try:
+                request = self._queue.get(timeout=self.report_interval)
+            except queue.Empty:
+                request = None
+
+            if request is not None:
+                try:
+                    self.compare(*request)
+                except Exception:
+                    self._count('failed')
+                    logger.exception('Could not mirror request to candidate gateway')
+                del request  # don't keep card number while waiting
+
+            if time.monotonic() - self._reported_at >= self.report_interval:
+                self._reported_at = time.monotonic()
+                if self.stats:
+                    logger.info('Shadow traffic: %s', self.report())
+
+
+def get_outcome(exception: Optional[GatewayError] = None) -> str:
+    """
+    :return: outcome of gateway request to compare: `ok` or error message
+    """
+    return 'ok' if exception is None else f'error: {exception}'
@@ -1,10 +1,18 @@
+import concurrent.futures
+import json
+import time
 from decimal import Decimal
 
+import httpx
 import requests
 import pytest
 
-from payments.gateways.base import GatewayError
-from payments.gateways.braintree import BraintreeGateway
+from payments.credentials import Credentials, FileCredentialStore
+from payments.gateways.base import CaptureResult, GatewayError
+from payments.gateways.braintree import BraintreeGateway, TransportReaper
+from payments.gateways.http1 import KeepAliveTransport
+from payments.gateways.http2 import HTTP2Transport
+from payments.gateways.recording import read_records
 
 
 @pytest.fixture
@@ -140,3 +148,287 @@ def test_perform_query_missing_keys(requests_post_mock, make_random_str, caplog)
         BraintreeGateway()._perform_query(make_random_str(64), {'some_var': 'abc'})
 
     assert 'Response form Braintree missing informative keys' in caplog.messages
+
+
+def test_perform_query_record_mode(requests_post_mock, make_random_str, settings, tmp_path):
+    records_path = tmp_path / 'records.jsonl'
+    settings.BRAINTREE_RECORD_FILE = str(records_path)
+    token = make_random_str()
+    card_number = '4111111111111111'
+    requests_post_mock.return_value.status_code = 200
+    requests_post_mock.return_value.json.return_value = {
+        'data': {'tokenizeCreditCard': {'paymentMethod': {'id': token}}},
+    }
+
+    BraintreeGateway().tokenize_card(card_number, '12/2020')
+
+    [record] = read_records(records_path)
+    assert record['op'] == 'tokenizeCreditCard'
+    assert record['status'] == 200
+    assert record['elapsed'] >= 0
+    assert record['response']['data']['tokenizeCreditCard']['paymentMethod']['id'] == token
+    assert record['vars']['input']['creditCard']['number'] == '************1111'
+    assert card_number not in records_path.read_text()
+
+
+def test_perform_query_record_mode_connection_error(requests_post_mock, make_random_str,
+                                                    settings, tmp_path):
+    records_path = tmp_path / 'records.jsonl'
+    settings.BRAINTREE_RECORD_FILE = str(records_path)
+    requests_post_mock.side_effect = requests.ConnectionError
+
+    with pytest.raises(GatewayError, match='Connection issues'):
+        BraintreeGateway()._perform_query(make_random_str(64), {'some_var': 'abc'})
+
+    [record] = read_records(records_path)
+    assert record['error'] == 'Connection issues'
+    assert record['response'] is None
+
+
+def test_perform_query_http2(requests_post_mock, make_random_str, settings, mocker):
+    settings.BRAINTREE_HTTP2 = True
+    settings.BRAINTREE_API_URL = url = f'https://{make_random_str(10)}.com'
+    http2_post_mock = mocker.patch('payments.gateways.braintree.HTTP2Transport.post')
+    http2_post_mock.return_value.json.return_value = {'data': {'someMutation': {}}}
+    variables = {'some_var': 'abc'}
+
+    gateway = BraintreeGateway()
+    response_data = gateway._perform_query('query', variables)
+
+    assert response_data == {'data': {'someMutation': {}}}
+    assert not requests_post_mock.called
+    http2_post_mock.assert_called_once_with(
+        url, json={'query': 'query', 'variables': variables},
+        headers=gateway._prepare_headers(), timeout=gateway.API_REQUEST_TIMEOUT,
+    )
+
+
+@pytest.mark.parametrize('exception', (
+    httpx.ConnectError, httpx.ReadTimeout, httpx.PoolTimeout, concurrent.futures.TimeoutError,
+))
+def test_perform_query_http2_connection_errors(exception, make_random_str, settings, mocker, caplog):
+    settings.BRAINTREE_HTTP2 = True
+    mocker.patch(
+        'payments.gateways.braintree.HTTP2Transport.post', side_effect=exception('error'),
+    )
+
+    with pytest.raises(GatewayError, match='Connection issues'):
+        BraintreeGateway()._perform_query(make_random_str(64), {'some_var': 'abc'})
+
+    assert 'Connection issues for request to Braintree API' in caplog.messages
+
+
+def test_perform_query_keep_alive(requests_post_mock, make_random_str, settings, mocker):
+    settings.BRAINTREE_KEEP_ALIVE = True
+    keep_alive_post_mock = mocker.patch('payments.gateways.braintree.KeepAliveTransport.post')
+    keep_alive_post_mock.return_value.json.return_value = {'data': {'someMutation': {}}}
+
+    gateway = BraintreeGateway()
+    gateway._perform_query('query', {})
+    gateway._perform_query('query', {})
+
+    assert not requests_post_mock.called
+    assert keep_alive_post_mock.call_count == 2
+
+
+@pytest.mark.parametrize('keep_alive,connections,is_warmed_up', [
+    (True, 2, True), (True, 0, False), (False, 2, False),
+])
+def test_warm_up(keep_alive, connections, is_warmed_up, settings, mocker, make_random_str):
+    settings.BRAINTREE_KEEP_ALIVE = keep_alive
+    settings.BRAINTREE_WARM_UP_CONNECTIONS = connections
+    settings.BRAINTREE_API_URL = url = f'https://{make_random_str(10)}.com'
+    warm_up_mock = mocker.patch('payments.gateways.braintree.KeepAliveTransport.warm_up')
+
+    gateway = BraintreeGateway()
+    gateway.warm_up()
+
+    if is_warmed_up:
+        warm_up_mock.assert_called_once_with(url, connections, timeout=gateway.API_REQUEST_TIMEOUT)
+    else:
+        assert not warm_up_mock.called
+
+
+def test_authorize_by_token_success(requests_post_mock, make_random_str):
+    token, transaction_id = make_random_str(), make_random_str()
+    requests_post_mock.return_value.json.return_value = {
+        'data': {
+            'authorizePaymentMethod': {
+                'transaction': {'id': transaction_id, 'status': 'AUTHORIZED'},
+            },
+        },
+    }
+
+    result = BraintreeGateway().authorize_by_token(token, Decimal('10.50'))
+
+    request_json = requests_post_mock.call_args[1]['json']
+    assert 'authorizePaymentMethod(input: $input)' in request_json['query']
+    assert request_json['variables']['input'] == {
+        'paymentMethodId': token, 'transaction': {'amount': '10.50'},
+    }
+    assert result == (transaction_id, 'AUTHORIZED')
+
+
+def test_capture_transactions_partial_failure(requests_post_mock):
+    requests_post_mock.return_value.json.return_value = {
+        'data': {
+            'capture0': {'transaction': {'id': 'a', 'status': 'SUBMITTED_FOR_SETTLEMENT'}},
+            'capture1': None,
+        },
+        'errors': [{'message': 'Cannot capture', 'path': ['capture1']}],
+    }
+
+    results = BraintreeGateway().capture_transactions(['a', 'b'])
+
+    request_json = requests_post_mock.call_args[1]['json']
+    assert request_json['variables'] == {
+        'input0': {'transactionId': 'a'}, 'input1': {'transactionId': 'b'},
+    }
+    assert 'capture1: captureTransaction(input: $input1)' in request_json['query']
+    assert results == [
+        CaptureResult('a', 'SUBMITTED_FOR_SETTLEMENT', None),
+        CaptureResult('b', None, 'Cannot capture'),
+    ]
+
+
+def test_capture_transactions_request_error(requests_post_mock):
+    requests_post_mock.return_value.json.return_value = {
+        'data': None,
+        'errors': [{'message': 'Authentication credentials are invalid'}],
+    }
+
+    with pytest.raises(GatewayError, match='Authentication credentials are invalid'):
+        BraintreeGateway().capture_transactions(['a', 'b'])
+
+
+@pytest.fixture
+def credential_store(tmp_path):
+    path = tmp_path / 'credentials.json'
+    path.write_text(json.dumps({
+        'merchant-a': {'api_key': 'key-a', 'api_url': 'https://a.example.com'},
+        'merchant-b': {'api_key': 'key-b'},
+    }))
+    return FileCredentialStore(str(path), reload_interval=0)
+
+
+def test_perform_query_merchant_credentials(requests_post_mock, credential_store, settings):
+    settings.BRAINTREE_API_URL = 'https://default.example.com'
+    requests_post_mock.return_value.json.return_value = {'data': {'someMutation': {}}}
+    gateway = BraintreeGateway(credential_store=credential_store)
+
+    gateway._perform_query('query', {}, 'merchant-a')
+    gateway._perform_query('query', {}, 'merchant-b')
+
+    (url_a,), kwargs_a = requests_post_mock.call_args_list[0]
+    (url_b,), kwargs_b = requests_post_mock.call_args_list[1]
+    assert url_a == 'https://a.example.com'
+    assert kwargs_a['headers']['Authorization'] == 'Basic key-a'
+    assert url_b == 'https://default.example.com'
+    assert kwargs_b['headers']['Authorization'] == 'Basic key-b'
+
+
+def test_perform_query_default_credentials(requests_post_mock, settings):
+    settings.BRAINTREE_API_URL = 'https://default.example.com'
+    requests_post_mock.return_value.json.return_value = {'data': {'someMutation': {}}}
+    gateway = BraintreeGateway(
+        default_credentials=Credentials('sandbox-key', 'https://sandbox.example.com'),
+        api_version='2021-01-01',
+    )
+
+    gateway._perform_query('query', {})
+
+    (url,), kwargs = requests_post_mock.call_args
+    assert url == 'https://sandbox.example.com'
+    assert kwargs['headers'] == {
+        'Authorization': 'Basic sandbox-key', 'Braintree-Version': '2021-01-01',
+    }
+
+
+def test_perform_query_unknown_merchant(requests_post_mock, credential_store):
+    with pytest.raises(GatewayError, match='Unknown merchant: merchant-c'):
+        BraintreeGateway(credential_store)._perform_query('query', {}, 'merchant-c')
+
+    with pytest.raises(GatewayError, match='Unknown merchant: merchant-a'):
+        BraintreeGateway()._perform_query('query', {}, 'merchant-a')
+
+    assert not requests_post_mock.called
+
+
+def test_headers_rebuilt_only_on_credentials_change(credential_store, settings):
+    gateway = BraintreeGateway(credential_store)
+    headers = gateway._prepare_headers('merchant-a')
+    default_headers = gateway._prepare_headers()
+
+    assert gateway._prepare_headers('merchant-a') is headers
+    assert gateway._prepare_headers() is default_headers
+
+    settings.BRAINTREE_API_KEY = 'rotated-key'
+    assert gateway._prepare_headers() == {
+        'Authorization': 'Basic rotated-key', 'Braintree-Version': gateway.API_VERSION,
+    }
+
+
+def test_transports_per_merchant(credential_store, settings):
+    settings.BRAINTREE_KEEP_ALIVE = True
+    gateway = BraintreeGateway(credential_store)
+
+    default_transport = gateway._get_transport()
+    transport_a = gateway._get_transport('merchant-a')
+
+    assert gateway._get_transport('merchant-a') is transport_a
+    assert transport_a is not default_transport
+    assert transport_a.ssl_context is default_transport.ssl_context
+
+
+def test_least_recently_used_transports_evicted(credential_store, settings, mocker):
+    settings.BRAINTREE_KEEP_ALIVE = True
+    settings.BRAINTREE_MAX_MERCHANT_TRANSPORTS = 1
+    close_later_mock = mocker.patch.object(TransportReaper, 'close_later')
+    gateway = BraintreeGateway(credential_store)
+
+    transport_a = gateway._get_transport('merchant-a')
+    default_transport = gateway._get_transport()
+    transport_b = gateway._get_transport('merchant-b')
+
+    assert list(gateway._transports.items()) == [(None, default_transport), ('merchant-b', transport_b)]
+    close_later_mock.assert_called_once_with(transport_a)
+    assert gateway._get_transport('merchant-a') is not transport_a
+
+
+def test_transport_reaper_closes_after_delay(mocker):
+    reaper = TransportReaper(delay=0.05)
+    transports = [mocker.Mock(), mocker.Mock()]
+    transports[0].close.side_effect = OSError  # doesn't stop reaper
+
+    started_at = time.monotonic()
+    reaper.close_later(transports[0])
+    thread = reaper._thread
+    reaper.close_later(transports[1])
+    assert reaper._thread is thread  # single thread for all transports
+    assert not transports[0].close.called
+
+    deadline = time.monotonic() + 5
+    while not transports[1].close.called and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert transports[1].close.called
+    assert time.monotonic() - started_at >= 0.05
+    assert len(reaper) == 0
+
+
+@pytest.mark.parametrize('transport, http2, keep_alive, transport_class', [
+    (None, True, False, HTTP2Transport),
+    (None, False, True, KeepAliveTransport),
+    (None, False, False, type(None)),
+    ('keep-alive', True, False, KeepAliveTransport),
+    ('none', False, True, type(None)),
+])
+def test_transport_kind(transport, http2, keep_alive, transport_class, settings):
+    settings.BRAINTREE_HTTP2 = http2
+    settings.BRAINTREE_KEEP_ALIVE = keep_alive
+    gateway = BraintreeGateway(transport=transport)
+
+    transport = gateway._get_transport()
+
+    assert isinstance(transport, transport_class)
+    if transport is not None:
+        transport.close()
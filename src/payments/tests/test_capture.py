@@ -0,0 +1,184 @@
+import time
+
+import pytest
+
+from payments.capture import CaptureScheduler
+from payments.gateways.base import CaptureResult, GatewayError
+
+
+@pytest.fixture
+def capture_mock(mocker):
+    mock = mocker.Mock()
+    mock.side_effect = lambda transaction_ids, merchant_id: [
+        CaptureResult(transaction_id, 'SUBMITTED_FOR_SETTLEMENT', None)
+        for transaction_id in transaction_ids
+    ]
+    return mock
+
+
+@pytest.fixture
+def make_scheduler(tmp_path, capture_mock):
+    def make_scheduler(**kwargs):
+        kwargs.setdefault('interval', 0)
+        return CaptureScheduler(str(tmp_path / 'captures.sqlite3'), capture_mock, **kwargs)
+
+    return make_scheduler
+
+
+def test_flush_captures_in_batches(make_scheduler, capture_mock):
+    scheduler = make_scheduler(batch_size=2)
+    for transaction_id in ('a', 'b', 'c'):
+        scheduler.schedule(transaction_id)
+
+    scheduler.flush()
+
+    assert [call[0][0] for call in capture_mock.call_args_list] == [['a', 'b'], ['c']]
+    assert scheduler.pending_count == 0
+    assert scheduler.stats['captured'] == 3
+    assert scheduler.stats['batches'] == 2
+
+
+def test_failed_captures_retried_after_backoff(make_scheduler, capture_mock, mocker):
+    capture_mock.side_effect = lambda transaction_ids, merchant_id: [
+        CaptureResult('a', 'SUBMITTED_FOR_SETTLEMENT', None),
+        CaptureResult('b', None, 'Cannot capture'),
+    ]
+    scheduler = make_scheduler(max_attempts=2)
+    scheduler.interval = 5
+    scheduler.schedule('a')
+    scheduler.schedule('b')
+
+    scheduler.flush()
+
+    assert scheduler.pending_count == 1
+    assert scheduler.stats['retried'] == 1
+    assert not scheduler.failed
+
+    capture_mock.side_effect = lambda transaction_ids, merchant_id: [
+        CaptureResult('b', None, 'Cannot capture'),
+    ]
+    scheduler.flush()
+    assert capture_mock.call_count == 1  # not available until backoff passes
+
+    mocker.patch('payments.workqueue.time.time', return_value=time.time() + 5)
+    scheduler.flush()
+
+    assert scheduler.pending_count == 0
+    assert scheduler.failed == {'b': 'Cannot capture'}
+    assert scheduler.stats == {'batches': 2, 'captured': 1, 'retried': 1, 'failed': 1}
+
+
+@pytest.mark.parametrize('exception', [GatewayError('Connection issues'), KeyError('transaction')])
+def test_failed_batch_keeps_attempts(exception, make_scheduler, capture_mock, mocker, caplog):
+    original_side_effect = capture_mock.side_effect
+    capture_mock.side_effect = exception
+    scheduler = make_scheduler(max_attempts=1)
+    scheduler.schedule('a', 'merchant-a')
+    scheduler.schedule('b')
+
+    scheduler.flush()
+
+    # flush stops at failed batch, it's captured again after backoff
+    capture_mock.assert_called_once_with(['a'], 'merchant-a')
+    assert scheduler.stats['failed_batches'] == 1
+    assert scheduler.backoff == 1
+    assert not scheduler.failed
+    assert 'Capture of 1 transaction(s) failed: ' in caplog.messages[-1]
+
+    capture_mock.side_effect = original_side_effect
+    scheduler.flush()
+    assert capture_mock.call_args == ((['b'], None),)
+
+    mocker.patch('payments.workqueue.time.time', return_value=time.time() + 1)
+    scheduler.flush()
+    assert capture_mock.call_args == ((['a'], 'merchant-a'),)
+    assert scheduler.pending_count == 0
+    assert scheduler.stats['captured'] == 2
+
+
+def test_failed_batches_back_off_exponentially(make_scheduler, capture_mock):
+    capture_mock.side_effect = GatewayError('Connection issues')
+    scheduler = make_scheduler()
+    scheduler.interval, scheduler.max_backoff = 1, 10
+
+    for _ in range(5):
+        scheduler._capture_batch([(1, 'a', 0)], None)
+
+    assert scheduler.backoff == 10
+    assert [scheduler._get_backoff(failures) for failures in range(1, 6)] == [1, 2, 4, 8, 10]
+
+
+def test_pending_captures_survive_restart(make_scheduler, capture_mock):
+    make_scheduler().schedule('a', 'merchant-a')
+
+    scheduler = make_scheduler()  # e.g. worker restarted after crash
+    scheduler.flush()
+
+    capture_mock.assert_called_once_with(['a'], 'merchant-a')
+    assert scheduler.pending_count == 0
+
+
+def test_claimed_batch_captured_again_after_lease(make_scheduler, capture_mock, mocker):
+    scheduler = make_scheduler(lease=60)
+    scheduler.schedule('a')
+    # worker dies in the middle of capture
+    scheduler._claim_batch(last_id=1)
+
+    other_scheduler = make_scheduler(lease=60)
+    other_scheduler.flush()
+    assert not capture_mock.called
+
+    mocker.patch('payments.workqueue.time.time', return_value=time.time() + 61)
+    other_scheduler.flush()
+    capture_mock.assert_called_once_with(['a'], None)
+
+
+def test_schedule_failure_is_logged(tmp_path, capture_mock, caplog):
+    scheduler = CaptureScheduler(str(tmp_path / 'missing' / 'captures.sqlite3'), capture_mock)
+
+    assert not scheduler.schedule('a')
+
+    assert scheduler.stats['schedule_failed'] == 1
+    assert 'Could not schedule capture of transaction with id=a (merchant None)' in caplog.messages
+
+
+def test_failed_shown_are_bounded(make_scheduler, capture_mock, mocker):
+    mocker.patch.object(CaptureScheduler, 'MAX_FAILED_SHOWN', 2)
+    capture_mock.side_effect = lambda transaction_ids, merchant_id: [
+        CaptureResult(transaction_id, None, 'Declined') for transaction_id in transaction_ids
+    ]
+    scheduler = make_scheduler(max_attempts=1)
+    for transaction_id in ('a', 'b', 'c'):
+        scheduler.schedule(transaction_id)
+
+    scheduler.flush()
+
+    assert scheduler.failed == {'b': 'Declined', 'c': 'Declined'}
+    assert scheduler.stats['failed'] == 3
+
+
+def test_full_batch_wakes_background_thread(make_scheduler, capture_mock):
+    scheduler = make_scheduler(batch_size=2, interval=60)
+    scheduler.schedule('a')
+    scheduler.schedule('b')
+
+    for _ in range(100):  # wait for background flush
+        if capture_mock.called:
+            break
+        time.sleep(0.01)
+
+    capture_mock.assert_called_once_with(['a', 'b'], None)
+
+
+def test_flush_captures_batches_per_merchant(make_scheduler, capture_mock):
+    scheduler = make_scheduler(batch_size=2)
+    scheduler.schedule('a', 'merchant-a')
+    scheduler.schedule('b')
+    scheduler.schedule('c', 'merchant-a')
+
+    scheduler.flush()
+
+    assert [call[0] for call in capture_mock.call_args_list] == [
+        (['a', 'c'], 'merchant-a'), (['b'], None),
+    ]
+    assert scheduler.stats['captured'] == 3
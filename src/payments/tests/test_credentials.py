@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import sqlite3
+
+import pytest
+
+from payments.credentials import (
+    CredentialStore, Credentials, FileCredentialStore, SQLiteCredentialStore,
+)
+
+
+def _write_json(path, data, mtime_shift=0):
+    path.write_text(json.dumps(data))
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + mtime_shift))
+
+
+@pytest.fixture
+def credentials_file(tmp_path):
+    path = tmp_path / 'credentials.json'
+    _write_json(path, {
+        'merchant-a': {'api_key': 'key-a'},
+        'merchant-b': {'api_key': 'key-b', 'api_url': 'https://b.example.com'},
+    })
+    return path
+
+
+@pytest.fixture
+def credentials_db(tmp_path):
+    path = tmp_path / 'credentials.sqlite3'
+    connection = sqlite3.connect(str(path))
+    connection.execute(SQLiteCredentialStore.CREATE_TABLE_SQL)
+    connection.execute(
+        "INSERT INTO merchant_credentials VALUES ('merchant-a', 'key-a', NULL, NULL)",
+    )
+    connection.commit()
+    connection.close()
+    return path
+
+
+def test_file_store_get(credentials_file):
+    store = CredentialStore.from_path(str(credentials_file))
+
+    assert isinstance(store, FileCredentialStore)
+    assert len(store) == 2
+    assert store.get('merchant-a') == Credentials('key-a', None)
+    assert store.get('merchant-b') == Credentials('key-b', 'https://b.example.com')
+    assert store.get('merchant-c') is None
+
+
+def test_file_store_hot_reload(credentials_file, mocker):
+    monotonic_mock = mocker.patch('payments.credentials.time.monotonic', return_value=0)
+    store = FileCredentialStore(str(credentials_file), reload_interval=5)
+    store.get('merchant-a')
+    _write_json(credentials_file, {'merchant-a': {'api_key': 'new-key'}}, mtime_shift=10 ** 9)
+
+    assert store.get('merchant-a') == Credentials('key-a', None)  # not checked yet
+
+    monotonic_mock.return_value = 5
+    assert store.get('merchant-a') == Credentials('new-key', None)
+    assert store.get('merchant-b') is None
+
+
+def test_file_store_keeps_credentials_if_reload_fails(credentials_file, caplog):
+    store = FileCredentialStore(str(credentials_file), reload_interval=0.001)
+    credentials_file.write_text('{"merchant-a": ')
+    store._next_check = 0
+
+    assert store.get('merchant-a') == Credentials('key-a', None)
+    assert f'Could not reload credentials from {credentials_file}' in caplog.messages
+
+
+def test_file_store_invalid_file(tmp_path):
+    path = tmp_path / 'credentials.json'
+    path.write_text('{"merchant-a": {"api_url": "https://a.example.com"}}')
+
+    with pytest.raises(ValueError, match='Invalid credentials file'):
+        FileCredentialStore(str(path))
+
+
+def test_sqlite_store_get_and_reload(credentials_db):
+    store = CredentialStore.from_path(str(credentials_db), reload_interval=0)
+
+    assert isinstance(store, SQLiteCredentialStore)
+    assert store.get('merchant-a') == Credentials('key-a', None)
+
+    connection = sqlite3.connect(str(credentials_db))
+    connection.execute(
+        "INSERT INTO merchant_credentials VALUES ('merchant-b', 'key-b', 'https://b.example.com', NULL)",
+    )
+    connection.commit()
+    connection.close()
+    assert store.get('merchant-b') is None  # reloaded only explicitly
+
+    store.reload()
+    assert store.get('merchant-b') == Credentials('key-b', 'https://b.example.com')
+
+
+def test_authenticate(tmp_path):
+    path = tmp_path / 'credentials.json'
+    _write_json(path, {
+        'merchant-a': {
+            'api_key': 'key-a', 'client_key_sha256': hashlib.sha256(b'client-key-a').hexdigest(),
+        },
+        'merchant-b': {'api_key': 'key-b'},
+    })
+    store = FileCredentialStore(str(path))
+
+    assert store.authenticate('merchant-a', 'client-key-a')
+    assert not store.authenticate('merchant-a', 'client-key-b')
+    assert not store.authenticate('merchant-a', None)
+    assert not store.authenticate('merchant-b', '')  # merchant without client key
+    assert not store.authenticate('merchant-c', 'client-key-a')
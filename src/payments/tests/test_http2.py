@@ -0,0 +1,37 @@
+import concurrent.futures
+import threading
+
+import httpcore
+import pytest
+
+from payments.gateways.http2 import HTTP2Transport
+from payments.gateways.network import DNSCache
+
+
+def test_post_does_not_wait_for_hung_loop():
+    transport = HTTP2Transport()
+    release = threading.Event()
+    transport.loop.call_soon_threadsafe(release.wait)  # blocks the loop thread
+
+    try:
+        with pytest.raises(concurrent.futures.TimeoutError):
+            transport.post('http://localhost:1', json={}, headers={}, timeout=0.1)
+    finally:
+        release.set()
+        transport.close()
+
+
+def test_connect_to_address_from_dns_cache(mocker):
+    dns_cache = mocker.Mock(spec=DNSCache)
+    dns_cache.resolve.return_value = '10.0.0.1'
+    transport = HTTP2Transport(dns_cache=dns_cache)
+    backend = transport.client._transport._pool._network_backend
+    backend._backend = mocker.Mock(spec=httpcore.AsyncNetworkBackend)
+
+    try:
+        transport._run(backend.connect_tcp('example.com', 443, timeout=1))
+    finally:
+        transport.close()
+
+    dns_cache.resolve.assert_called_once_with('example.com', 443)
+    backend._backend.connect_tcp.assert_called_once_with('10.0.0.1', 443, timeout=1)
@@ -0,0 +1,95 @@
+import shutil
+import socket
+import ssl
+import threading
+
+import pytest
+
+from benchmarks.stubs import make_self_signed_cert
+from payments.gateways.network import DNSCache, ResumingSSLContext
+
+
+@pytest.fixture
+def getaddrinfo_mock(mocker):
+    mock = mocker.patch('payments.gateways.network.socket.getaddrinfo')
+    mock.return_value = [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('10.0.0.1', 443))]
+    return mock
+
+
+@pytest.fixture
+def monotonic_mock(mocker):
+    mock = mocker.patch('payments.gateways.network.time.monotonic')
+    mock.return_value = 1000
+    return mock
+
+
+def test_dns_cache_resolves_once_per_ttl(getaddrinfo_mock, monotonic_mock):
+    dns_cache = DNSCache(ttl=60)
+
+    assert dns_cache.resolve('example.com') == '10.0.0.1'
+    monotonic_mock.return_value += 59
+    assert dns_cache.resolve('example.com') == '10.0.0.1'
+    assert getaddrinfo_mock.call_count == 1
+
+    monotonic_mock.return_value += 2
+    getaddrinfo_mock.return_value = [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('10.0.0.2', 443))]
+    assert dns_cache.resolve('example.com') == '10.0.0.2'
+    assert getaddrinfo_mock.call_count == 2
+
+
+def test_dns_cache_serves_stale_address_on_errors(getaddrinfo_mock, monotonic_mock):
+    dns_cache = DNSCache(ttl=60)
+    dns_cache.resolve('example.com')
+    monotonic_mock.return_value += 120
+    getaddrinfo_mock.side_effect = socket.gaierror
+
+    assert dns_cache.resolve('example.com') == '10.0.0.1'
+    with pytest.raises(socket.gaierror):
+        dns_cache.resolve('unknown.com')
+
+
+@pytest.fixture
+def tls_server(tmp_path):
+    """
+    TLS server on localhost answering every connection with a single line.
+    :return: port and certificate file
+    """
+    if shutil.which('openssl') is None:
+        pytest.skip('openssl CLI is required to make certificate')
+
+    certfile, keyfile = make_self_signed_cert(str(tmp_path))
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(certfile, keyfile)
+    server = socket.create_server(('localhost', 0))
+
+    def serve():
+        while True:
+            try:
+                connection, _ = server.accept()
+            except OSError:  # closed
+                return
+            with context.wrap_socket(connection, server_side=True) as tls_connection:
+                tls_connection.recv(1024)
+                tls_connection.sendall(b'ok\n')
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    yield server.getsockname()[1], certfile
+    server.close()
+
+
+def test_resuming_ssl_context_resumes_session(tls_server):
+    port, certfile = tls_server
+    context = ResumingSSLContext()
+    context.load_ca_bundle(certfile)
+
+    def connect():
+        with socket.create_connection(('localhost', port)) as connection:
+            with context.wrap_socket(connection, server_hostname='localhost') as tls_connection:
+                tls_connection.sendall(b'ping\n')
+                assert tls_connection.recv(1024) == b'ok\n'
+                return tls_connection.session_reused
+
+    assert not connect()
+    assert 'localhost' in context.sessions
+    assert connect()
@@ -0,0 +1,226 @@
+import sqlite3
+import time
+
+import pytest
+
+from payments.events.outbox import Outbox
+from payments.events.sinks import PermanentSinkError, QueueSink, SinkError
+
+
+@pytest.fixture
+def sink():
+    return QueueSink()
+
+
+@pytest.fixture
+def outbox(tmp_path, sink):
+    return Outbox(str(tmp_path / 'outbox.sqlite3'), sinks=[sink], batch_size=2, interval=0)
+
+
+def _drain(sink):
+    events = []
+    while not sink.queue.empty():
+        events.append(sink.queue.get_nowait())
+    return events
+
+
+def test_publish_in_batches(outbox, sink):
+    event_ids = [outbox.append('sale', {'transaction_id': str(i)}) for i in range(3)]
+
+    assert outbox.publish() == 3
+
+    events = _drain(sink)
+    assert [event['event_id'] for event in events] == event_ids
+    assert [event['transaction_id'] for event in events] == ['0', '1', '2']
+    assert {event['type'] for event in events} == {'sale'}
+    assert outbox.stats == {'appended': 3, 'batches': 2, 'published': 3}
+    assert outbox.lag()['pending'] == 0
+
+
+def test_failed_batch_published_again_after_backoff(outbox, sink, mocker):
+    outbox.append('sale', {'transaction_id': 'a'})
+    mocker.patch.object(sink, 'publish', side_effect=SinkError('Sink is down'))
+
+    with pytest.raises(SinkError):
+        outbox.publish()
+
+    mocker.stopall()
+    assert outbox.publish() == 0  # not available until backoff passes
+    assert outbox.lag()['pending'] == 1
+
+    outbox._execute_for_ids('UPDATE outbox SET available_at = 0 WHERE id IN ({})', [1])
+    assert outbox.publish() == 1
+    assert [event['transaction_id'] for event in _drain(sink)] == ['a']
+    assert outbox.stats['failed_batches'] == 1
+
+
+def test_expired_lease_claimed_again(outbox, sink):
+    outbox.append('sale', {'transaction_id': 'a'})
+    outbox.lease = 0
+    outbox._claim_batch()  # publisher died before publishing claimed batch
+
+    assert outbox.publish() == 1
+    assert [event['transaction_id'] for event in _drain(sink)] == ['a']
+
+
+def test_events_shared_between_outboxes(outbox, sink):
+    other_outbox = Outbox(outbox.path, sinks=[sink], interval=0)
+    outbox.append('sale', {'transaction_id': 'a'})
+
+    assert other_outbox.lag()['pending'] == 1
+    assert other_outbox.publish() == 1
+    assert outbox.lag()['pending'] == 0
+
+
+def test_corrupt_event_dropped(outbox, sink, caplog):
+    outbox.append('sale', {'transaction_id': 'a'})
+    outbox._get_connection().execute('UPDATE outbox SET payload = \'{"type": \' WHERE id = 1')
+    outbox.append('sale', {'transaction_id': 'b'})
+
+    assert outbox.publish() == 1
+
+    assert [event['transaction_id'] for event in _drain(sink)] == ['b']
+    assert outbox.stats['corrupt'] == 1
+    assert outbox.lag()['pending'] == 0
+    assert 'Dropped corrupt event 1 from outbox: \'{"type": \'' in caplog.messages
+
+
+def test_unexpected_sink_error_releases_batch(outbox, sink, mocker):
+    outbox.append('sale', {'transaction_id': 'a'})
+    mocker.patch.object(sink, 'publish', side_effect=TypeError)
+
+    with pytest.raises(TypeError):
+        outbox.publish()
+
+    assert outbox.stats['failed_batches'] == 1
+    attempts, = outbox._get_connection().execute('SELECT attempts FROM outbox').fetchone()
+    assert attempts == 1
+
+
+def test_rejected_events_moved_to_dead_letters(outbox, sink, mocker, caplog):
+    for transaction_id in 'abc':
+        outbox.append('sale', {'transaction_id': transaction_id})
+    outbox.batch_size = 3
+
+    def publish(events):
+        if 'b' in [event['transaction_id'] for event in events]:
+            raise PermanentSinkError('Rejected')
+        sink.queue.put_nowait(events)
+
+    mocker.patch.object(sink, 'publish', side_effect=publish)
+
+    assert outbox.publish() == 2
+
+    assert [
+        [event['transaction_id'] for event in events] for events in _drain(sink)
+    ] == [['a'], ['c']]
+    assert outbox.lag()['pending'] == 0
+    assert outbox.dead_count == 1
+    assert outbox.stats['dead'] == 1
+    assert 'Moved event 2 of outbox to dead letters: Rejected' in caplog.messages
+
+
+def test_events_moved_to_dead_letters_after_max_attempts(outbox, sink, mocker):
+    outbox.max_attempts = 2
+    outbox.append('sale', {'transaction_id': 'a'})
+    mocker.patch.object(sink, 'publish', side_effect=SinkError('Sink is down'))
+
+    for _ in range(2):
+        with pytest.raises(SinkError):
+            outbox.publish()
+        outbox._get_connection().execute('UPDATE outbox SET available_at = 0')
+
+    assert outbox.lag()['pending'] == 0
+    assert outbox._get_connection().execute(
+        'SELECT id, attempts, error FROM outbox_dead',
+    ).fetchall() == [(1, 2, 'Sink is down')]
+
+
+def test_requeue_dead(outbox, sink, mocker):
+    outbox.append('sale', {'transaction_id': 'a'})
+    mocker.patch.object(sink, 'publish', side_effect=PermanentSinkError('Rejected'))
+    assert outbox.publish() == 0
+
+    mocker.stopall()
+    assert outbox.requeue_dead() == 1
+
+    assert outbox.dead_count == 0
+    assert outbox.publish() == 1
+    assert [event['transaction_id'] for event in _drain(sink)] == ['a']
+
+
+def test_backoff_grows_with_failures(outbox):
+    outbox.interval, outbox.max_backoff = 1, 10
+
+    assert outbox.backoff == 1
+    outbox._failures = 3
+    assert outbox.backoff == 4
+    outbox._failures = 10
+    assert outbox.backoff == 10
+
+
+def test_lag(outbox, mocker):
+    mocker.patch('payments.events.outbox.time.time', return_value=1000.0)
+    outbox.append('sale', {})
+
+    mocker.patch('payments.events.outbox.time.time', return_value=1002.5)
+    assert outbox.lag() == {'pending': 1, 'oldest_age': 2.5}
+
+
+def test_lag_counts_range_of_pending_events(outbox, mocker):
+    for transaction_id in 'abc':
+        outbox.append('sale', {'transaction_id': transaction_id})
+    outbox._execute_for_ids('DELETE FROM outbox WHERE id IN ({})', [1, 2])
+
+    assert outbox.lag()['pending'] == 1
+    outbox.append('sale', {})
+    outbox._execute_for_ids('DELETE FROM outbox WHERE id IN ({})', [3])
+    outbox.append('sale', {})
+    assert outbox.lag()['pending'] == 2
+
+
+def test_full_outbox_drops_events(outbox, sink, mocker, caplog):
+    outbox.max_pending = 1
+    outbox.append('sale', {'transaction_id': 'a'})
+    outbox.append('sale', {'transaction_id': 'b'})
+    mocker.patch.object(sink, 'publish', side_effect=SinkError('Sink is down'))
+
+    outbox._process()
+    outbox._process()
+
+    assert outbox.full
+    assert outbox.append('sale', {'transaction_id': 'c'}) is None
+    assert outbox.stats['dropped'] == 1
+    assert outbox.lag()['pending'] == 2
+    assert [message.startswith('Outbox is full:') for message in caplog.messages].count(True) == 1
+    assert caplog.messages[-1].startswith('Outbox is full, dropped event')
+
+    mocker.stopall()
+    outbox._get_connection().execute('UPDATE outbox SET available_at = 0')
+    outbox._process()
+
+    assert not outbox.full
+    assert caplog.messages[-1] == 'Outbox is drained: 0 events pending'
+    assert outbox.append('sale', {'transaction_id': 'd'}) is not None
+
+
+def test_append_failure_is_not_raised(outbox, mocker, caplog):
+    connection_mock = mocker.patch.object(outbox, '_get_connection')
+    connection_mock.return_value.execute.side_effect = sqlite3.OperationalError
+
+    assert outbox.append('sale', {'transaction_id': 'a'}) is None
+    assert outbox.stats['append_failed'] == 1
+    assert caplog.records[-1].getMessage().startswith('Could not store event in outbox')
+
+
+def test_background_publisher(tmp_path, sink):
+    outbox = Outbox(str(tmp_path / 'outbox.sqlite3'), sinks=[sink], batch_size=2, interval=60)
+    outbox.append('sale', {'transaction_id': 'a'})
+    outbox.append('sale', {'transaction_id': 'b'})  # full batch wakes publisher
+
+    for _ in range(100):
+        if sink.queue.qsize() == 2:
+            break
+        time.sleep(0.01)
+
+    assert [event['transaction_id'] for event in _drain(sink)] == ['a', 'b']
@@ -1,9 +1,15 @@
 from decimal import Decimal
 
 import pytest
+from django.core.exceptions import ImproperlyConfigured
 
-from payments.gateways.base import GatewayError, SaleResult
-from payments.service import PaymentService, PaymentServiceError
+from payments.credentials import Credentials
+from payments.events.sinks import QueueSink
+from payments.gateways.base import CaptureResult, GatewayError, SaleResult
+from payments.gateways.braintree import BraintreeGateway
+from payments.service import (
+    PaymentService, PaymentServiceError, build_outbox, build_shadow,
+)
 
 
 @pytest.fixture
@@ -21,7 +27,7 @@ def test_tokenize_properly_delegated(make_random_str, gateway_mock):
     returned_value = PaymentService.tokenize(card_number, expiry_date)
 
     assert returned_value == token
-    tokenize_card_mock.assert_called_once_with(card_number, expiry_date)
+    tokenize_card_mock.assert_called_once_with(card_number, expiry_date, merchant_id=None)
 
 
 def test_tokenize_gateway_error(make_random_str, gateway_mock):
@@ -43,7 +49,7 @@ def test_sale_properly_delegated(make_random_str, gateway_mock):
     returned_value = PaymentService.sale(token, transaction_amount)
 
     assert returned_value == SaleResult(sale_id, sale_status)
-    sale_by_token_mock.assert_called_once_with(token, transaction_amount)
+    sale_by_token_mock.assert_called_once_with(token, transaction_amount, merchant_id=None)
 
 
 def test_sale_gateway_error(make_random_str, gateway_mock):
@@ -53,3 +59,148 @@ def test_sale_gateway_error(make_random_str, gateway_mock):
 
     with pytest.raises(PaymentServiceError, match='Error'):
         PaymentService.sale(token, transaction_amount)
+
+
+def test_warm_up_errors_are_not_raised(gateway_mock, caplog):
+    gateway_mock.warm_up.side_effect = ConnectionError
+
+    PaymentService.warm_up()
+
+    assert 'Could not warm up payment gateway' in caplog.messages
+
+
+def test_authorize_schedules_capture(make_random_str, gateway_mock, mocker):
+    schedule_mock = mocker.patch('payments.service.PaymentService.capture_scheduler.schedule')
+    token = make_random_str()
+    gateway_mock.authorize_by_token.return_value = SaleResult('id', 'AUTHORIZED')
+
+    returned_value = PaymentService.authorize(token, Decimal(100))
+
+    assert returned_value == SaleResult('id', 'AUTHORIZED')
+    gateway_mock.authorize_by_token.assert_called_once_with(token, Decimal(100), merchant_id=None)
+    schedule_mock.assert_called_once_with('id', None)
+
+
+def test_authorize_gateway_error(make_random_str, gateway_mock, mocker):
+    schedule_mock = mocker.patch('payments.service.PaymentService.capture_scheduler.schedule')
+    gateway_mock.authorize_by_token.side_effect = GatewayError('Error')
+
+    with pytest.raises(PaymentServiceError, match='Error'):
+        PaymentService.authorize(make_random_str(), Decimal(100))
+
+    assert not schedule_mock.called
+
+
+def test_sale_appends_event(make_random_str, gateway_mock, mocker):
+    outbox_mock = mocker.patch('payments.service.PaymentService.outbox')
+    gateway_mock.sale_by_token.return_value = SaleResult('id', 'SUBMITTED_FOR_SETTLEMENT')
+
+    PaymentService.sale(make_random_str(), Decimal('10.50'), merchant_id='merchant-a')
+
+    outbox_mock.append.assert_called_once_with('sale', {
+        'transaction_id': 'id',
+        'status': 'SUBMITTED_FOR_SETTLEMENT',
+        'amount': '10.50',
+        'merchant_id': 'merchant-a',
+    })
+
+
+def test_authorize_appends_event(make_random_str, gateway_mock, mocker):
+    mocker.patch('payments.service.PaymentService.capture_scheduler.schedule')
+    outbox_mock = mocker.patch('payments.service.PaymentService.outbox')
+    gateway_mock.authorize_by_token.return_value = SaleResult('id', 'AUTHORIZED')
+
+    PaymentService.authorize(make_random_str(), Decimal('10.50'))
+
+    outbox_mock.append.assert_called_once_with('authorize', {
+        'transaction_id': 'id',
+        'status': 'AUTHORIZED',
+        'amount': '10.50',
+        'merchant_id': None,
+    })
+
+
+def test_capture_appends_events_of_captured(gateway_mock, mocker):
+    outbox_mock = mocker.patch('payments.service.PaymentService.outbox')
+    gateway_mock.capture_transactions.return_value = [
+        CaptureResult('a', 'SUBMITTED_FOR_SETTLEMENT', None),
+        CaptureResult('b', None, 'Cannot capture'),
+    ]
+
+    PaymentService.capture(['a', 'b'], merchant_id='merchant-a')
+
+    outbox_mock.append.assert_called_once_with('capture', {
+        'transaction_id': 'a',
+        'status': 'SUBMITTED_FOR_SETTLEMENT',
+        'merchant_id': 'merchant-a',
+    })
+
+
+def test_build_outbox(settings, tmp_path):
+    settings.OUTBOX_PATH = str(tmp_path / 'outbox.sqlite3')
+    settings.OUTBOX_SINKS = ['queue://']
+    assert isinstance(build_outbox().sinks[0], QueueSink)
+
+    settings.OUTBOX_SINKS = []
+    with pytest.raises(ImproperlyConfigured, match='OUTBOX_SINKS must be set'):
+        build_outbox()
+
+
+@pytest.mark.parametrize('shadow_settings, message', [
+    ({'SHADOW_API_KEY': 'sandbox-key'}, 'SHADOW_API_URL and SHADOW_API_KEY'),
+    ({'SHADOW_API_URL': 'https://sandbox.example.com'}, 'SHADOW_API_URL and SHADOW_API_KEY'),
+    (
+        {'SHADOW_API_URL': 'https://production.example.com/', 'SHADOW_API_KEY': 'sandbox-key'},
+        'SHADOW_API_URL must differ from BRAINTREE_API_URL',
+    ),
+    (
+        {'SHADOW_API_URL': 'https://sandbox.example.com', 'SHADOW_API_KEY': 'sandbox-key',
+         'SHADOW_TRANSPORT': 'http3'},
+        'SHADOW_TRANSPORT must be one of',
+    ),
+])
+def test_build_shadow_improperly_configured(shadow_settings, message, settings):
+    settings.SHADOW_SAMPLE_RATE = 0.1
+    settings.BRAINTREE_API_URL = 'https://production.example.com'
+    for name, value in shadow_settings.items():
+        setattr(settings, name, value)
+
+    with pytest.raises(ImproperlyConfigured, match=message):
+        build_shadow()
+
+
+def test_build_shadow(settings):
+    settings.SHADOW_SAMPLE_RATE = 0.1
+    settings.BRAINTREE_API_URL = 'https://production.example.com'
+    settings.SHADOW_API_URL = 'https://sandbox.example.com'
+    settings.SHADOW_API_KEY = 'sandbox-key'
+    settings.SHADOW_TRANSPORT = 'http2'
+
+    candidate = build_shadow().candidate
+
+    assert isinstance(candidate, BraintreeGateway)
+    assert candidate.default_credentials == Credentials('sandbox-key', 'https://sandbox.example.com')
+    assert candidate.transport == 'http2'
+
+
+def test_tokenize_mirrored_to_shadow(make_random_str, gateway_mock, mocker):
+    shadow_mock = mocker.patch('payments.service.PaymentService.shadow')
+    card_number = make_random_str(16, digits=True)
+    gateway_mock.tokenize_card.side_effect = ['token', GatewayError('Declined')]
+
+    PaymentService.tokenize(card_number, '12/2020', merchant_id='merchant-a')
+    with pytest.raises(PaymentServiceError):
+        PaymentService.tokenize(card_number, '12/2020')
+
+    (first_args, _), (second_args, _) = shadow_mock.mirror.call_args_list
+    assert first_args[:2] == second_args[:2] == (card_number, '12/2020')
+    assert first_args[3] == 'ok'
+    assert second_args[3] == 'error: Declined'
+    assert first_args[2] >= 0
+
+
+def test_capture_gateway_error(gateway_mock):
+    gateway_mock.capture_transactions.side_effect = GatewayError('Connection issues')
+
+    with pytest.raises(PaymentServiceError, match='Connection issues'):
+        PaymentService.capture(['a', 'b'])
@@ -0,0 +1,67 @@
+from decimal import Decimal
+
+import pytest
+
+from payments.gateways.base import GatewayError
+from payments.gateways.recording import record_exchange
+from payments.gateways.replay import ReplayGateway
+
+
+TOKENIZE_QUERY = 'mutation tokenizeCreditCard($input: TokenizeCreditCardInput!) {}'
+CHARGE_QUERY = 'mutation chargePaymentMethod($input: ChargePaymentMethodInput!) {}'
+
+
+@pytest.fixture
+def records_path(tmp_path):
+    return str(tmp_path / 'records.jsonl')
+
+
+@pytest.fixture
+def sleep_mock(mocker):
+    return mocker.patch('payments.gateways.replay.time.sleep')
+
+
+def test_replay_serves_recorded_responses_in_order(records_path, sleep_mock, make_random_str):
+    tokens = [make_random_str() for _ in range(2)]
+    for token in tokens:
+        record_exchange(
+            records_path, TOKENIZE_QUERY, {}, elapsed=0.2, status_code=200,
+            response_data={'data': {'tokenizeCreditCard': {'paymentMethod': {'id': token}}}},
+        )
+
+    gateway = ReplayGateway(records_path, latency_scale=0.5)
+    served = [gateway.tokenize_card('4111111111111111', '12/2020') for _ in range(3)]
+
+    assert served == [tokens[0], tokens[1], tokens[0]]
+    sleep_mock.assert_called_with(pytest.approx(0.1))
+
+
+def test_replay_sale(records_path, sleep_mock, make_random_str):
+    transaction_id = make_random_str()
+    record_exchange(
+        records_path, CHARGE_QUERY, {}, elapsed=0.1, status_code=200,
+        response_data={'data': {'chargePaymentMethod': {
+            'transaction': {'id': transaction_id, 'status': 'SUBMITTED_FOR_SETTLEMENT'},
+        }}},
+    )
+
+    result = ReplayGateway(records_path).sale_by_token(make_random_str(), Decimal(100))
+
+    assert result.id == transaction_id
+    assert result.status == 'SUBMITTED_FOR_SETTLEMENT'
+
+
+def test_replay_without_latency(records_path, sleep_mock):
+    record_exchange(records_path, TOKENIZE_QUERY, {}, elapsed=0.1, error='Connection issues')
+
+    with pytest.raises(GatewayError, match='Connection issues'):
+        ReplayGateway(records_path, latency_scale=0).tokenize_card('4111111111111111', '12/2020')
+
+    assert not sleep_mock.called
+
+
+def test_replay_missing_operation(records_path, sleep_mock):
+    record_exchange(records_path, TOKENIZE_QUERY, {}, elapsed=0.1, error='Connection issues')
+
+    with pytest.raises(GatewayError, match='No recorded responses for chargePaymentMethod'):
+        ReplayGateway(records_path).sale_by_token('token', Decimal(100))
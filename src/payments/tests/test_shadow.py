@@ -0,0 +1,86 @@
+import threading
+import time
+
+import pytest
+
+from payments.gateways.base import BaseGateway, GatewayError
+from payments.shadow import LatencyHistogram, ShadowTraffic, get_outcome
+
+
+@pytest.fixture
+def candidate_mock(mocker):
+    return mocker.Mock(spec=BaseGateway)
+
+
+def test_latency_histogram_percentiles():
+    histogram = LatencyHistogram(min_latency=0.001, max_latency=10, growth=1.05)
+    assert histogram.percentile(50) is None
+
+    for latency in [0.010] * 90 + [0.200] * 9 + [100]:
+        histogram.add(latency)
+
+    assert histogram.percentile(50) == pytest.approx(0.010, rel=0.05)
+    assert histogram.percentile(99) == pytest.approx(0.200, rel=0.05)
+    assert histogram.percentile(100) == pytest.approx(10, rel=0.05)  # clamped
+    assert histogram.summary()['p90'] == pytest.approx(10, rel=0.05)
+
+
+def test_compare_records_latencies_and_diffs(candidate_mock):
+    shadow = ShadowTraffic(candidate_mock, sample_rate=1, max_diffs=1)
+    candidate_mock.tokenize_card.side_effect = [
+        'token', GatewayError('Unsupported version'), GatewayError('Timeout'), 'token',
+    ]
+
+    shadow.compare('4111111111111111', '12/2020', 0.1, 'ok')
+    shadow.compare('4111111111111111', '12/2020', 0.1, 'ok')
+    shadow.compare('4111111111111111', '12/2020', 0.1, 'ok')
+    shadow.compare('4111111111111111', '12/2020', 0.1, 'error: Declined')
+
+    candidate_mock.tokenize_card.assert_called_with('4111111111111111', '12/2020')
+    assert shadow.stats == {'mirrored': 4, 'matched': 1, 'differed': 3}
+    report = shadow.report()
+    assert report['primary']['p50'] == pytest.approx(100, rel=0.05)
+    assert report['candidate']['p50'] is not None
+    # only the first distinct difference fits into `max_diffs`
+    assert report['diffs'] == [
+        {'primary': 'ok', 'candidate': 'error: Unsupported version', 'count': 1},
+    ]
+
+
+def test_mirror_sample_rate(candidate_mock, mocker):
+    mocker.patch('payments.shadow.random.random', side_effect=[0.5, 0.05])
+    shadow = ShadowTraffic(candidate_mock, sample_rate=0.1)
+    mocker.patch.object(shadow, 'start')
+
+    assert not shadow.mirror('4111111111111111', '12/2020', 0.1, 'ok')
+    assert shadow.mirror('4111111111111111', '12/2020', 0.1, 'ok')
+
+
+def test_mirror_limits(candidate_mock, mocker):
+    shadow = ShadowTraffic(candidate_mock, sample_rate=1, max_rate=3, queue_size=2)
+    mocker.patch.object(shadow, 'start')
+
+    mirrored = [shadow.mirror('4111111111111111', '12/2020', 0.1, 'ok') for _ in range(5)]
+
+    # third request doesn't fit into queue, the others are over max rate
+    assert mirrored == [True, True, False, False, False]
+    assert shadow.stats == {'dropped': 1}
+
+
+def test_mirror_in_background(candidate_mock):
+    compared = threading.Event()
+    candidate_mock.tokenize_card.side_effect = lambda *args: compared.set() or 'token'
+    shadow = ShadowTraffic(candidate_mock, sample_rate=1)
+
+    shadow.mirror('4111111111111111', '12/2020', 0.1, 'ok')
+
+    assert compared.wait(timeout=5)
+    deadline = time.monotonic() + 5
+    while not shadow.stats['matched'] and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert shadow.stats['matched'] == 1
+
+
+def test_get_outcome():
+    assert get_outcome() == 'ok'
+    assert get_outcome(GatewayError('Declined')) == 'error: Declined'
@@ -0,0 +1,84 @@
+import json
+
+import pytest
+import requests
+
+from payments.events.sinks import FileSink, HTTPSink, PermanentSinkError, QueueSink, SinkError, build_sink
+
+
+def test_file_sink(tmp_path):
+    path = tmp_path / 'events.log'
+
+    FileSink(str(path)).publish([{'event_id': 'a'}, {'event_id': 'b'}])
+
+    assert [json.loads(line) for line in path.read_text().splitlines()] == [
+        {'event_id': 'a'}, {'event_id': 'b'},
+    ]
+
+
+def test_file_sink_error(tmp_path):
+    with pytest.raises(SinkError):
+        FileSink(str(tmp_path / 'missing' / 'events.log')).publish([{'event_id': 'a'}])
+
+
+def test_http_sink(mocker):
+    post_mock = mocker.patch('payments.events.sinks.requests.Session.post')
+    sink = HTTPSink('https://events.example.com', timeout=3)
+
+    sink.publish([{'event_id': 'a'}])
+
+    post_mock.assert_called_once_with(
+        'https://events.example.com', json=[{'event_id': 'a'}], timeout=3,
+    )
+
+
+@pytest.mark.parametrize('side_effect,status_code', [
+    (requests.ConnectionError, 200), (None, 500), (None, 429), (None, 408),
+])
+def test_http_sink_errors(side_effect, status_code, mocker):
+    post_mock = mocker.patch('payments.events.sinks.requests.Session.post', side_effect=side_effect)
+    post_mock.return_value.status_code = status_code
+    post_mock.return_value.ok = status_code == 200
+
+    with pytest.raises(SinkError, match='Could not send events') as exception_info:
+        HTTPSink('https://events.example.com').publish([{'event_id': 'a'}])
+
+    assert not isinstance(exception_info.value, PermanentSinkError)
+
+
+def test_http_sink_rejected(mocker):
+    post_mock = mocker.patch('payments.events.sinks.requests.Session.post')
+    post_mock.return_value.status_code = 400
+    post_mock.return_value.ok = False
+
+    with pytest.raises(PermanentSinkError, match='Events were rejected'):
+        HTTPSink('https://events.example.com').publish([{'event_id': 'a'}])
+
+
+def test_queue_sink_full():
+    sink = QueueSink(maxsize=2)
+    sink.publish([{'event_id': 'a'}])
+
+    with pytest.raises(SinkError, match='Queue is full'):
+        sink.publish([{'event_id': 'b'}, {'event_id': 'c'}])
+
+    assert sink.queue.qsize() == 1
+
+
+def test_queue_sink_rejects_batch_larger_than_queue():
+    with pytest.raises(PermanentSinkError):
+        QueueSink(maxsize=1).publish([{'event_id': 'a'}, {'event_id': 'b'}])
+
+
+@pytest.mark.parametrize('url,sink_class', [
+    ('file:///var/log/events.log', FileSink),
+    ('https://events.example.com/batch', HTTPSink),
+    ('queue://?maxsize=5', QueueSink),
+])
+def test_build_sink(url, sink_class):
+    assert isinstance(build_sink(url), sink_class)
+
+
+def test_build_sink_unsupported():
+    with pytest.raises(ValueError, match='Unsupported events sink'):
+        build_sink('kafka://localhost')
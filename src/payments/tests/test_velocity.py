@@ -0,0 +1,94 @@
+import os
+
+import pytest
+
+from payments.velocity import (
+    RingCounters, SharedRingCounters, VelocityFilter, VelocityLimitExceeded,
+    fingerprint_card, get_velocity_filter,
+)
+
+
+def test_ring_counters_sliding_window():
+    counters = RingCounters(window=60, buckets=6)
+
+    assert counters.add('a', now=0) == 1
+    assert counters.add('a', now=15) == 2
+    assert counters.add('a', now=59) == 3
+    assert counters.add('b', now=59) == 1
+    # bucket of the first attempt has left the window
+    assert counters.add('a', now=61) == 3
+    assert counters.add('a', now=200) == 1
+
+
+def test_ring_counters_evict_least_recently_used():
+    counters = RingCounters(max_keys=2)
+    counters.add('a', now=0)
+    counters.add('b', now=0)
+    counters.add('a', now=1)
+
+    counters.add('c', now=2)
+
+    assert len(counters) == 2
+    assert counters.add('a', now=3) == 3
+    assert counters.add('b', now=3) == 1  # evicted
+
+
+def test_shared_ring_counters_sliding_window(tmp_path):
+    counters = SharedRingCounters(str(tmp_path / 'velocity'), window=60, buckets=6, width=64)
+
+    assert counters.add('a', now=0) == 1
+    assert counters.add('a', now=15) == 2
+    assert counters.add('b', now=15) == 1
+    assert counters.add('a', now=61) == 2
+    assert counters.add('a', now=200) == 1
+
+
+def test_shared_ring_counters_shared_between_processes(tmp_path):
+    path = str(tmp_path / 'velocity')
+    counters = SharedRingCounters(path, width=64)
+    counters.add('a', now=0)
+
+    pid = os.fork()
+    if pid == 0:  # child counts with its own mapping of the same file
+        counters.add('a', now=1)
+        os._exit(0)
+    os.waitpid(pid, 0)
+
+    assert SharedRingCounters(path, width=64).add('a', now=2) == 3
+
+
+def test_velocity_filter_rejects_over_limit():
+    velocity_filter = VelocityFilter(RingCounters(), limits={'card': 2, 'ip': 3}, window=60)
+
+    velocity_filter.check(card='x', ip='10.0.0.1')
+    velocity_filter.check(card='x', ip='10.0.0.1', token='t')
+    with pytest.raises(VelocityLimitExceeded) as exception_info:
+        velocity_filter.check(card='x', ip='10.0.0.1')
+
+    assert exception_info.value.dimension == 'card'
+    assert exception_info.value.retry_after == 60
+    # rejected attempt is counted as well
+    with pytest.raises(VelocityLimitExceeded, match='ip'):
+        velocity_filter.check(card='y', ip='10.0.0.1')
+    velocity_filter.check(card='y', ip=None)
+    assert velocity_filter.stats == {'card': 1, 'ip': 1}
+
+
+def test_fingerprint_card():
+    fingerprint = fingerprint_card('4111111111111111')
+
+    assert len(fingerprint) == 16
+    assert '4111' not in fingerprint
+    assert fingerprint == fingerprint_card('4111111111111111')
+    assert fingerprint != fingerprint_card('4111111111111112')
+
+
+def test_get_velocity_filter(settings, tmp_path):
+    settings.VELOCITY_LIMITS = {}
+    assert get_velocity_filter() is None
+
+    settings.VELOCITY_LIMITS = {'card': 5}
+    assert isinstance(get_velocity_filter().counters, RingCounters)
+
+    settings.VELOCITY_SHARED_PATH = str(tmp_path / 'velocity')
+    assert isinstance(get_velocity_filter().counters, SharedRingCounters)
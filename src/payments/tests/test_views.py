@@ -1,3 +1,5 @@
+from decimal import Decimal
+
 import pytest
 
 from payments.gateways.base import SaleResult
@@ -61,3 +63,78 @@ def test_sale_view_payment_service_error(api, make_random_str, payment_service_m
 
     assert response.status_code == 400
     assert response.data == {'error': 'Something wrong'}
+
+
+def test_authorize_view_ok(api, make_random_str, payment_service_mock):
+    payment_service_mock.authorize.return_value = SaleResult('id', 'AUTHORIZED')
+    data = {
+        'token': make_random_str(),
+        'transaction_amount': '100',
+    }
+
+    response = api.post('/authorize', data=data, format='json')
+
+    assert response.status_code == 200, response.rendered_content
+    assert response.data == {'id': 'id', 'status': 'AUTHORIZED'}
+
+
+def test_sale_view_on_behalf_of_merchant(api, make_random_str, payment_service_mock,
+                                         merchant_credential_store):
+    payment_service_mock.sale.return_value = SaleResult('id', 'SUBMITTED_FOR_SETTLEMENT')
+    token = make_random_str()
+
+    response = api.post(
+        '/sale', data={'token': token, 'transaction_amount': '100'}, format='json',
+        HTTP_X_MERCHANT_ID='merchant-a', HTTP_AUTHORIZATION='Bearer client-key-a',
+    )
+
+    assert response.status_code == 200, response.rendered_content
+    payment_service_mock.sale.assert_called_once_with(
+        token=token, transaction_amount=Decimal('100'), merchant_id='merchant-a',
+    )
+
+
+@pytest.mark.parametrize('authorization', [None, 'Bearer client-key-b', 'Basic client-key-a'])
+def test_sale_view_merchant_not_authenticated(authorization, api, make_random_str, payment_service_mock,
+                                              merchant_credential_store):
+    headers = {'HTTP_AUTHORIZATION': authorization} if authorization else {}
+
+    response = api.post(
+        '/sale', data={'token': make_random_str(), 'transaction_amount': '100'}, format='json',
+        HTTP_X_MERCHANT_ID='merchant-a', **headers,
+    )
+
+    assert response.status_code == 401
+    assert response['WWW-Authenticate'] == 'Bearer'
+    assert response.data == {'detail': 'Valid client key of merchant was not provided.'}
+    assert not payment_service_mock.sale.called
+
+
+def test_tokenize_view_velocity_limit(api, settings, payment_service_mock):
+    settings.VELOCITY_LIMITS = {'card': 1}
+    payment_service_mock.tokenize.return_value = 'token'
+    data = {'card_number': '4111111111111111', 'expiry_date': '12/2020'}
+
+    assert api.post('/tokenise', data=data, format='json').status_code == 200
+    response = api.post('/tokenise', data=data, format='json')
+
+    assert response.status_code == 429
+    assert response['Retry-After'] == str(settings.VELOCITY_WINDOW)
+    assert payment_service_mock.tokenize.call_count == 1
+
+
+def test_sale_view_velocity_limit_by_client_ip(api, settings, make_random_str, payment_service_mock):
+    settings.VELOCITY_LIMITS = {'ip': 1}
+    payment_service_mock.sale.return_value = SaleResult('id', 'SUBMITTED_FOR_SETTLEMENT')
+
+    def sale(forwarded_for):
+        return api.post(
+            '/sale', data={'token': make_random_str(), 'transaction_amount': '100'},
+            format='json', HTTP_X_FORWARDED_FOR=forwarded_for,
+        )
+
+    assert sale('10.0.0.1').status_code == 200
+    assert sale('10.0.0.2').status_code == 200
+    # addresses sent by client before the one added by proxy are ignored
+    assert sale('10.0.0.3, 10.0.0.1').status_code == 429
+    assert payment_service_mock.sale.call_count == 2
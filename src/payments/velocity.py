@@ -0,0 +1,257 @@
+"""
+Velocity limits against card testing: attempts are counted per card, token
+and client IP over sliding window, and rejected once a limit is exceeded,
+before anything is sent to PSP.
+"""
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import threading
+import time
+from array import array
+from collections import Counter, OrderedDict
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.signals import setting_changed
+
+
+logger = logging.getLogger(__name__)
+
+
+class VelocityLimitExceeded(RuntimeError):
+    """
+    Too many attempts were made with the same card, token or client.
+    """
+
+    def __init__(self, dimension: str, retry_after: int):
+        super().__init__(f'Velocity limit exceeded for {dimension}')
+        self.dimension = dimension
+        self.retry_after = retry_after
+
+
+def fingerprint_card(card_number: str) -> str:
+    """
+    Keyed hash of card number, so card numbers are not kept in memory.
+    """
+    return hashlib.blake2b(
+        card_number.encode(), key=settings.SECRET_KEY.encode()[:64], digest_size=8,
+    ).hexdigest()
+
+
+class RingCounters:
+    """
+    Sliding window counters of worker process. Window of `window` seconds
+    is split into `buckets` buckets and every key keeps counts of its
+    buckets in a ring (array of 16-bit counts), so count of key is the sum
+    of counts over the last `buckets` buckets.
+    Memory is bounded by `max_keys`: least recently counted keys are evicted.
+    """
+
+    def __init__(self, window: float = 60, buckets: int = 12, max_keys: int = 100000):
+        self.buckets = buckets
+        self.bucket_width = window / buckets
+        self.max_keys = max_keys
+        self._rings = OrderedDict()  # key -> [bucket number, counts]
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._rings)
+
+    def add(self, key: str, now: Optional[float] = None) -> int:
+        """
+        Count attempt for key.
+        :return: number of attempts within window including this one
+        """
+        bucket = int((time.time() if now is None else now) / self.bucket_width)
+        with self._lock:
+            ring = self._rings.get(key)
+            if ring is None:
+                if len(self._rings) >= self.max_keys:
+                    self._rings.popitem(last=False)
+                ring = self._rings[key] = [bucket, array('H', bytes(2 * self.buckets))]
+            else:
+                self._rings.move_to_end(key)
+                self._advance(ring, bucket)
+
+            counts = ring[1]
+            index = bucket % self.buckets
+            if counts[index] < 0xFFFF:
+                counts[index] += 1
+            return sum(counts)
+
+    def _advance(self, ring: list, bucket: int) -> None:
+        """
+        Reset counts of buckets that have passed since the last attempt.
+        """
+        last_bucket, counts = ring
+        if bucket - last_bucket >= self.buckets:
+            counts[:] = array('H', bytes(2 * self.buckets))
+        else:
+            for passed in range(last_bucket + 1, bucket + 1):
+                counts[passed % self.buckets] = 0
+        ring[0] = max(bucket, last_bucket)
+
+
+class SharedRingCounters:
+    """
+    Sliding window counters shared by all worker processes via memory
+    mapped file (e.g. on `/dev/shm`). Every bucket of the window holds
+    a count-min sketch (`depth` rows of `width` 32-bit counters) instead
+    of per key counts, so memory is fixed regardless of number of keys,
+    and counts may only be overestimated (when keys collide in all rows).
+    Updates are serialized by lock on the file.
+    """
+
+    def __init__(self, path: str, window: float = 60, buckets: int = 12,
+                 width: int = 16384, depth: int = 4):
+        self.path = path
+        self.buckets = buckets
+        self.bucket_width = window / buckets
+        self.width = width
+        self.depth = depth
+        self._bucket_size = depth * width  # counters
+        self._size = 8 * buckets + 4 * buckets * self._bucket_size
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def add(self, key: str, now: Optional[float] = None) -> int:
+        """
+        Count attempt for key.
+        :return: estimated number of attempts within window including this one
+        """
+        bucket = int((time.time() if now is None else now) / self.bucket_width)
+        digest = hashlib.blake2b(key.encode(), digest_size=4 * self.depth).digest()
+        columns = [
+            row * self.width + int.from_bytes(digest[4 * row:4 * row + 4], 'little') % self.width
+            for row in range(self.depth)
+        ]
+
+        with self._lock:
+            if self._pid != os.getpid():
+                self._open()
+
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                return self._add(bucket, columns)
+            finally:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+
+    def _add(self, bucket: int, columns: list) -> int:
+        epochs, counters = self._epochs, self._counters
+        index = bucket % self.buckets
+        if epochs[index] != bucket:
+            start = index * self._bucket_size
+            counters[start:start + self._bucket_size] = self._empty_bucket
+            epochs[index] = bucket
+
+        offset = index * self._bucket_size
+        for column in columns:
+            if counters[offset + column] < 0xFFFFFFFF:
+                counters[offset + column] += 1
+
+        live_offsets = [
+            i * self._bucket_size for i in range(self.buckets)
+            if bucket - self.buckets < epochs[i] <= bucket
+        ]
+        return min(
+            sum(counters[offset + column] for offset in live_offsets)
+            for column in columns
+        )
+
+    def _open(self) -> None:
+        """
+        Map the file (creating it if needed) in current process. File lock
+        is held by open file description, so every process opens file
+        by itself.
+        """
+        file = open(self.path, 'a+b')
+        if os.fstat(file.fileno()).st_size < self._size:
+            file.truncate(self._size)
+
+        memory = memoryview(mmap.mmap(file.fileno(), self._size))
+        self._file = file
+        self._epochs = memory[:8 * self.buckets].cast('q')
+        self._counters = memory[8 * self.buckets:].cast('I')
+        self._empty_bucket = array('I', bytes(4 * self._bucket_size))
+        self._pid = os.getpid()
+
+
+class VelocityFilter:
+    """
+    Counts attempts per dimension value (card fingerprint, token, client IP)
+    and rejects attempt once count of any dimension exceeds its limit.
+    Rejected attempts are counted as well, so clients that keep trying stay
+    blocked.
+    """
+
+    def __init__(self, counters, limits: Dict[str, int], window: int):
+        """
+        :param counters: `RingCounters` or `SharedRingCounters`
+        :param limits: max attempts within window per dimension; dimensions
+        without limit are not counted
+        """
+        self.counters = counters
+        self.limits = limits
+        self.window = window
+        self.stats = Counter()  # rejected attempts per dimension
+
+    def check(self, **values: Optional[str]) -> None:
+        """
+        Count attempt with dimension values (e.g. `card=<fingerprint>`,
+        None values are skipped).
+        :raise VelocityLimitExceeded: if any limit is exceeded
+        """
+        exceeded = None
+        for dimension, value in values.items():
+            limit = self.limits.get(dimension)
+            if not limit or value is None:
+                continue
+            if self.counters.add(f'{dimension}:{value}') > limit and exceeded is None:
+                exceeded = dimension
+
+        if exceeded is not None:
+            self.stats[exceeded] += 1
+            logger.info('Rejected attempt over velocity limit for %s', exceeded)
+            raise VelocityLimitExceeded(exceeded, self.window)
+
+
+_velocity_filter = None
+
+
+def get_velocity_filter() -> Optional[VelocityFilter]:
+    """
+    :return: velocity filter configured in settings or None if there are
+    no limits
+    """
+    global _velocity_filter
+    if not settings.VELOCITY_LIMITS:
+        return None
+
+    if _velocity_filter is None:
+        if settings.VELOCITY_SHARED_PATH:
+            counters = SharedRingCounters(
+                settings.VELOCITY_SHARED_PATH, window=settings.VELOCITY_WINDOW,
+                buckets=settings.VELOCITY_BUCKETS,
+            )
+        else:
+            counters = RingCounters(
+                window=settings.VELOCITY_WINDOW, buckets=settings.VELOCITY_BUCKETS,
+                max_keys=settings.VELOCITY_MAX_KEYS,
+            )
+        _velocity_filter = VelocityFilter(
+            counters, settings.VELOCITY_LIMITS, settings.VELOCITY_WINDOW,
+        )
+
+    return _velocity_filter
+
+
+def _reset_velocity_filter(setting: str, **kwargs) -> None:
+    global _velocity_filter
+    if setting.startswith('VELOCITY_'):
+        _velocity_filter = None
+
+
+setting_changed.connect(_reset_velocity_filter)
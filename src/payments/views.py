@@ -1,5 +1,7 @@
 from app.views import ExecutePOSTView
-from payments.serializers import TokenizeSerializer, SaleSerializer
+from payments.serializers import (
+    AuthorizeSerializer, SaleSerializer, TokenizeSerializer,
+)
 
 
 class TokenizeView(ExecutePOSTView):
@@ -15,3 +17,11 @@ class SaleView(ExecutePOSTView):
     API view that request sale on PSP for token provided in request body.
     """
     serializer_class = SaleSerializer
+
+
+class AuthorizeView(ExecutePOSTView):
+    """
+    API view that request authorization on PSP for token provided in request
+    body. Authorized amount is captured later in background.
+    """
+    serializer_class = AuthorizeSerializer
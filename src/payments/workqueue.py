@@ -0,0 +1,155 @@
+"""
+Base of durable queues processed in background: rows of SQLite table
+shared by all worker processes and claimed by them in leased batches.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from typing import List
+
+
+logger = logging.getLogger(__name__)
+
+
+class LeasedQueue:
+    """
+    Rows are stored in SQLite database (in WAL mode, shared by all worker
+    processes) by a single insert, which is synced to disk only if `fsync`
+    is on (otherwise rows survive crash of process, but not of OS).
+    Database is created on the first use.
+
+    Rows are claimed in batches (see `_claim`) and hidden from other
+    workers for `lease` seconds, so batches of dead workers are processed
+    again: processing is at-least-once.
+
+    Background thread of every process runs `_process` every `interval`
+    seconds (`backoff` after consecutive failures, counted by subclasses
+    in `_failures`) or as soon as `batch_size` rows are added.
+    Subclasses define table (`TABLE` and `SCHEMA_SQL` script creating it)
+    and `_process`.
+    """
+    SCHEMA_SQL = None
+    TABLE = None
+    THREAD_NAME = None
+
+    def __init__(self, path: str, batch_size: int, interval: float, lease: float,
+                 max_backoff: float = 60, fsync: bool = False):
+        """
+        :param path: path to database (created on first use)
+        :param interval: seconds between runs; if 0, there's no background
+        thread and rows should be processed explicitly
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.interval = interval
+        self.lease = lease
+        self.max_backoff = max_backoff
+        self.fsync = fsync
+        self._failures = 0  # consecutive failed runs
+        self._local = threading.local()
+        self._added_since_run = 0
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    @property
+    def backoff(self) -> float:
+        """
+        Seconds before the next run after failed ones.
+        """
+        if not self._failures:
+            return self.interval
+
+        return self._get_backoff(self._failures)
+
+    def start(self) -> None:
+        """
+        Start background thread (once), so it's started in the worker
+        process rather than in the one it's forked from.
+        """
+        if self._thread is not None or not self.interval:
+            return
+
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name=self.THREAD_NAME, daemon=True,
+                )
+                self._thread.start()
+
+    def _added(self) -> None:
+        """
+        Wake background thread up once a full batch is added since its
+        last run (starting it if needed).
+        """
+        if not self.interval:
+            return
+
+        self.start()
+        with self._thread_lock:
+            self._added_since_run += 1
+            if self._added_since_run >= self.batch_size:
+                self._wakeup.set()
+
+    def _claim(self, sql: str, params=()) -> list:
+        """
+        Select rows to process and hide them from other workers for `lease`
+        seconds, atomically.
+        :param sql: query selecting available rows (`id` first), current
+        time is passed to it as the first parameter (`?1`)
+        :return: selected rows
+        """
+        connection = self._get_connection()
+        now = time.time()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            rows = connection.execute(sql, (now, *params)).fetchall()
+            if rows:
+                self._execute_for_ids(
+                    f'UPDATE {self.TABLE} SET available_at = ? WHERE id IN ({{}})',
+                    [row[0] for row in rows], now + self.lease,
+                )
+
+        return rows
+
+    def _get_backoff(self, failures: int) -> float:
+        """
+        :return: seconds to wait after `failures` consecutive failures,
+        growing exponentially up to `max_backoff`
+        """
+        return min(self.max_backoff, max(self.interval, 1) * 2 ** (failures - 1))
+
+    def _execute_for_ids(self, sql: str, ids: List[int], *params) -> None:
+        placeholders = ','.join('?' * len(ids))
+        self._get_connection().execute(sql.format(placeholders), (*params, *ids))
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """
+        Connection of current thread (in autocommit mode). Tables are
+        created on the first connection.
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(f'PRAGMA synchronous={"FULL" if self.fsync else "NORMAL"}')
+            connection.executescript(self.SCHEMA_SQL)
+            self._local.connection = connection
+
+        return connection
+
+    def _process(self) -> None:
+        raise NotImplementedError
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self._process()
+            except Exception:
+                logger.exception('Processing of %s failed', self.TABLE)
+
+            self._wakeup.wait(self.backoff)
+            self._wakeup.clear()
+            with self._thread_lock:
+                self._added_since_run = 0